@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Analyse des mesures historiques
+Extraction en colonnes des valeurs skvp_float par produit / OF / période (curseur serveur, lecture par blocs),
+index recommandés et statistiques par clé (moyenne, écart-type, Cpk par rapport à min_configured / max_configured).
+
+Exemples :
+    python analytics.py --product 5 --since 2025-01-01 --indexes
+    python analytics.py --product 5 --of 12345 --key TEST_BF_FREQ_2_AMP_dB --output stats.json
+"""
+
+import argparse
+import json
+import math
+from array import array
+from datetime import datetime
+from typing import Optional
+import mysql.connector
+import configuration  # Custom
+import packed_array  # Custom
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, columns are then kept as array.array
+    np = None
+
+FETCH_SIZE = 10000
+
+# (table, index name, columns) needed by extract_measurements
+RECOMMENDED_INDEXES = [
+    ("device_under_test", "idx_dut_product_date", ("product_id", "date")),
+    ("device_under_test", "idx_dut_of", ("of",)),
+    ("step_name", "idx_step_name_dut", ("device_under_test_id",)),
+    ("skvp_float", "idx_skvp_float_step_key", ("step_name_id", "key")),
+    ("skvp_file", "idx_skvp_file_step_key", ("step_name_id", "key")),
+]
+
+
+def connect(arg: configuration.Arg):
+    """Open a dedicated connection (the analysis must not share the bench connection)."""
+    return mysql.connector.connect(
+        user=arg.user, password=arg.password, host=arg.host, port=int(arg.port), database=arg.database
+    )
+
+
+def missing_indexes(conn):
+    """Return the CREATE INDEX statements of the recommended indexes that do not exist yet."""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT table_name, index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index) "
+        "FROM information_schema.statistics WHERE table_schema = DATABASE() GROUP BY table_name, index_name"
+    )
+    existing = {(table.lower(), tuple(columns.split(","))) for table, _, columns in cursor.fetchall()}
+    cursor.close()
+    statements = []
+    for table, name, columns in RECOMMENDED_INDEXES:
+        # An existing index whose leading columns are the same is enough
+        if any(t == table and cols[: len(columns)] == columns for t, cols in existing):
+            continue
+        statements.append(f"CREATE INDEX {name} ON {table} ({', '.join(f'`{c}`' for c in columns)})")
+    return statements
+
+
+def create_indexes(conn):
+    """Create the missing recommended indexes and return the executed statements."""
+    statements = missing_indexes(conn)
+    cursor = conn.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+    return statements
+
+
+def _new_columns():
+    return {
+        "device_under_test_id": array("q"),
+        "date": [],
+        "value": array("d"),
+        "min_configured": array("d"),
+        "max_configured": array("d"),
+        "valid": array("b"),
+    }
+
+
+def extract_measurements(conn, product_id, of: Optional[str] = None, since: Optional[datetime] = None,
+                         until: Optional[datetime] = None, keys: Optional[list] = None, fetch_size: int = FETCH_SIZE):
+    """Stream the skvp_float values of a product into per-key columns.
+
+    Returns {key: {"device_under_test_id", "date", "value", "min_configured", "max_configured", "valid"}}.
+    Numeric columns are numpy arrays when numpy is installed (built without copy), array.array otherwise.
+    Missing limits are NaN.
+    """
+    query = (
+        "SELECT d.id, d.date, s.`key`, s.val_float, s.min_configured, s.max_configured, s.valid "
+        "FROM device_under_test d "
+        "JOIN step_name sn ON sn.device_under_test_id = d.id "
+        "JOIN skvp_float s ON s.step_name_id = sn.id "
+        "WHERE d.product_id = %s"
+    )
+    params = [product_id]
+    if of is not None:
+        query += " AND d.of = %s"
+        params.append(of)
+    if since is not None:
+        query += " AND d.date >= %s"
+        params.append(since)
+    if until is not None:
+        query += " AND d.date < %s"
+        params.append(until)
+    if keys:
+        query += f" AND s.`key` IN ({', '.join(['%s'] * len(keys))})"
+        params.extend(keys)
+
+    columns = {}
+    nan = math.nan
+    cursor = conn.cursor(buffered=False)  # Unbuffered: rows are read from the server block by block
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for dut_id, date, key, value, min_configured, max_configured, valid in rows:
+                if value is None:
+                    continue
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = _new_columns()
+                column["device_under_test_id"].append(dut_id)
+                column["date"].append(date)
+                column["value"].append(value)
+                column["min_configured"].append(nan if min_configured is None else min_configured)
+                column["max_configured"].append(nan if max_configured is None else max_configured)
+                column["valid"].append(1 if valid else 0)
+    finally:
+        cursor.close()
+
+    if np is not None:
+        for column in columns.values():
+            for name in ("device_under_test_id", "value", "min_configured", "max_configured", "valid"):
+                column[name] = np.frombuffer(column[name], dtype=column[name].typecode)
+    return columns
+
+
+def extract_arrays(conn, product_id, key: str, of: Optional[str] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None, fetch_size: int = 100):
+    """Yield (device_under_test_id, date, values, header) for the numeric arrays saved under key (skvp_file).
+    values is read without copy from the decompressed data (see packed_array.unpack)."""
+    query = (
+        "SELECT d.id, d.date, f.val_file "
+        "FROM device_under_test d "
+        "JOIN step_name sn ON sn.device_under_test_id = d.id "
+        "JOIN skvp_file f ON f.step_name_id = sn.id "
+        "WHERE d.product_id = %s AND f.`key` = %s"
+    )
+    params = [product_id, key]
+    if of is not None:
+        query += " AND d.of = %s"
+        params.append(of)
+    if since is not None:
+        query += " AND d.date >= %s"
+        params.append(since)
+    if until is not None:
+        query += " AND d.date < %s"
+        params.append(until)
+
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for dut_id, date, blob in rows:
+                if blob is not None and packed_array.is_packed(blob):
+                    values, header = packed_array.unpack(blob)
+                    yield dut_id, date, values, header
+    finally:
+        cursor.close()
+
+
+def _last_finite(values):
+    for value in reversed(values):
+        if not math.isnan(value):
+            return float(value)
+    return None
+
+
+def key_statistics(column):
+    """Return count, mean, sigma (sample), min, max, failures, configured limits and Cpk of one key."""
+    values = column["value"]
+    count = len(values)
+    if count == 0:
+        return {"count": 0}
+    if np is not None:
+        mean = float(values.mean())
+        sigma = float(values.std(ddof=1)) if count > 1 else 0.0
+        minimum, maximum = float(values.min()), float(values.max())
+        failures = int(count - column["valid"].sum())
+    else:
+        mean = math.fsum(values) / count
+        sigma = math.sqrt(math.fsum((v - mean) ** 2 for v in values) / (count - 1)) if count > 1 else 0.0
+        minimum, maximum = min(values), max(values)
+        failures = count - sum(column["valid"])
+    # The limits of the most recent measurement are the current specification
+    lsl = _last_finite(column["min_configured"])
+    usl = _last_finite(column["max_configured"])
+    cpk = None
+    if sigma > 0 and (lsl is not None or usl is not None):
+        cpk = min(
+            (usl - mean) / (3 * sigma) if usl is not None else math.inf,
+            (mean - lsl) / (3 * sigma) if lsl is not None else math.inf,
+        )
+    return {
+        "count": count,
+        "mean": mean,
+        "sigma": sigma,
+        "min": minimum,
+        "max": maximum,
+        "failures": failures,
+        "lsl": lsl,
+        "usl": usl,
+        "cpk": cpk,
+    }
+
+
+def statistics(columns):
+    """Return key_statistics for every key of extract_measurements' result."""
+    return {key: key_statistics(column) for key, column in sorted(columns.items())}
+
+
+def main_analytics():
+    arg = configuration.Arg()
+    parser = argparse.ArgumentParser(description="Statistiques des mesures skvp_float par produit / OF / période")
+    parser.add_argument("--product", default=arg.product_list_id, help="product_id des DUT")
+    parser.add_argument("--of", help="Numéro d'OF")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Date de début (incluse), ex. 2025-01-01")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Date de fin (exclue)")
+    parser.add_argument("--key", action="append", dest="keys", help="Clé à extraire (répétable)")
+    parser.add_argument("--indexes", action="store_true", help="Afficher les index manquants")
+    parser.add_argument("--create-indexes", action="store_true", help="Créer les index manquants")
+    parser.add_argument("--output", help="Fichier JSON des statistiques")
+    for name in ("user", "password", "host", "port", "database"):
+        parser.add_argument(f"--{name}", default=getattr(arg, name))
+    args = parser.parse_args()
+    for name in ("user", "password", "host", "port", "database"):
+        setattr(arg, name, getattr(args, name))
+
+    conn = connect(arg)
+    try:
+        if args.create_indexes:
+            for statement in create_indexes(conn):
+                print(f"✅ {statement}")
+        elif args.indexes:
+            for statement in missing_indexes(conn) or ["-- Tous les index recommandés existent."]:
+                print(statement)
+        columns = extract_measurements(conn, args.product, args.of, args.since, args.until, args.keys)
+    finally:
+        conn.close()
+
+    stats = statistics(columns)
+    for key, s in stats.items():
+        cpk = f"{s['cpk']:.2f}" if s.get("cpk") is not None else "-"
+        print(f"{key:<35} n={s['count']:<7} moyenne={s['mean']:<12.6g} sigma={s['sigma']:<12.6g} échecs={s['failures']:<5} Cpk={cpk}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main_analytics()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Banc de test simulé
+Exécute N cycles DUT complets via TestThread, sans interface graphique, contre une base et des instruments simulés,
+et écrit les temps de cycle, le temps par étape, les allers-retours BDD et les échanges série dans un fichier JSON.
+
+Exemples :
+    python benchmark.py --cycles 50 --no-sleep --output bench.json
+    python benchmark.py --cycles 50 --no-sleep --baseline bench.json --tolerance 0.15
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from PyQt6.QtCore import QCoreApplication
+import cancellation  # Custom
+import configuration  # Custom
+import main  # Custom
+import simulation  # Custom
+import spc  # Custom
+import step_order  # Custom
+
+
+def percentile(values, p):
+    """Return the p-th percentile (0-100) of values with linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    """Return the usual distribution figures of a list of durations."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "min": min(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+class SleepRecorder:
+    """Replace time.sleep and the cancellable sleep of config.sleep to measure (and optionally skip) the fixed waits
+    done by the steps."""
+    def __init__(self, skip: bool):
+        self.skip = skip
+        self.total = 0.0
+        self.original = time.sleep
+        self.original_token_sleep = cancellation.CancellationToken.sleep
+
+    def __call__(self, seconds):
+        self.total += seconds
+        if not self.skip:
+            self.original(seconds)
+
+    def token_sleep(self, token, seconds):
+        self.total += seconds
+        if self.skip:
+            token.check()
+        else:
+            self.original_token_sleep(token, seconds)
+
+    def install(self):
+        time.sleep = self
+        recorder = self
+        cancellation.CancellationToken.sleep = lambda token, seconds: recorder.token_sleep(token, seconds)  # type: ignore[method-assign]
+
+    def uninstall(self):
+        time.sleep = self.original
+        cancellation.CancellationToken.sleep = self.original_token_sleep  # type: ignore[method-assign]
+
+
+def run_benchmark(args, benches=None):
+    """Run the simulated cycles and return the result dictionary. benches optionally provides one bench per cycle
+    (e.g. serial_replay.ReplayBench), otherwise a single SimulatedBench is reused."""
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])  # Kept alive for the Qt signals
+
+    config = main.config
+    config.arg.show_all_logs = False
+    config.arg.article = "BENCHMARK"
+    config.arg.of = "BENCHMARK"
+    config.arg.commande = "BENCHMARK"
+    db = simulation.SimulatedDatabase(latency=args.db_latency_ms / 1000.0)
+    simulation.seed_database(db, args.config_json, configuration.CONFIG_JSON_NAME, config.arg.product_list_id, config.arg.operator)
+    config.db = db  # type: ignore[assignment]
+    printer = simulation.SimulatedPrinter()
+    config.printer = printer  # type: ignore[assignment]
+    config.spc = spc.SpcEngine()  # In memory only, the bench SPC state must not learn from simulated values
+    config.step_orderer = step_order.StepOrderer()  # In memory only, learns from the simulated failures of this run
+    config.arg.adaptive_order = args.adaptive_order
+    config.arg.pipelined = args.pipelined
+    config.preparer.connect = lambda: db  # The simulated database is shared with the preparation thread
+    bench = simulation.SimulatedBench(
+        serial_latency=args.serial_latency_ms / 1000.0, fail_rate=args.fail_rate, noise=args.noise, seed=args.seed
+    )
+    if benches:
+        args.cycles = len(benches)
+    if args.trace:
+        # Measures the cost of the tracing layer on the cycle
+        config.tracer.enabled = True
+        config.tracer.instrument(db, "db", "db", ("create", "get_by_id", "get_by_column", "update_by_id"))
+        for instrument in bench.instruments:
+            config.tracer.instrument(instrument, "instrument", instrument.name)
+    if benches:
+        bench = benches[0]
+    elif args.serial_engine:
+        # Each simulated instrument gets its serial_io worker thread, as in register_instrument
+        config.arg.serial_engine = config.serial_io.enabled = True
+        for instrument in bench.instruments:
+            config.serial_io.attach(instrument, instrument.name, ("send_command", "meas", "set_output", "set_voltage", "set_current"))
+        config.alim = bench.alim  # type: ignore[assignment]
+        if args.power_sequencing:
+            # Adds the supply polling to the measured cycle, so it is opt-in as on the bench
+            config.arg.power_sequencing = True
+            config.start_power_sequencer(short_circuit_current=0.45)
+    sleeps = SleepRecorder(skip=args.no_sleep)
+    sleeps.install()
+
+    cycle_times = []
+    step_times = {}
+    log_times = []
+    sleep_times = []
+    db_round_trips = []
+    db_by_call = {}
+    serial = {instrument.name: {"commands": 0, "bytes_out": 0, "bytes_in": 0, "latencies": []} for instrument in bench.instruments}
+    results = {"ok": 0, "nok": 0}
+    verdicts = []
+
+    try:
+        for cycle in range(args.cycles):
+            if benches:
+                bench = benches[cycle]
+            bench.install(config)
+            db.reset_counters()
+            for instrument in bench.instruments:
+                instrument.reset_counters()
+            sleeps.total = 0.0
+
+            thread = main.TestThread(generate_report=False)
+            log_time = [0.0]
+            emit_log_message = thread.emit_log_message
+
+            def timed_log(message, color="white"):
+                start = time.perf_counter()
+                emit_log_message(message, color)
+                log_time[0] += time.perf_counter() - start
+
+            thread.emit_log_message = timed_log  # type: ignore[method-assign]
+
+            durations = {}
+
+            def timed(name, func):
+                def wrapper(log, cfg):
+                    start = time.perf_counter()
+                    try:
+                        return func(log, cfg)
+                    finally:
+                        durations[name] = time.perf_counter() - start
+                return wrapper
+
+            thread.steps = [(name, timed(name, func), info) for name, func, info in thread.steps]
+
+            start = time.perf_counter()
+            thread.run()
+            cycle_times.append(time.perf_counter() - start)
+
+            row = db.tables["device_under_test"].get(config.device_under_test_id, {})
+            results["ok" if row.get("result") == 1 else "nok"] += 1
+            verdicts.append(row.get("result"))
+            for name, duration in durations.items():
+                step_times.setdefault(name, []).append(duration)
+            log_times.append(log_time[0])
+            sleep_times.append(sleeps.total)
+            db_round_trips.append(sum(db.round_trips.values()))
+            for (method, table), count in db.round_trips.items():
+                db_by_call[f"{method}:{table}"] = db_by_call.get(f"{method}:{table}", 0) + count
+            for instrument in bench.instruments:
+                stats = serial.setdefault(instrument.name, {"commands": 0, "bytes_out": 0, "bytes_in": 0, "latencies": []})
+                stats["commands"] += instrument.commands
+                stats["bytes_out"] += instrument.bytes_out
+                stats["bytes_in"] += instrument.bytes_in
+                stats["latencies"].extend(instrument.latencies)
+    finally:
+        config.preparer.discard()
+        config.preparer.db = None
+        sleeps.uninstall()
+        # The simulated instruments must not be reached by AppConfig.cleanup at exit
+        config.serial_patch_easy_flow = None
+        config.serial_target_capsys = None
+        config.multimeter_current = None
+        config.alim = None
+
+    cycles = max(args.cycles, 1)
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "version": configuration.VERSION,
+            "hash_git": configuration.HASH_GIT,
+            "cycles": args.cycles,
+            "no_sleep": args.no_sleep,
+            "db_latency_ms": args.db_latency_ms,
+            "serial_latency_ms": args.serial_latency_ms,
+            "fail_rate": args.fail_rate,
+            "trace": args.trace,
+            "pipelined": args.pipelined,
+            "adaptive_order": args.adaptive_order,
+            "serial_engine": args.serial_engine,
+            "power_sequencing": args.power_sequencing,
+        },
+        "results": {**results, "printed_tickets": printer.printed},
+        "verdicts": verdicts,
+        "cycle_time_s": summarize(cycle_times),
+        "steps_s": {name: summarize(values) for name, values in step_times.items()},
+        "log_rendering_s": summarize(log_times),
+        "sleep_s": summarize(sleep_times),
+        "db": {
+            "round_trips": summarize(db_round_trips),
+            "by_call_per_dut": {k: v / cycles for k, v in sorted(db_by_call.items())},
+        },
+        "serial": {
+            name: {
+                "commands_per_dut": stats["commands"] / cycles,
+                "bytes_out_per_dut": stats["bytes_out"] / cycles,
+                "bytes_in_per_dut": stats["bytes_in"] / cycles,
+                "latency_s": summarize(stats["latencies"]),
+            }
+            for name, stats in serial.items()
+        },
+    }
+
+
+def compare_with_baseline(result, baseline, tolerance):
+    """Return the list of regressions of result against baseline (p95 times and DB round trips)."""
+    regressions = []
+
+    def check(label, new, old):
+        if old > 0 and new > old * (1 + tolerance):
+            regressions.append(f"{label} : {old:.6g} -> {new:.6g} (+{(new / old - 1) * 100:.1f} %)")
+
+    check("cycle_time_s.p95", result["cycle_time_s"]["p95"], baseline.get("cycle_time_s", {}).get("p95", 0))
+    for name, stats in result["steps_s"].items():
+        check(f"steps_s.{name}.p95", stats["p95"], baseline.get("steps_s", {}).get(name, {}).get("p95", 0))
+    check("db.round_trips.mean", result["db"]["round_trips"]["mean"], baseline.get("db", {}).get("round_trips", {}).get("mean", 0))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark du cycle DUT contre un banc simulé")
+    parser.add_argument("--cycles", type=int, default=20, help="Nombre de cycles DUT à exécuter")
+    parser.add_argument("--output", default="benchmark_results.json", help="Fichier JSON de sortie")
+    parser.add_argument("--baseline", help="Fichier JSON de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Dégradation relative tolérée par rapport à la référence")
+    parser.add_argument("--config-json", default=configuration.get_project_path("config_antenne_patch_easy_flow.json"), help="Fichier config.json servi par la BDD simulée")
+    parser.add_argument("--no-sleep", action="store_true", help="Ne pas exécuter les temporisations des étapes (elles restent comptabilisées)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Latence ajoutée à chaque aller-retour BDD")
+    parser.add_argument("--serial-latency-ms", type=float, default=0.0, help="Latence ajoutée à chaque commande série")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Probabilité qu'une mesure simulée soit hors limites")
+    parser.add_argument("--noise", type=float, default=0.0, help="Bruit relatif (écart-type) appliqué aux mesures simulées")
+    parser.add_argument("--trace", action="store_true", help="Activer les traces de temps pendant le benchmark")
+    parser.add_argument("--pipelined", action="store_true", help="Préparer le DUT suivant pendant la fin du DUT courant")
+    parser.add_argument("--serial-engine", action="store_true", help="Exécuter les commandes de chaque instrument simulé dans son thread serial_io")
+    parser.add_argument("--power-sequencing", action="store_true", help="Suivre l'état d'alimentation du DUT (avec --serial-engine)")
+    parser.add_argument("--adaptive-order", action="store_true", help="Ordonner les étapes indépendantes selon leurs statistiques d'échec et de durée")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du générateur aléatoire")
+    return parser
+
+
+def default_args(**overrides):
+    """Return the default command line arguments, with overrides (used by serial_replay.py)."""
+    args = build_parser().parse_args([])
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    return args
+
+
+def main_benchmark():
+    args = build_parser().parse_args()
+
+    result = run_benchmark(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"Temps de cycle : p50={result['cycle_time_s']['p50']:.4f}s p95={result['cycle_time_s']['p95']:.4f}s p99={result['cycle_time_s']['p99']:.4f}s")
+    print(f"Allers-retours BDD par DUT : {result['db']['round_trips']['mean']:.1f}")
+    print(f"Résultats écrits dans {os.path.abspath(args.output)}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print("❌ Régressions par rapport à la référence :")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("✅ Aucune régression par rapport à la référence")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main_benchmark()
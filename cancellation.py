@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Annulation coopérative
+Jeton d'annulation partagé par les étapes, les temporisations et les instruments : un arrêt demandé interrompt
+les attentes en quelques millisecondes et la fin de test s'exécute ensuite normalement, sans arrêt forcé du thread.
+"""
+
+import functools
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TestCancelled(Exception):
+    """Raised at a cancellation point (sleep, instrument call) once a stop has been requested."""
+
+
+class CancellationToken:
+    """Reusable cancellation flag. cancel() wakes the sleeps and runs the registered callbacks (e.g. serial cancel_read)."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.callbacks = []
+        self.requested_at: Optional[float] = None  # time.perf_counter() of the last cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def on_cancel(self, callback: Callable):
+        """Register a callable run by cancel(), from the requesting thread."""
+        self.callbacks.append(callback)
+        return callback
+
+    def cancel(self):
+        if self.event.is_set():
+            return
+        self.requested_at = time.perf_counter()
+        self.event.set()
+        for callback in list(self.callbacks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Erreur lors de l'annulation : {e}")
+
+    def reset(self):
+        """Make the token usable again (for the cleanup that follows a cancellation, or the next test)."""
+        self.event.clear()
+        self.requested_at = None
+
+    def check(self):
+        """Raise TestCancelled if a stop has been requested."""
+        if self.event.is_set():
+            raise TestCancelled("Test arrêté par l'opérateur.")
+
+    def sleep(self, seconds: float):
+        """Wait for the given time, or raise TestCancelled as soon as a stop is requested."""
+        if self.event.wait(seconds):
+            raise TestCancelled("Test arrêté par l'opérateur.")
+
+    def elapsed(self) -> Optional[float]:
+        """Time since the last cancel(), None if it was never cancelled."""
+        return None if self.requested_at is None else time.perf_counter() - self.requested_at
+
+    def guard(self, obj, methods=("send_command",)):
+        """Turn the given methods of an instance into cancellation points, checked before and after each call:
+        a read interrupted by cancel_read returns a truncated response that must not be parsed."""
+        if obj is None or getattr(obj, "_cancellable_methods", None):
+            return obj
+        for method_name in methods:
+            method = getattr(obj, method_name, None)
+            if method is not None:
+                setattr(obj, method_name, self._wrap(method))
+        obj._cancellable_methods = tuple(methods)
+        return obj
+
+    def _wrap(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self.check()
+            result = method(*args, **kwargs)
+            self.check()
+            return result
+        return wrapper
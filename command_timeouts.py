@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Délais adaptatifs des commandes
+Histogramme des latences de chaque commande série par produit et par banc, conservé localement, dont on déduit
+le délai d'attente de la commande (centile élevé plus une marge) : les valeurs fixes du code restent le maximum.
+Un changement de la distribution des latences (câble, firmware, port USB) est signalé.
+"""
+
+import functools
+import json
+import math
+import os
+import platform
+import re
+import time
+from collections import deque
+from typing import Optional
+
+BUCKET_BASE = 0.001  # Upper bound of the first bucket (s)
+BUCKET_GROWTH = 1.2  # Each bucket is 20 % wider than the previous one
+BUCKET_COUNT = 64  # Up to about 100 s, the last bucket holds everything slower
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def bucket_index(latency: float) -> int:
+    if latency <= BUCKET_BASE:
+        return 0
+    return min(BUCKET_COUNT - 1, math.ceil(math.log(latency / BUCKET_BASE, BUCKET_GROWTH)))
+
+
+def bucket_bound(index: int) -> float:
+    return BUCKET_BASE * BUCKET_GROWTH ** index
+
+
+def command_key(command) -> str:
+    """Commands differing only by their numbers ("set txmod 225", "set txmod 450") share their statistics."""
+    return _NUMBER.sub("#", str(command).strip())
+
+
+class LatencyHistogram:
+    """Log-bucket histogram of the latencies of one command. Percentiles are read as the upper bound of the bucket,
+    so they never underestimate the latency."""
+    __slots__ = ("counts", "count", "recent", "shifted")
+
+    def __init__(self, counts=None, count=0):
+        self.counts = list(counts) if counts else [0] * BUCKET_COUNT
+        self.count = count
+        self.recent = deque(maxlen=50)  # Latencies of this session, not persisted
+        self.shifted = False  # A shift has been reported and the distribution has not come back yet
+
+    def add(self, latency: float):
+        self.counts[bucket_index(latency)] += 1
+        self.count += 1
+        self.recent.append(latency)
+
+    def decay(self):
+        """Halve the counts, so that a lasting change ends up being the baseline."""
+        self.counts = [c // 2 for c in self.counts]
+        self.count = sum(self.counts)
+
+    def percentile(self, q: float) -> float:
+        threshold = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= threshold and cumulative:
+                return bucket_bound(index)
+        return bucket_bound(BUCKET_COUNT - 1)
+
+    def to_dict(self):
+        return {"counts": self.counts, "count": self.count}
+
+
+def recent_percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CommandTimeouts:
+    """Per-command latency histograms, persisted in a local JSON file, and the timeouts derived from them.
+
+    attach() wraps send_command: each answered command adds its latency to the histogram of
+    "<product>/<bench>/<instrument>/<command>", and a timeout passed by the caller is read as a cap, replaced by
+    quantile × factor + margin once min_samples latencies are known. A command left unanswered with a learned
+    timeout gets its cap back until the next start.
+    """
+    def __init__(self, path: Optional[str] = None, min_samples: int = 50, quantile: float = 0.999, factor: float = 1.5,
+                 margin: float = 0.2, floor: float = 0.3, max_count: int = 5000, shift_ratio: float = 2.0):
+        self.path = path
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.factor = factor
+        self.margin = margin  # Seconds added to the scaled quantile (scheduling, USB latency)
+        self.floor = floor  # Timeout never below the serial read timeout of the instruments
+        self.max_count = max_count  # Samples kept per command before the histogram is halved
+        self.shift_ratio = shift_ratio  # Recent median / baseline median ratio reported as a shift
+        self.bench = platform.node() or "bench"
+        self.product = ""
+        self.histograms = {}  # key -> LatencyHistogram
+        self.suspended = set()  # Keys using their cap for the rest of the session
+        self.learned = 0  # Calls sent with a learned timeout
+        self.pending = []
+        self.load()
+
+    def key(self, instrument: str, command) -> str:
+        return f"{self.product}/{self.bench}/{instrument}/{command_key(command)}"
+
+    def histogram(self, key: str) -> LatencyHistogram:
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        return histogram
+
+    def timeout(self, instrument: str, command, cap: float) -> float:
+        """Timeout of the command: learned from its latencies, never above cap (the hard-coded value)."""
+        key = self.key(instrument, command)
+        histogram = self.histograms.get(key)
+        if histogram is None or histogram.count < self.min_samples or key in self.suspended:
+            return cap
+        learned = histogram.percentile(self.quantile) * self.factor + self.margin
+        return min(cap, max(self.floor, learned))
+
+    def record(self, instrument: str, command, latency: float):
+        key = self.key(instrument, command)
+        histogram = self.histogram(key)
+        histogram.add(latency)
+        if histogram.count > self.max_count:
+            histogram.decay()
+        self._check_shift(key, histogram)
+
+    def _check_shift(self, key: str, histogram: LatencyHistogram):
+        # The baseline includes the recent latencies, it is only compared once it is much larger
+        if len(histogram.recent) < histogram.recent.maxlen or histogram.count < 4 * self.min_samples:
+            return
+        baseline = histogram.percentile(0.5)
+        recent = recent_percentile(histogram.recent, 0.5)
+        ratio = recent / baseline if baseline > 0 else 1.0
+        shifted = ratio > self.shift_ratio or ratio < 1 / self.shift_ratio
+        if shifted and not histogram.shifted:
+            self.pending.append(
+                f"{key} : latence médiane {recent * 1000:.1f} ms sur les {len(histogram.recent)} dernières commandes, "
+                f"{baseline * 1000:.1f} ms habituellement")
+        elif not shifted and histogram.shifted:
+            self.pending.append(f"{key} : latence revenue à la normale ({recent * 1000:.1f} ms)")
+        histogram.shifted = shifted
+
+    def attach(self, instrument, name: str):
+        """Wrap send_command of an instrument. Done before it is opened, so that the identification commands
+        are also covered."""
+        if instrument is None or getattr(instrument, "_timed_commands", False):
+            return instrument
+        instrument.send_command = self._wrap(instrument.send_command, name)
+        instrument._timed_commands = True
+        return instrument
+
+    def _wrap(self, method, name: str):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            command = args[0] if args else kwargs.get("command", "")
+            cap = kwargs.get("timeout")
+            if cap is not None:
+                kwargs["timeout"] = self.timeout(name, command, cap)
+            learned = cap is not None and kwargs["timeout"] < cap
+            start = time.perf_counter()
+            response = method(*args, **kwargs)
+            latency = time.perf_counter() - start
+            if response:
+                self.record(name, command, latency)
+            if learned:
+                self.learned += 1
+                if not response:
+                    key = self.key(name, command)
+                    self.suspended.add(key)
+                    self.pending.append(f"{key} : pas de réponse en {kwargs['timeout']:.2f} s, retour au délai de {cap:g} s")
+            return response
+        return wrapper
+
+    def drain(self):
+        """Return and clear the shift warnings raised since the last call."""
+        warnings, self.pending = self.pending, []
+        return warnings
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.histograms = {key: LatencyHistogram(**state) for key, state in json.load(f).items()}
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Latences des commandes illisibles, elles sont réinitialisées : {e}")
+            self.histograms = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({key: histogram.to_dict() for key, histogram in self.histograms.items()}, f)
+        os.replace(tmp_path, self.path)
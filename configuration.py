@@ -1,4 +1,12 @@
 import os
+import time
+import json
+import hashlib
+import tempfile
+import contextlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime
 from typing import Optional
 import atexit
 from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
@@ -6,16 +14,40 @@ from modules.capsys_serial_instrument_manager.capsys_serial_instrument_manager i
 from modules.capsys_wrapper_tm_t20iii.capsys_wrapper_tm_t20III import PrinterDC  # Custom
 from modules.capsys_serial_instrument_manager.rsd3305p import alimentation_rsd3305p  # Custom
 from modules.capsys_serial_instrument_manager.mp730424.multimeter_mp730424 import Mp730424Manager  # Custom
+import tracing  # Custom
+import metrics  # Custom
+import serial_replay  # Custom
+import spc  # Custom
+import step_order  # Custom
+import step_budget  # Custom
+import retest  # Custom
+import command_timeouts  # Custom
+from step_result import Measurement  # Custom
+import pipeline  # Custom
+import serial_io  # Custom
+import current_profile  # Custom
+import power_sequencer  # Custom
+import target_state  # Custom
+import cancellation  # Custom
+import packed_array  # Custom
 
 # Initialize global variables
 CURRENTH_PATH = os.path.dirname(__file__)
 NAME_GUI = "esay_flow_RF90064"
 CONFIG_JSON_NAME = "config_antenne_patch_easy_flow_RF90064"
 PRODUCT_LIST_ID_DEFAULT = "5"
+# Products that can be tested on this bench: product_list_id -> name of their config JSON in the parameters table
+CONFIG_JSON_NAMES = {
+    PRODUCT_LIST_ID_DEFAULT: CONFIG_JSON_NAME,
+}
+PRODUCT_CONTEXT_MAX_AGE = 600  # Seconds during which a preloaded product context can be used by s01
 VERSION = "V1.0.0"
 HASH_GIT = "DEBUG" # Will be replaced by the Git hash when compiled with command .\build.bat
 AUTHOR = "Thomas GERARDIN"
 PRINTER_NAME = "EPSON TM-T20III Receipt"
+LOG_DIR = os.path.join(tempfile.gettempdir(), "log_banc_de_test_capsys")
+SNAPSHOT_TABLE = "data_snapshot"
+SNAPSHOT_PREFIX = "sha256:"
 
 def get_project_path(*paths):
     """Return the absolute path from the project root, regardless of current working directory."""
@@ -53,7 +85,7 @@ class SerialTargetCapsys(SerialInstrumentManager):
             raise RuntimeError(f"Invalid device IDN: {idn}")
         
 class ConfigItems:
-    """Container for all configuration items used in the test sequence."""
+    """Container for all configuration items used in the test sequence, validated once when config.json is loaded."""
     key_map = {
         "MULTIMETRE_COURANT": "multimeter_current",
         "ALIMENTATION": "alim",
@@ -63,45 +95,132 @@ class ConfigItems:
         "TEST_BF": "bf",
         "MESURE_CONSOMMATION_PATCH": "consumption",
     }
+    # Fields required for each key of config.json, expected number of limits and size of the limit groups
+    schema = {
+        "MULTIMETRE_COURANT": {"required": ("port",)},
+        "ALIMENTATION": {"required": ("port",)},
+        "PATCH": {"required": ("port",)},
+        "TARGET_CAPSYS": {"required": ("port",)},
+        "TEST_SEUILS": {"required": ("min_map", "max_map"), "length": 3},
+        "TEST_BF": {"required": ("min_map", "max_map"), "length": 6, "group_size": 2},  # (Id, AMP) per frequency
+        "MESURE_CONSOMMATION_PATCH": {"required": ("minimum", "maximum")},
+    }
+    budgets_key = "BUDGETS_TEMPS"  # Optional {step module name: [soft, hard]}, overrides TIME_BUDGET of the steps
+    power_key = "SEQUENCEMENT_ALIMENTATION"  # Optional DUT current thresholds (A) of power_sequencer.PowerSequencer
+    power_fields = ("on_current", "off_current", "short_circuit_current")
+    presence_key = "DETECTION_PRESENCE"  # Optional patch query of the armed mode and its exact replies (see fixture_watch.py)
+    presence_fields = ("command", "present", "absent")
+    __slots__ = tuple(key_map.values()) + ("time_budgets", "power_settings", "presence_settings")
 
     def init_config_items(self, configJson):
-        """Initialize configItems attributes from the config JSON mapping pins and keys."""
+        """Initialize configItems attributes from the config JSON mapping pins and keys.
+        Raises ValueError if a key is missing or malformed."""
         key_map = ConfigItems.key_map
-        # For each element of config.json, create a corresponding ConfigItem
-        for json_key, attr_name in key_map.items():
-            item = configJson.get(json_key, {}) # Retrieves the JSON object or {} if absent
-            # Create the ConfigItem with all the parameters from the JSON
-            setattr(
-                self,
-                attr_name,
-                ConfigItems.ConfigItem(                
-                    key=json_key,
-                    port=item.get("port"),
-                    min_map=item.get("min_map"),
-                    max_map=item.get("max_map"),
-                    minimum=item.get("minimum"),
-                    maximum=item.get("maximum"),
-                )
-            )
+        # Build every item first: the current items are only replaced if the whole file is valid
+        items = {
+            attr_name: ConfigItems.ConfigItem.from_json(json_key, configJson.get(json_key, {}), **ConfigItems.schema.get(json_key, {}))
+            for json_key, attr_name in key_map.items()
+        }
+        budgets = configJson.get(ConfigItems.budgets_key, {})
+        if not isinstance(budgets, dict):
+            raise ValueError(f"{ConfigItems.budgets_key} doit être un objet.")
+        time_budgets = {
+            step: step_budget.StepBudget.from_value(f"{ConfigItems.budgets_key}.{step}", value) for step, value in budgets.items()
+        }
+        power_settings = ConfigItems.power_settings_from_json(configJson.get(ConfigItems.power_key))
+        presence_settings = ConfigItems.presence_settings_from_json(configJson.get(ConfigItems.presence_key))
+        for attr_name, item in items.items():
+            setattr(self, attr_name, item)
+        self.time_budgets = time_budgets
+        self.power_settings = power_settings
+        self.presence_settings = presence_settings
+
+    @staticmethod
+    def power_settings_from_json(item) -> dict:
+        """Validate the DUT power thresholds of config.json, {} when the product does not declare them."""
+        key = ConfigItems.power_key
+        if item is None:
+            return {}
+        if not isinstance(item, dict):
+            raise ValueError(f"{key} doit être un objet.")
+        settings = {}
+        for field in ConfigItems.power_fields:
+            value = _limit(key, field, item.get(field))
+            if value is None or value <= 0:
+                raise ValueError(f"{key}.{field} doit être un courant positif.")
+            settings[field] = value
+        if not settings["off_current"] <= settings["on_current"] < settings["short_circuit_current"]:
+            raise ValueError(f"{key} : off_current <= on_current < short_circuit_current attendu.")
+        return settings
+
+    @staticmethod
+    def presence_settings_from_json(item) -> dict:
+        """Validate the board presence query of config.json, {} when the product does not declare it."""
+        key = ConfigItems.presence_key
+        if item is None:
+            return {}
+        if not isinstance(item, dict):
+            raise ValueError(f"{key} doit être un objet.")
+        settings = {}
+        for field in ConfigItems.presence_fields:
+            value = item.get(field)
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"{key}.{field} doit être un texte non vide.")
+            settings[field] = value
+        if settings["present"].strip() == settings["absent"].strip():
+            raise ValueError(f"{key} : les réponses present et absent doivent être différentes.")
+        return settings
+
+    @classmethod
+    def from_json(cls, configJson):
+        """Return a new ConfigItems built and validated from the config JSON."""
+        config_items = cls()
+        config_items.init_config_items(configJson)
+        return config_items
 
+    @dataclass(frozen=True, slots=True)
     class ConfigItem:
-        """Represents a single configuration item loaded from config.json or database."""
-        def __init__(
-            self,
-            key = "",
-            port = "",
-            min_map = [],
-            max_map = [],
-            minimum = 0.0,
-            maximum = 0.0,
-        ):
-            """Initialize a ConfigItem with optional parameters for test configuration."""
-            self.key = key
-            self.port = port
-            self.min_map = min_map
-            self.max_map = max_map
-            self.minimum = minimum
-            self.maximum = maximum
+        """Represents a single configuration item loaded from config.json or database. Limits are tuples of floats."""
+        key: str = ""
+        port: Optional[str] = None
+        min_map: tuple = ()
+        max_map: tuple = ()
+        minimum: Optional[float] = None
+        maximum: Optional[float] = None
+        groups: tuple = ()  # ((min_map group, max_map group), ...) when the limits are measured by groups
+
+        @classmethod
+        def from_json(cls, key, item, required=(), length=None, group_size=None):
+            """Validate one entry of config.json and return the corresponding ConfigItem."""
+            if not isinstance(item, dict):
+                raise ValueError(f"{key} doit être un objet.")
+            for field in required:
+                if item.get(field) is None:
+                    raise ValueError(f"{key}.{field} est absent.")
+            port = item.get("port")
+            if port is not None and not isinstance(port, str):
+                raise ValueError(f"{key}.port doit être une chaîne.")
+            min_map = _limits(key, "min_map", item.get("min_map"))
+            max_map = _limits(key, "max_map", item.get("max_map"))
+            if len(min_map) != len(max_map):
+                raise ValueError(f"{key} : min_map ({len(min_map)} valeurs) et max_map ({len(max_map)} valeurs) n'ont pas la même taille.")
+            if length is not None and min_map and len(min_map) != length:
+                raise ValueError(f"{key} : {length} limites attendues, {len(min_map)} trouvées.")
+            for i, (low, high) in enumerate(zip(min_map, max_map)):
+                if low > high:
+                    raise ValueError(f"{key} : min_map[{i}]={low:g} supérieur à max_map[{i}]={high:g}.")
+            minimum = _limit(key, "minimum", item.get("minimum"))
+            maximum = _limit(key, "maximum", item.get("maximum"))
+            if minimum is not None and maximum is not None and minimum > maximum:
+                raise ValueError(f"{key} : minimum={minimum:g} supérieur à maximum={maximum:g}.")
+            groups = ()
+            if group_size:
+                if len(min_map) % group_size:
+                    raise ValueError(f"{key} : le nombre de limites n'est pas un multiple de {group_size}.")
+                groups = tuple(
+                    (min_map[i:i + group_size], max_map[i:i + group_size]) for i in range(0, len(min_map), group_size)
+                )
+            return cls(key, port, min_map, max_map, minimum, maximum, groups)
 
     def __init__(self):
         """Initialize all ConfigItem attributes for different test parameters."""
@@ -112,6 +231,23 @@ class ConfigItems:
         self.test_seuils = self.ConfigItem()
         self.bf = self.ConfigItem()
         self.consumption = self.ConfigItem()
+        self.time_budgets = {}  # step module name -> step_budget.StepBudget
+        self.power_settings = {}  # PowerSequencer current thresholds, empty if config.json does not declare them
+        self.presence_settings = {}  # Presence command and replies of the armed mode, empty if config.json does not declare them
+
+def _limit(key, field, value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key}.{field} doit être un nombre, {value!r} trouvé.")
+    return float(value)
+
+def _limits(key, field, values) -> tuple:
+    if values is None:
+        return ()
+    if not isinstance(values, list):
+        raise ValueError(f"{key}.{field} doit être une liste de nombres.")
+    return tuple(_limit(key, f"{field}[{i}]", value) for i, value in enumerate(values))
 
 class Arg:
     name = NAME_GUI
@@ -119,6 +255,17 @@ class Arg:
     hash_git = HASH_GIT
     author = AUTHOR
     show_all_logs = False
+    enable_tracing = False
+    metrics_port = 0  # Local HTTP port of the Prometheus metrics endpoint, 0 to disable
+    metrics_textfile = ""  # File periodically rewritten with the metrics, empty to disable
+    control_port = 0  # Local HTTP port of the control API (start, stop, status, events), 0 to disable
+    record_serial = False  # Record the serial exchanges of each DUT in LOG_DIR/serial_traces
+    pipelined = False  # Prepare the context and the record of the next DUT while the current one finishes
+    serial_engine = False  # Run the commands of each instrument in its own thread (see serial_io.py), needed by the current profile and the power sequencer
+    adaptive_order = False  # Run the order-independent steps most likely to fail quickly first (see step_order.py)
+    armed = False  # Start a DUT cycle as soon as a board is detected in the fixture (see fixture_watch.py)
+    retest_failed = False  # Start resumes the last NOK DUT and only runs its failed steps (see retest.py)
+    power_sequencing = False  # Wait for the DUT power state read back from the supply (see power_sequencer.py), needs serial_engine
     operator = AUTHOR
     commande = ""
     of = ""
@@ -141,6 +288,9 @@ class AppConfig:
         self.db_config: Optional[DatabaseConfig] = None
         self.db: Optional[GenericDatabaseManager] = None
         self.device_under_test_id: Optional[int] = None
+        self.test_context: Optional[dict] = None  # Context of the DUT under test, returned by load_test_context
+        self.retest: Optional[retest.RetestSession] = None  # Last NOK DUT, retested by the next start in retest mode
+        self.resuming: Optional[retest.RetestSession] = None  # Session being retested by the running test
         self.configItems = ConfigItems()
         self.printer: Optional[PrinterDC] = None
         self.max_retries = 2
@@ -148,30 +298,204 @@ class AppConfig:
         self.alim: Optional[alimentation_rsd3305p.Rsd3305PManager] = None
         self.serial_patch_easy_flow: Optional[SerialPatchEasyFlow] = None
         self.serial_target_capsys: Optional[SerialTargetCapsys] = None
+        self.power: Optional[power_sequencer.PowerSequencer] = None  # DUT power state from the supply readback
+        self.target_state = target_state.TargetState()  # Emitter / txmod of serial_target_capsys, redundant commands are not sent
+        self.tracer = tracing.Tracer(enabled=self.arg.enable_tracing)
+        self.metrics = metrics.LineMetrics(self.arg.name)
+        self.tracer.listeners.append(self.metrics.on_call)
+        self.serial_recorder = serial_replay.SerialRecorder(enabled=self.arg.record_serial)
+        self.known_snapshots: set[str] = set()  # Hashes already present in SNAPSHOT_TABLE
+        self.spc = spc.SpcEngine(os.path.join(LOG_DIR, f"spc_{NAME_GUI}.json"))
+        self.step_measurements = []  # Measurement saved by the running step, attached to its StepResult
+        self.step_orderer = step_order.StepOrderer(os.path.join(LOG_DIR, f"step_stats_{NAME_GUI}.json"))
+        self.budget_tracker = step_budget.BudgetTracker(os.path.join(LOG_DIR, f"budget_stats_{NAME_GUI}.json"))
+        self.step_overruns = {}  # step name -> {"overrun", "elapsed_s", "soft_s", "hard_s"} of the DUT, saved by fin_du_test
+        self.final_step_name_id: Optional[int] = None  # step_name row of fin_du_test, receives the values known after the step loop
+        self.command_timeouts = command_timeouts.CommandTimeouts(os.path.join(LOG_DIR, f"latency_{NAME_GUI}.json"))
+        self.preparer = pipeline.DutPreparer(self.open_db_connection)
+        self.product_contexts = {}  # (product_list_id, operator) -> (time.monotonic() of the load, context), see switch_product
+        self.cancel_token = cancellation.CancellationToken()
+        self.cancel_token.on_cancel(self.cancel_serial_reads)
+        self.step_watchdog = step_budget.StepWatchdog(self.cancel_token)
+        self.serial_io = serial_io.SerialIoEngine(self.cancel_token, enabled=self.arg.serial_engine)
+        self.current_profile = current_profile.CurrentProfile()
         atexit.register(self.cleanup) # Register cleanup function to be called on exit
 
     def cleanup(self):
+        self.preparer.close()
+        self.step_watchdog.stop()
+        self.current_profile.stop()
         if self.db:
             self.db.disconnect()
             self.db = None
         if self.serial_target_capsys:
             self.serial_target_capsys.close()
             self.serial_target_capsys = None
+            self.target_state.invalidate()
         if self.multimeter_current:
             self.multimeter_current.close()
             self.multimeter_current = None
         if self.serial_patch_easy_flow:
             self.serial_patch_easy_flow.close()
             self.serial_patch_easy_flow = None
+        if self.power:
+            self.power.stop()
+            self.power = None
         if self.alim:
             self.alim.set_output(1, False)
             self.alim.set_output(2, False)
             self.alim.close()
             self.alim = None
+        self.serial_io.close()
         self.device_under_test_id = None
         
-    def save_value(self, step_name_id: int, key: str, value, unit: str = "", min_value: Optional[float] = None, max_value: Optional[float] = None, valid: int = 0):
-        """Save a key-value pair in the database."""
+    def open_db_connection(self) -> GenericDatabaseManager:
+        """Open an additional database connection, for a background thread (a connection must not be shared between threads)."""
+        if self.db_config is None:
+            raise ValueError("Database configuration is not initialized.")
+        db = GenericDatabaseManager(self.db_config, debug=self.arg.show_all_logs)
+        db.connect()
+        return self.tracer.instrument(db, "db", "db", ("create", "get_by_id", "get_by_column", "update_by_id"))
+
+    def preparation_key(self):
+        """Arguments a prepared DUT depends on: it is only used if they have not changed. The serial number changes
+        with every board, s01 writes it on the prepared record."""
+        return (self.arg.operator, self.arg.product_list_id, self.arg.of, self.arg.commande, self.arg.name)
+
+    def retest_key(self):
+        """Arguments of a NOK DUT that a retest must find unchanged: the same board, with the same test arguments."""
+        return self.preparation_key() + (self.arg.article,)
+
+    def preload_products(self, load_context):
+        """Load the context of every product of CONFIG_JSON_NAMES in a background thread, on its own connection.
+        load_context(config, db, product_list_id) returns (status, context), as steps/s01 load_test_context."""
+        def run():
+            try:
+                db = self.open_db_connection()
+            except Exception as e:
+                print(f"Préchargement des produits impossible : {e}")
+                return
+            try:
+                for product_list_id in CONFIG_JSON_NAMES:
+                    operator = self.arg.operator
+                    status, context = load_context(self, db, product_list_id)
+                    if status == 0:
+                        if operator == self.arg.operator:  # Otherwise loaded for an operator that is no longer current
+                            self.product_contexts[(product_list_id, operator)] = (time.monotonic(), context)
+                    else:
+                        print(f"Préchargement du produit {product_list_id} impossible : {context}")
+            finally:
+                db.disconnect()
+        thread = threading.Thread(target=run, name="product-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def take_product_context(self, product_list_id):
+        """Return and forget the preloaded context of a product for the current operator (the context holds the
+        operator_id the DUT is created with), None if there is none or it is too old."""
+        loaded_at, context = self.product_contexts.pop((str(product_list_id), self.arg.operator), (0.0, None))
+        if context is None or time.monotonic() - loaded_at > PRODUCT_CONTEXT_MAX_AGE:
+            return None
+        return context
+
+    def switch_product(self, product_list_id, load_context) -> float:
+        """Make product_list_id the tested product without restarting the bench and return the duration of the switch.
+
+        The preloaded context is used when there is one, otherwise it is loaded now. Instruments whose port changes
+        are closed so that s01 reopens them, the supply with its outputs switched off as in cleanup. Raises ValueError
+        if the product cannot be loaded.
+        """
+        start = time.perf_counter()
+        product_list_id = str(product_list_id)
+        if product_list_id not in CONFIG_JSON_NAMES:
+            raise ValueError(f"Le produit {product_list_id} n'est pas configuré sur ce banc.")
+        key = (product_list_id, self.arg.operator)
+        loaded_at, context = self.product_contexts.get(key, (0.0, None))
+        if context is None or time.monotonic() - loaded_at > PRODUCT_CONTEXT_MAX_AGE:
+            status, context = load_context(self, self.db, product_list_id)
+            if status != 0:
+                raise ValueError(context)
+            self.product_contexts[key] = (time.monotonic(), context)
+        self.preparer.discard()  # Prepared for the previous product
+
+        config_items = context["config_items"]
+        for attr_name in ("multimeter_current", "alim", "serial_patch_easy_flow", "serial_target_capsys"):
+            instrument = getattr(self, attr_name)
+            if instrument is not None and getattr(config_items, attr_name).port != getattr(self.configItems, attr_name).port:
+                if attr_name == "alim":
+                    if self.power:
+                        self.power.stop()
+                        self.power = None
+                    instrument.set_output(1, False)
+                    instrument.set_output(2, False)
+                if attr_name == "serial_target_capsys":
+                    self.target_state.invalidate()
+                instrument.close()
+                setattr(self, attr_name, None)
+        self.arg.product_list_id = product_list_id
+        self.arg.product_list = context["product_list"]
+        self.configItems = config_items
+        return time.perf_counter() - start
+
+    def register_instrument(self, instrument, name: str, methods=("send_command",)):
+        """Hook an opened instrument into the learned command timeouts, the timing spans, the serial recorder, the
+        cancellation token and its serial_io worker thread, and return it."""
+        self.command_timeouts.attach(instrument, name)  # Innermost: the latency of the exchange alone
+        self.serial_recorder.attach(instrument, name, methods)
+        self.tracer.instrument(instrument, "instrument", name, methods)
+        self.cancel_token.guard(instrument, methods)
+        return self.serial_io.attach(instrument, name, methods)
+
+    def cancel_serial_reads(self):
+        """Interrupt the blocking reads of the opened instruments (called from the thread requesting the stop)."""
+        for instrument in (self.serial_patch_easy_flow, self.serial_target_capsys, self.multimeter_current, self.alim):
+            ser = getattr(instrument, "ser", None)
+            if ser is not None and getattr(ser, "is_open", False) and hasattr(ser, "cancel_read"):
+                try:
+                    ser.cancel_read()
+                except Exception as e:
+                    print(f"Impossible d'interrompre la lecture série : {e}")
+
+    def start_current_profile(self) -> bool:
+        """Start sampling the multimeter in the background for the current DUT. Only possible when its commands go
+        through serial_io, which serialises the sampler and the steps on the port. Return True if started."""
+        if self.multimeter_current is None or not getattr(self.multimeter_current, "_serial_worker", None):
+            return False
+        self.current_profile.start(self.multimeter_current.meas)
+        return True
+
+    def start_power_sequencer(self, **settings) -> bool:
+        """Start tracking the DUT power state from the supply readback (see power_sequencer.PowerSequencer for the
+        settings). Only with power_sequencing and, like the current profile, when the supply commands go through serial_io."""
+        if self.power is not None:
+            self.power.stop()
+            self.power = None
+        if not self.arg.power_sequencing or self.alim is None or not getattr(self.alim, "_serial_worker", None):
+            return False
+        self.power = power_sequencer.PowerSequencer(self.alim, **settings)
+        self.power.start()
+        return True
+
+    def save_current_profile(self, step_name_id: int):
+        """Stop the current profile and save the per-phase consumption and the samples on the DUT."""
+        profile = self.current_profile
+        if not profile.running:
+            return
+        profile.stop()
+        self.save_value(step_name_id, "CONSOMMATION_PAR_PHASE", profile.summary())
+        if len(profile.values):
+            self.save_value(step_name_id, "COURANT_PROFIL", profile.values, "A", metadata={"phases": profile.phases, "errors": profile.errors})
+            self.save_value(step_name_id, "COURANT_PROFIL_T", profile.times, "s")
+
+    def sleep(self, seconds: float):
+        """Wait for the given time, recorded as a "sleep" span when tracing is enabled.
+        Raises cancellation.TestCancelled as soon as a stop is requested."""
+        with self.tracer.span("sleep", f"sleep {seconds}s"):
+            self.cancel_token.sleep(seconds)
+
+    def save_value(self, step_name_id: int, key: str, value, unit: str = "", min_value: Optional[float] = None, max_value: Optional[float] = None, valid: int = 0, metadata: Optional[dict] = None):
+        """Save a key-value pair in the database. Numeric arrays are stored in skvp_file (with metadata in their
+        header), read back with load_array."""
         if not self.db or not self.device_under_test_id:
             raise ValueError("Database or device under test ID is not initialized.")
         if isinstance(value, float):
@@ -190,11 +514,105 @@ class AppConfig:
             table = "skvp_json"
             col = "val_json"
             data = {"step_name_id": step_name_id, "key": key, col: value}
+        elif packed_array.is_array(value):
+            # Sample bursts and sweeps (array.array or numpy): packed with dtype/shape/unit and compressed
+            table = "skvp_file"
+            col = "val_file"
+            data = {"step_name_id": step_name_id, "key": key, col: packed_array.pack(value, unit, **(metadata or {}))}
         else:
             return "Type de valeur non supporté."
         id = self.db.create(table, data)
+        if table in ("skvp_float", "skvp_char"):
+            self.step_measurements.append(Measurement(key, value, unit, min_value, max_value, id))
+        # Process drift warnings are kept on the DUT next to the measurement
+        if table == "skvp_float":
+            for warning in self.spc.update(f"{self.arg.product_list_id}/{key}", value, min_value, max_value):
+                self.db.create("skvp_char", {"step_name_id": step_name_id, "key": f"SPC_{key}", "val_char": warning})
         return id
     
+    def finalize_device_under_test(self, result: int, failure_label: str, duration: float, step_summary: dict, log_text: str, timing: Optional[dict] = None, log=None):
+        """Write the log and the outcome of the DUT (result, failure label, end date, duration, per-step summary and
+        log id) in one transaction, so that the device_under_test row alone describes the test. The timing summary of
+        the whole step loop, fin_du_test included, is saved on the fin_du_test row. Return the log id.
+
+        If the transaction fails (database without the end_date, duration_s, step_summary and log_id columns), the
+        result, the failure label and the log are written on their own, and the error is reported to log(message, color).
+        """
+        if not self.db or not self.device_under_test_id:
+            raise ValueError("Database or device under test ID is not initialized.")
+        # Saved on its own so that a failed transaction below does not roll it back
+        if timing is not None and self.final_step_name_id:
+            self.save_value(self.final_step_name_id, "timing", timing)
+        transaction = getattr(self.db, "transaction", None)
+        log_id = None
+        try:
+            with transaction() if transaction else contextlib.nullcontext():
+                log_id = self.db.create("log", {"device_under_test_id": self.device_under_test_id, "value": log_text})
+                self.db.update_by_id("device_under_test", self.device_under_test_id, {
+                    "result": result,
+                    "failure_label": failure_label,
+                    "end_date": datetime.now(),
+                    "duration_s": round(duration, 3),
+                    "step_summary": json.dumps(step_summary, ensure_ascii=False),
+                    "log_id": log_id,
+                })
+            return log_id
+        except Exception as e:
+            message = f"Enregistrement complet du DUT impossible (colonnes end_date, duration_s, step_summary et log_id, voir README) : {e}"
+            if log is not None:
+                log(message, "yellow")
+        # Without a transaction the log row written above is already committed
+        if log_id is None or transaction:
+            log_id = self.db.create("log", {"device_under_test_id": self.device_under_test_id, "value": f"{log_text}{message}\n"})
+        self.db.update_by_id("device_under_test", self.device_under_test_id, {"result": result, "failure_label": failure_label})
+        return log_id
+
+    def load_array(self, step_name_id: int, key: str):
+        """Return (values, header) of a numeric array saved with save_value (see packed_array.unpack), None if absent."""
+        if not self.db:
+            raise ValueError("Database is not initialized.")
+        for row in self.db.get_by_column("skvp_file", "step_name_id", step_name_id):
+            if row.get("key") == key and packed_array.is_packed(row["val_file"]):
+                return packed_array.unpack(row["val_file"])
+        return None
+
+    def save_snapshot(self, data) -> str:
+        """Store data once in SNAPSHOT_TABLE, keyed by the SHA-256 of its canonical JSON, and return its reference."""
+        if not self.db:
+            raise ValueError("Database is not initialized.")
+        content = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if digest not in self.known_snapshots:
+            if not self.db.get_by_column(SNAPSHOT_TABLE, "hash", digest):
+                self.db.create(SNAPSHOT_TABLE, {"hash": digest, "content": content, "date": datetime.now()})
+            self.known_snapshots.add(digest)
+        return f"{SNAPSHOT_PREFIX}{digest}"
+
+    def load_snapshot(self, reference: str):
+        """Return the data of a snapshot reference. Values stored inline as JSON (before deduplication) are also accepted."""
+        if not self.db:
+            raise ValueError("Database is not initialized.")
+        if not reference.startswith(SNAPSHOT_PREFIX):
+            return json.loads(reference)
+        digest = reference[len(SNAPSHOT_PREFIX):]
+        rows = self.db.get_by_column(SNAPSHOT_TABLE, "hash", digest)
+        if not rows:
+            raise ValueError(f"Snapshot {digest} not found in {SNAPSHOT_TABLE}.")
+        content = rows[0]["content"]
+        if hashlib.sha256(content.encode("utf-8")).hexdigest() != digest:
+            raise ValueError(f"Snapshot {digest} is corrupted.")
+        return json.loads(content)
+
+    def get_data_used_for_test(self, device_under_test_id: int):
+        """Return the product context (operator, product_list, parameters...) used to test a DUT."""
+        if not self.db:
+            raise ValueError("Database is not initialized.")
+        for step in self.db.get_by_column("step_name", "device_under_test_id", device_under_test_id):
+            for row in self.db.get_by_column("skvp_char", "step_name_id", step["id"]):
+                if row.get("key") == "data_used_for_test":
+                    return self.load_snapshot(row["val_char"])
+        return None
+
     def run_meas_on_patch(
         self,
         log,
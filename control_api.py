@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+API de pilotage locale
+Serveur HTTP sur 127.0.0.1 pour le MES ou un poste de lecture code-barres : démarrage d'un cycle DUT avec
+opérateur / OF / numéro de série, arrêt, état des étapes, et flux des événements du thread de test (logs,
+étapes, mesures, fin de cycle) par interrogation longue. Un client minimal sert aux essais et à l'automatisation.
+
+Exemples :
+    python control_api.py --port 8765 start --operator "Prénom NOM" --of 12345 --commande 1 --sn SN0001
+    python control_api.py --port 8765 status
+    python control_api.py --port 8765 events
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+# Fields of a start request copied to config.arg, and those that are mandatory
+START_FIELDS = {"operator": "operator", "of": "of", "commande": "commande", "sn": "article", "indice": "indice", "product_list_id": "product_list_id"}
+START_REQUIRED = ("operator", "of", "sn")
+
+
+class EventJournal:
+    """Numbered events of the bench (thread-safe), kept in a ring buffer for the clients polling /events, and
+    the current state reported by /status."""
+    def __init__(self, capacity: int = 2000):
+        self.events = deque(maxlen=capacity)
+        self.next_id = 1
+        self.condition = threading.Condition()
+        self.state = {"state": "idle", "cycle": 0, "device_under_test_id": None, "arguments": {}, "steps": [], "result": None}
+
+    def publish(self, event_type: str, **data):
+        with self.condition:
+            self.events.append({"id": self.next_id, "time": time.time(), "type": event_type, **data})
+            self.next_id += 1
+            self.condition.notify_all()
+
+    def update(self, **state):
+        with self.condition:
+            self.state.update(state)
+
+    def set_step(self, index: int, **fields):
+        with self.condition:
+            self.state["steps"][index].update(fields)
+
+    def status(self):
+        with self.condition:
+            return json.loads(json.dumps(self.state, default=str))
+
+    def since(self, last_id: int, wait: float = 0.0, limit: int = 500):
+        """Return the events after last_id, waiting up to wait seconds for the first one."""
+        deadline = time.monotonic() + wait
+        with self.condition:
+            while self.next_id - 1 <= last_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.condition.wait(remaining)
+            return [event for event in self.events if event["id"] > last_id][:limit]
+
+
+class ControlServer:
+    """Serves the control API on http://127.0.0.1:<port> from a daemon thread.
+
+    start(arguments) and stop() are called from the HTTP threads and return (accepted, message): they must only
+    hand the request over to the GUI thread (see main.ControlBridge).
+        POST /start   {"operator", "of", "sn", ["commande", "indice", "product_list_id"]} -> 202, 409 if busy, 400
+        POST /stop    -> 202, 409 if no test is running
+        GET  /status  -> state, cycle, device_under_test_id, arguments, steps, result of the last cycle
+        GET  /events?since=<id>&wait=<s> -> {"events": [...], "last": <id>}
+    """
+    def __init__(self, journal: EventJournal, start: Callable, stop: Callable, port: int, host: str = "127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                params = dict(p.partition("=")[::2] for p in query.split("&") if p)
+                if path == "/status":
+                    self.reply(200, journal.status())
+                elif path == "/events":
+                    try:
+                        last_id = int(params.get("since", 0))
+                        wait = min(float(params.get("wait", 0)), 30.0)
+                    except ValueError:
+                        self.reply(400, {"error": "since et wait doivent être des nombres."})
+                        return
+                    events = journal.since(last_id, wait)
+                    self.reply(200, {"events": events, "last": events[-1]["id"] if events else last_id})
+                else:
+                    self.reply(404, {"error": f"Ressource inconnue : {path}"})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                    if not isinstance(body, dict):
+                        raise ValueError("objet JSON attendu")
+                except ValueError as e:
+                    self.reply(400, {"error": f"Requête invalide : {e}"})
+                    return
+                if self.path == "/start":
+                    missing = [field for field in START_REQUIRED if not str(body.get(field, "")).strip()]
+                    if missing:
+                        self.reply(400, {"error": f"Champs manquants : {', '.join(missing)}"})
+                        return
+                    arguments = {START_FIELDS[k]: str(v).strip() for k, v in body.items() if k in START_FIELDS}
+                    accepted, message = start(arguments)
+                elif self.path == "/stop":
+                    accepted, message = stop()
+                else:
+                    self.reply(404, {"error": f"Ressource inconnue : {self.path}"})
+                    return
+                self.reply(202 if accepted else 409, {"accepted": accepted, "message": message})
+
+            def reply(self, code, payload):
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.journal = journal
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]  # Actual port when started with port 0
+        self.thread = threading.Thread(target=self.server.serve_forever, name="control-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ControlClient:
+    """Minimal client of the control API (MES stub, tests)."""
+    def __init__(self, port: int, host: str = "127.0.0.1", timeout: float = 40.0):
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: Optional[dict] = None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b"{}")
+
+    def start(self, operator: str, of: str, sn: str, **fields):
+        return self._request("POST", "/start", {"operator": operator, "of": of, "sn": sn, **fields})
+
+    def stop(self):
+        return self._request("POST", "/stop", {})
+
+    def status(self):
+        return self._request("GET", "/status")[1]
+
+    def events(self, since: int = 0, wait: float = 0.0):
+        return self._request("GET", f"/events?since={since}&wait={wait:g}")[1]
+
+    def follow(self, since: int = 0, until: Optional[str] = "finished"):
+        """Yield the events as they come, until an event of type until."""
+        while True:
+            batch = self.events(since, wait=25)
+            for event in batch["events"]:
+                yield event
+                if event["type"] == until:
+                    return
+            since = batch["last"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client de l'API de pilotage du banc")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    sub = parser.add_subparsers(dest="command", required=True)
+    start = sub.add_parser("start", help="Démarrer un cycle DUT et suivre ses événements")
+    start.add_argument("--operator", required=True)
+    start.add_argument("--of", required=True)
+    start.add_argument("--sn", required=True)
+    start.add_argument("--commande")
+    start.add_argument("--indice")
+    start.add_argument("--product-list-id")
+    sub.add_parser("stop", help="Arrêter le cycle en cours")
+    sub.add_parser("status", help="État du banc et des étapes")
+    sub.add_parser("events", help="Suivre les événements jusqu'à la fin du cycle")
+    args = parser.parse_args()
+
+    client = ControlClient(args.port, args.host)
+    if args.command == "start":
+        fields = {k: v for k, v in (("commande", args.commande), ("indice", args.indice), ("product_list_id", args.product_list_id)) if v}
+        since = client.events()["last"]
+        code, reply = client.start(args.operator, args.of, args.sn, **fields)
+        print(code, reply.get("message") or reply.get("error"))
+        if code != 202:
+            raise SystemExit(1)
+        for event in client.follow(since):
+            print(json.dumps(event, ensure_ascii=False))
+    elif args.command == "stop":
+        code, reply = client.stop()
+        print(code, reply.get("message") or reply.get("error"))
+    elif args.command == "status":
+        print(json.dumps(client.status(), ensure_ascii=False, indent=2))
+    else:
+        for event in client.follow(client.events()["last"]):
+            print(json.dumps(event, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
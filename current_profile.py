@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Profil de courant
+Échantillonnage du multimètre en tâche de fond pendant tout le cycle DUT. Chaque échantillon est rattaché
+à la phase en cours (étape, puis commandes de la cible : émetteur, txmod...), pour évaluer la consommation
+sur une fenêtre du test sans étape dédiée et obtenir la consommation par phase.
+"""
+
+import math
+import threading
+import time
+from array import array
+from typing import Callable, Optional
+
+
+class CurrentProfile:
+    """Samples read_current() every period seconds in a background thread until stop().
+
+    Phases are consecutive: mark(name) closes the running phase and opens the next one. The samples are kept
+    in two array("d") (time since start, current), the phases as [name, index of their first sample].
+    """
+    def __init__(self, period: float = 0.1):
+        self.period = period
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.read_current: Optional[Callable] = None
+        self.phase = ""
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.origin = time.perf_counter()
+            self.times = array("d")
+            self.values = array("d")
+            self.phases = [[self.phase, 0]]
+            self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, read_current: Callable):
+        """Start a new profile in the current phase. read_current must be safe to call from another thread
+        (serial_io routed meas)."""
+        self.stop()
+        self.read_current = read_current
+        self.clear()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="current-profile", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def mark(self, phase: str):
+        """Tag the next samples with phase. Also called while stopped, so that a profile starts in the running step."""
+        if phase == self.phase:
+            return
+        with self.lock:
+            self.phase = phase
+            if self.phases[-1][1] == len(self.values):  # The previous phase has no sample
+                self.phases[-1][0] = phase
+            else:
+                self.phases.append([phase, len(self.values)])
+
+    def mark_sub(self, label: str):
+        """Tag the next samples with a sub-phase of the running step ("<step>/<label>")."""
+        self.mark(f"{self.phase.split('/', 1)[0]}/{label}")
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                value = float(self.read_current())
+            except Exception:  # Stop request, port error: the sample is missing, the profile goes on
+                self.errors += 1
+            else:
+                with self.lock:
+                    self.times.append(time.perf_counter() - self.origin)
+                    self.values.append(value)
+            self.stop_event.wait(self.period)
+
+    def window(self, label: str):
+        """Return the samples of the sub-phases named label, in every step (e.g. "emetteur off")."""
+        with self.lock:
+            bounds = self.phases + [[None, len(self.values)]]
+            samples = []
+            for (phase, start), (_, end) in zip(bounds, bounds[1:]):
+                if phase.partition("/")[2] == label:
+                    samples.extend(self.values[start:end])
+            return samples
+
+    def summary(self):
+        """Return {phase: {"count", "mean", "min", "max", "duration_s"}}, phases repeated in the cycle being merged."""
+        with self.lock:
+            bounds = self.phases + [[None, len(self.values)]]
+            end_time = self.times[-1] if self.times else 0.0
+            merged = {}
+            for (phase, start), (_, end) in zip(bounds, bounds[1:]):
+                if end <= start:
+                    continue
+                values = self.values[start:end]
+                stats = merged.setdefault(phase, {"count": 0, "sum": 0.0, "min": math.inf, "max": -math.inf, "duration_s": 0.0})
+                stats["count"] += len(values)
+                stats["sum"] += sum(values)
+                stats["min"] = min(stats["min"], min(values))
+                stats["max"] = max(stats["max"], max(values))
+                stats["duration_s"] += (self.times[end] if end < len(self.times) else end_time) - self.times[start]
+        return {
+            phase: {"count": s["count"], "mean": s["sum"] / s["count"], "min": s["min"], "max": s["max"], "duration_s": round(s["duration_s"], 3)}
+            for phase, s in merged.items()
+        }
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Pool de connexions BDD
+Même interface que GenericDatabaseManager (create, get_by_id, get_by_column, update_by_id...), avec une connexion
+par thread (thread de test, interface, préparation...), fermée à la fin du thread, des requêtes préparées côté
+serveur pour les écritures fréquentes, la reconnexion automatique et des statistiques de latence par requête.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+import mysql.connector
+from mysql.connector import errors as mysql_errors
+from mysql.connector.constants import ClientFlag
+from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+
+# Tables written several times per DUT, through server-side prepared statements
+HOT_INSERTS = {"step_name", "skvp_float", "skvp_char", "log"}
+HOT_UPDATES = {"device_under_test"}
+# Errors raised before the statement reached the server: a write can be retried without being duplicated
+RETRYABLE_WRITE_ERRNOS = {2006, 2055}  # Server has gone away, lost connection (broken pipe)
+
+
+class _ThreadConnections:
+    """Connection of one thread, with its prepared statements. The generic manager is only opened for the
+    GenericDatabaseManager methods the pool does not implement (reports...)."""
+    __slots__ = ("thread", "connection", "manager", "cursors", "in_transaction")
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.connection = None
+        self.manager = None
+        self.in_transaction = False
+        self.cursors = {}  # SQL -> prepared cursor (a prepared cursor re-executes its statement without re-preparing it)
+
+
+def _param(value):
+    # JSON columns (skvp_json, step_summary...) receive dictionaries and lists
+    return json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (dict, list)) else value
+
+
+class DatabasePool:
+    """Thread-safe drop-in replacement of GenericDatabaseManager: each thread uses its own connection, opened on
+    first use and closed by release() at the end of the thread (or when another thread registers after it ended).
+    Other GenericDatabaseManager methods are delegated to a manager of the calling thread."""
+    def __init__(self, db_config: DatabaseConfig, debug: bool = False, max_retries: int = 1):
+        self.db_config = db_config
+        self.debug = debug
+        self.max_retries = max_retries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []  # _ThreadConnections of the live threads, closed by release() or disconnect()
+        self.stats = {}  # (method, table) -> [count, total_s, max_s]
+        self.reconnects = 0
+        self.on_reconnect = []  # Callables notified after each reconnection
+
+    # Connections
+    def _state(self) -> _ThreadConnections:
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = self._local.state = _ThreadConnections()
+            with self._lock:
+                ended = [other for other in self._threads if not other.thread.is_alive()]
+                self._threads = [other for other in self._threads if other.thread.is_alive()] + [state]
+            for other in ended:  # Thread ended without release()
+                self._reset(other)
+        return state
+
+    def _manager(self, state: Optional[_ThreadConnections] = None):
+        state = state or self._state()
+        if state.manager is None:
+            manager = GenericDatabaseManager(self.db_config, debug=self.debug)
+            manager.connect()
+            state.manager = manager
+        return state.manager
+
+    def _connection(self, state: _ThreadConnections):
+        if state.connection is None:
+            state.connection = mysql.connector.connect(
+                user=self.db_config.user,
+                password=self.db_config.password,
+                host=self.db_config.host,
+                port=int(self.db_config.port),
+                database=self.db_config.database,
+                autocommit=True,
+                # rowcount counts the matched rows, as GenericDatabaseManager: an update writing the same values succeeds
+                client_flags=[ClientFlag.FOUND_ROWS],
+            )
+        return state.connection
+
+    def _reset(self, state: _ThreadConnections):
+        """Close the connections of a thread, they are reopened on next use."""
+        for cursor in state.cursors.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        state.cursors.clear()
+        try:
+            if state.connection is not None:
+                state.connection.close()
+        except Exception:
+            pass
+        try:
+            if state.manager is not None:
+                state.manager.disconnect()
+        except Exception:
+            pass
+        state.connection = None
+        state.manager = None
+
+    def connect(self):
+        """Open the connection of the calling thread (the others are opened on first use)."""
+        self._connection(self._state())
+
+    def release(self):
+        """Close the connections of the calling thread, at its end (a new TestThread runs each DUT)."""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            return
+        self._local.state = None
+        with self._lock:
+            if state in self._threads:
+                self._threads.remove(state)
+        self._reset(state)
+
+    def disconnect(self):
+        """Close the connections of every thread."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for state in threads:
+            self._reset(state)
+        self._local = threading.local()
+
+    # Instrumentation
+    def _observe(self, method: str, table: str, duration: float):
+        with self._lock:
+            stats = self.stats.get((method, table))
+            if stats is None:
+                stats = self.stats[(method, table)] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def _reconnected(self):
+        with self._lock:
+            self.reconnects += 1
+        for callback in list(self.on_reconnect):
+            callback()
+
+    def summary(self):
+        """Return the latency statistics per (method, table) and the number of reconnections."""
+        with self._lock:
+            return {
+                "reconnects": self.reconnects,
+                "queries": {
+                    f"{method}:{table}": {"count": count, "total_s": round(total, 6), "max_s": round(maximum, 6)}
+                    for (method, table), (count, total, maximum) in sorted(self.stats.items())
+                },
+            }
+
+    # Execution
+    def _run(self, method: str, table: str, write: bool, func: Callable):
+        """Run func(state) with reconnection: reads are retried on any connection error, writes only when the
+        statement never reached the server."""
+        attempt = 0
+        while True:
+            state = self._state()
+            start = time.perf_counter()
+            try:
+                return func(state)
+            except (mysql_errors.OperationalError, mysql_errors.InterfaceError) as e:
+                # A reconnection inside a transaction would lose its previous statements
+                if attempt >= self.max_retries or state.in_transaction or (write and getattr(e, "errno", None) not in RETRYABLE_WRITE_ERRNOS):
+                    raise
+                attempt += 1
+                self._reset(state)
+                self._reconnected()
+            finally:
+                self._observe(method, table, time.perf_counter() - start)
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed writes of the calling thread in one transaction, committed at the end of the block and
+        rolled back on exception."""
+        state = self._state()
+        connection = self._connection(state)
+        connection.start_transaction()
+        state.in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            connection.rollback()
+            raise
+        else:
+            connection.commit()
+        finally:
+            state.in_transaction = False
+
+    def _write(self, state: _ThreadConnections, sql: str, params, prepared: bool):
+        """Execute a write and return (lastrowid, rowcount)."""
+        params = tuple(_param(value) for value in params)
+        if prepared:
+            cursor = state.cursors.get(sql)
+            if cursor is None:
+                cursor = state.cursors[sql] = self._connection(state).cursor(prepared=True)
+            cursor.execute(sql, params)
+            return cursor.lastrowid, cursor.rowcount
+        cursor = self._connection(state).cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.lastrowid, cursor.rowcount
+        finally:
+            cursor.close()
+
+    def _read(self, state: _ThreadConnections, sql: str, params):
+        cursor = self._connection(state).cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def create(self, table, data):
+        columns = tuple(data)
+        sql = f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        params = tuple(data[c] for c in columns)
+        return self._run("create", table, True, lambda state: self._write(state, sql, params, table in HOT_INSERTS)[0])
+
+    def update_by_id(self, table, row_id, data):
+        columns = tuple(data)
+        sql = f"UPDATE `{table}` SET {', '.join(f'`{c}` = %s' for c in columns)} WHERE `id` = %s"
+        params = tuple(data[c] for c in columns) + (row_id,)
+        return self._run("update_by_id", table, True, lambda state: self._write(state, sql, params, table in HOT_UPDATES)[1] > 0)
+
+    def get_by_id(self, table, row_id):
+        sql = f"SELECT * FROM `{table}` WHERE `id` = %s"
+        rows = self._run("get_by_id", table, False, lambda state: self._read(state, sql, (row_id,)))
+        return rows[0] if rows else None
+
+    def get_by_column(self, table, column, value):
+        sql = f"SELECT * FROM `{table}` WHERE `{column}` = %s"
+        return self._run("get_by_column", table, False, lambda state: self._read(state, sql, (value,)))
+
+    def __getattr__(self, name):
+        # Only reached for the attributes not defined here: other GenericDatabaseManager methods (reports...)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._manager(), name)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Détection de la carte dans le montage
+En mode armé, le banc interroge le montage en tâche de fond entre deux DUT (commande de présence du patch) et
+démarre le cycle dès qu'une carte est détectée. La détection est filtrée (plusieurs lectures identiques
+consécutives) et ne redémarre un cycle qu'après le retrait de la carte testée.
+"""
+
+import threading
+from typing import Callable, Optional
+
+
+class FixtureWatcher:
+    """Polls probe() every period seconds while busy() is False.
+
+    probe() returns True (board present), False (fixture empty) or None (cannot tell yet: patch not opened), and
+    raises when the fixture gives no usable answer. The state changes after debounce identical readings; on_present()
+    is called, from the watcher thread, on each change to present. A board present when the watcher starts, or still
+    there after its test, does not start a new cycle: it must be removed first. on_error(message) is called, from the
+    watcher thread, when probe() starts failing or fails with a different message. lock is held from the busy() check
+    to the end of probe(): a test started while holding it never shares the fixture port with a probe in flight.
+    """
+    def __init__(self, probe: Callable, on_present: Callable, busy: Callable = lambda: False, period: float = 0.2, debounce: int = 3,
+                 on_error: Callable = print):
+        self.probe = probe
+        self.on_present = on_present
+        self.on_error = on_error
+        self.busy = busy
+        self.period = period
+        self.debounce = debounce
+        self.present: Optional[bool] = None  # Debounced state, None until known
+        self.candidate: Optional[bool] = None
+        self.count = 0
+        self.detections = 0
+        self.error: Optional[str] = None  # Last error reported, None after a usable reading
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        self.stop()
+        self.present = None
+        self.candidate = None
+        self.count = 0
+        self.error = None
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="fixture-watch", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.period):
+            with self.lock:
+                if self.busy():
+                    self.candidate, self.count = None, 0
+                    continue
+                try:
+                    reading = self.probe()
+                except Exception as e:  # Port unplugged, unexpected reply: reported once, the next reading decides
+                    self._report(f"Erreur lors de la détection de la carte : {e}")
+                    reading = None
+                else:
+                    if reading is not None:
+                        self.error = None
+            self._update(reading)
+
+    def _report(self, message: str):
+        if message == self.error:
+            return
+        self.error = message
+        try:
+            self.on_error(message)
+        except Exception as e:
+            print(f"{message} ({e})")
+
+    def _update(self, reading: Optional[bool]):
+        if reading is None:
+            self.candidate, self.count = None, 0
+            return
+        if reading != self.candidate:
+            self.candidate, self.count = reading, 0
+        self.count += 1
+        if self.count < self.debounce or reading == self.present:
+            return
+        previous, self.present = self.present, reading
+        # The first known state only initialises: a board already in place is not tested again
+        if reading and previous is False:
+            self.detections += 1
+            try:
+                self.on_present()
+            except Exception as e:
+                print(f"Erreur au démarrage du cycle sur détection : {e}")
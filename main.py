@@ -3,52 +3,86 @@
 import sys
 import importlib.util
 import os
+import time
+import threading
 from typing import List, Tuple, Callable
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from modules.capsys_mysql_command.capsys_mysql_command import DatabaseConfig # Custom
 from PyQt6.QtGui import QIcon, QCloseEvent
-from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTextEdit, QMessageBox, QCheckBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
+from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTextEdit, QMessageBox, QCheckBox, QComboBox)
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal, QTimer
 from datetime import datetime
-import logging, ctypes, tempfile, json
+import logging, ctypes
 from modules.capsys_pdf_report.capsys_pdf_report import DeviceReport  # Custom
 from modules.capsys_wrapper_tm_t20iii.capsys_wrapper_tm_t20III import PrinterDC  # Custom
 import configuration  # Custom
+import metrics  # Custom
+import cancellation  # Custom
+import db_pool  # Custom
+import step_budget  # Custom
+import retest  # Custom
+import control_api  # Custom
+import fixture_watch  # Custom
+from step_result import StepResult  # Custom
 
 # Global config object
 config = configuration.AppConfig()
 
 # Call the SetCurrentProcessExplicitAppUserModelID function from shell32.dll
 # This sets a unique AppUserModelID for the current process to identify it in the taskbar, start menu, etc.
-ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("my_unique_app_id")
+# Only available on Windows, skipped so that the test thread can be imported headless (benchmark.py)
+if os.name == "nt":
+    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("my_unique_app_id")
+
+def message_lines(message):
+    """Return the lines displayed for a log message (StepResult, dict or text), None for plain text."""
+    if isinstance(message, StepResult):
+        return message.lines()
+    if isinstance(message, dict):
+        if isinstance(message.get("infos"), list):
+            return [str(v) for v in message["infos"]]
+        return [f"{k} : {v}" for k, v in message.items()]
+    return None
+
+def plain_log_text(message, now):
+    """Return a log message as plain text, as written in the log file and in the database."""
+    lines = message_lines(message)
+    if lines is not None:
+        return f"[{now}] " + "\n".join(lines) + "\n"
+    return f"[{now}] {message}\n"
+
+DURATION_STYLE = "color: #888888; font-size: 12px;"
 
 class TestThread(QThread):
     """Thread to execute test steps in the background, emitting signals for UI updates and handling test logic."""
-    update_step = pyqtSignal(int, str, bool, str)
-    log_message = pyqtSignal(str, str)
-    finished = pyqtSignal()
-    step_failed = pyqtSignal(str, str)
+    update_step = pyqtSignal(int, str, int, object)  # index, status icon, success, StepResult (or state text)
+    log_message = pyqtSignal(object, str)  # text, dict or StepResult, formatted by MainWindow.append_log
+    finished = pyqtSignal(int, object)  # result recorded on the DUT, device_under_test_id
+    step_failed = pyqtSignal(str, object)  # step name, StepResult
+    step_time = pyqtSignal(int, float)
+    step_overrun = pyqtSignal(int, str, float)  # index, "soft" or "hard", elapsed time, from the watchdog thread
 
     def __init__(self, skipped_steps=None, generate_report=False):
         """Initialize the test thread and load test steps."""
         super().__init__()
         self.running = True
+        self.cleaning_up = False  # fin_du_test has started, it is not interrupted by a stop request
+        self.stop_lock = threading.Lock()  # A stop request cancels the token only before cleaning_up is set
+        self.stop_latency = None
+        self.stop_cancelled = False  # stop() has cancelled the token of this test (not set once cleaning_up is)
+        self.log_lines = []  # Plain text log of the DUT, written with its result by finalize_device_under_test
         self.skipped_steps = skipped_steps or set()
+        self.prepare_next = None  # prepare_next(config, db) of the step module that supports the pipelined mode
+        self.load_context = None  # load_test_context(config, db, product_list_id) of the step module loading the product context
+        self.detect_fixture = None  # detect_fixture(config) of the step module detecting the board in the fixture (armed mode)
+        self.order_independent = set()  # Indices of the steps declaring ORDER_INDEPENDENT, reordered in adaptive mode
+        self.time_budgets = {}  # step name -> step_budget.StepBudget declared by TIME_BUDGET in the step module
+        self.running_idx = None  # Index of the step watched by config.step_watchdog
         self.steps = self.load_steps()
         self.generate_report = generate_report
 
     def emit_log_message(self, message, color="white"):
-        """Emit a log message signal with the given message and color."""
-        # Si le message est un dict, le convertir en chaîne lisible
-        if isinstance(message, dict):
-            message = json.dumps(message, ensure_ascii=False, indent=2)
-        elif isinstance(message, str):
-            try:
-                # Si le message est une chaîne JSON, le charger puis le retransformer pour formatage
-                obj = json.loads(message)
-                if isinstance(obj, dict):
-                    message = json.dumps(obj, ensure_ascii=False, indent=2)
-            except json.JSONDecodeError:
-                pass
+        """Emit a log message signal with the given message (text, dict or StepResult, passed as is) and color."""
+        self.log_lines.append(plain_log_text(message, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
         self.log_message.emit(message, color)
 
     def load_steps(self) -> List[Tuple[str, Callable, Callable]]:
@@ -80,6 +114,15 @@ class TestThread(QThread):
                 if hasattr(module, "run_step"):
                     info_func = getattr(module, "get_info", lambda: "Pas d'information disponible pour cette étape.")
                     steps.append((module_name, module.run_step, info_func))
+                    self.load_budget(module_name, module)
+                    if getattr(module, "ORDER_INDEPENDENT", False):
+                        self.order_independent.add(len(steps) - 1)
+                    if hasattr(module, "prepare_next"):
+                        self.prepare_next = module.prepare_next
+                    if hasattr(module, "load_test_context"):
+                        self.load_context = module.load_test_context
+                    if hasattr(module, "detect_fixture"):
+                        self.detect_fixture = module.detect_fixture
 
         # Adds Fin du test.py to the end of the test
         if final_step_file:
@@ -92,19 +135,116 @@ class TestThread(QThread):
             if hasattr(module, "run_step"):
                 info_func = getattr(module, "get_info", lambda: "Pas d'information disponible pour cette étape.")
                 steps.append((module_name, module.run_step, info_func))
+                self.load_budget(module_name, module)
 
         return steps
 
+    def load_budget(self, step_name, module):
+        """Keep the TIME_BUDGET = (soft, hard) declared by a step module."""
+        if hasattr(module, "TIME_BUDGET"):
+            self.time_budgets[step_name] = step_budget.StepBudget.from_value(step_name, module.TIME_BUDGET)
+
+    def budget(self, step_name) -> step_budget.StepBudget:
+        """Time budget of a step: BUDGETS_TEMPS of config.json, else TIME_BUDGET of the step, else the default."""
+        time_budgets = getattr(config.configItems, "time_budgets", {})
+        return time_budgets.get(step_name) or self.time_budgets.get(step_name, step_budget.DEFAULT_BUDGET)
+
+    def retest_session(self):
+        """Return the NOK DUT to resume in retest mode, None for a new DUT."""
+        if not config.arg.retest_failed:
+            return None
+        session = config.retest
+        if session is None:
+            self.emit_log_message("Aucun DUT NOK à retester, nouveau DUT.", "yellow")
+        elif not session.matches(config.retest_key()):
+            self.emit_log_message("Les arguments du test ont changé depuis le DUT NOK, nouveau DUT.", "yellow")
+            session = None
+        return session
+
+    def keep_for_retest(self, session, result, step_summary, duration):
+        """Keep a NOK DUT (created by this test or resumed) for a retest, forget it once OK."""
+        config.resuming = None
+        if result != 0 or config.test_context is None:
+            config.retest = None
+        elif session is not None:
+            config.retest = session.next_attempt(step_summary, duration)
+        else:
+            config.retest = retest.RetestSession(config.device_under_test_id, config.retest_key(), config.test_context, step_summary, duration)
+
+    def on_watchdog(self, event, step_name, elapsed, budget):
+        """Report an overrun of the running step (called from the watchdog thread)."""
+        if self.running_idx is None:
+            return
+        if event == "soft":
+            self.emit_log_message(f"{step_name} : budget de temps de {budget.soft:g} s dépassé.", "orange")
+        else:
+            self.emit_log_message(f"{step_name} : budget maximal de {budget.hard:g} s dépassé, annulation de l'étape.", "red")
+        self.step_overrun.emit(self.running_idx, event, elapsed)
+
+    def execution_order(self) -> List[int]:
+        """Return the indices of the steps in execution order. In adaptive mode, the order-independent steps are
+        permuted among their own positions by StepOrderer, the other steps keep their place."""
+        order = list(range(len(self.steps)))
+        if not config.arg.adaptive_order:
+            return order
+        positions = sorted(self.order_independent)
+        names = config.step_orderer.order(config.arg.product_list_id, [self.steps[i][0] for i in positions])
+        index_by_name = {self.steps[i][0]: i for i in positions}
+        for position, name in zip(positions, names):
+            order[position] = index_by_name[name]
+        return order
+
     def run(self):
+        """Run the test, then close the database connection of this thread: each DUT runs in a new TestThread."""
+        try:
+            self.run_test()
+        finally:
+            release = getattr(config.db, "release", None)
+            if release is not None:
+                release()
+
+    def run_test(self):
         """Main execution loop for running all test steps and handling results, errors, and report generation."""
         self.emit_log_message("=== DÉBUT DU TEST ===", "yellow")
+        config.tracer.clear()
+        config.serial_recorder.start()
+        config.cancel_token.reset()
+        config.command_timeouts.product = config.arg.product_list_id
+        config.step_overruns = {}
+        config.final_step_name_id = None
+        config.step_watchdog.listeners.append(self.on_watchdog)
+        run_start = time.perf_counter()
         error_found = False
         failure_message = ""
-
-        for idx, (step_name, step_func, _) in enumerate(self.steps):
+        step_summary = {}  # step name -> {"status", "duration_s", "rank", "attempt"}
+        all_success = True
+
+        # Retest mode: same DUT, the passed order-independent steps of the previous attempts are carried over
+        session = self.retest_session()
+        config.resuming = session
+        config.test_context = None
+        attempt = session.attempt + 1 if session else 1
+        carried = set()
+        if session is not None:
+            carried = set(range(len(self.steps))) - session.steps_to_rerun([s[0] for s in self.steps], self.order_independent)
+            self.emit_log_message(f"Retest : {session.describe()}", "purple")
+
+        order = self.execution_order()
+        if order != sorted(order):
+            self.emit_log_message("Ordre adaptatif : " + ", ".join(self.steps[idx][0] for idx in order), "white")
+
+        for rank, idx in enumerate(order):
+            step_name, step_func, _ = self.steps[idx]
             if not self.running:
-                error_found = True  # Mark test as NO if interrupted
-                break
+                error_found = True  # Mark test as NO if interrupted, only the final step is executed
+                if self.stop_cancelled and self.stop_latency is None:
+                    failure_message = self.acknowledge_stop(failure_message)
+
+            if idx in carried:
+                previous = session.step_summary[step_name]
+                self.emit_log_message(f"Étape réussie à la tentative {previous.get('attempt', 1)}, non rejouée : {step_name}", "green")
+                self.update_step.emit(idx, "✅", 0, "Étape réussie lors d'une tentative précédente")
+                continue
 
             # If an error occurs, only the final step is executed
             if error_found and not "fin_du_test" in step_name:
@@ -115,43 +255,79 @@ class TestThread(QThread):
                 step_name_str: str = str(step_name)
                 self.emit_log_message(f"Étape sautée : {step_name_str.replace('s', '', 1).replace('_', ' ').capitalize()}", "orange")
                 self.update_step.emit(idx, "⏭️", 2, "Étape sautée par l'utilisateur")
+                step_summary[step_name] = {"status": "skipped", "rank": rank, "attempt": attempt}
+                all_success = False
                 continue
 
+            # Pipelined mode: the next DUT is prepared while this one finishes (already done by the first attempt of a retest)
+            if step_name.startswith("fin_du_test") and config.arg.pipelined and self.running and self.prepare_next is not None and session is None:
+                config.preparer.start(self.prepare_next, config, config.preparation_key())
+
+            if step_name.startswith("fin_du_test"):
+                with self.stop_lock:
+                    self.cleaning_up = True
+                # A stop requested before this point has cancelled the token: fin_du_test runs with a usable one
+                if self.stop_cancelled and self.stop_latency is None:
+                    error_found = True
+                    failure_message = self.acknowledge_stop(failure_message)
+
             step_name_str: str = str(step_name)
             self.emit_log_message(f"Étape : {step_name_str.replace('s', '', 1).replace('_', ' ').capitalize()}", "cyan")
             self.update_step.emit(idx, "⏳", 2, "Étape en cours")
 
+            config.step_measurements = []
+            config.current_profile.mark(step_name)
+            budget = self.budget(step_name)
+            self.running_idx = idx
+            # fin_du_test always runs to the end: its overruns are only reported
+            config.step_watchdog.arm(step_name, budget, enforce=not step_name.startswith("fin_du_test"))
+            step_start = time.perf_counter()
             try:
+                with config.tracer.span("step", step_name):
                     success, message = step_func(self.emit_log_message, config)
-                    if isinstance(message, dict):
-                        message = json.dumps(message, ensure_ascii=False, indent=2)
+            except cancellation.TestCancelled as e:
+                success = 1
+                message = str(e)
             except (Exception) as e:  # If any bug in steps, we treat them as test passed NOK
                 success = 1
                 message = f"Exception : {e}"
+            step_duration = time.perf_counter() - step_start
+            overrun = config.step_watchdog.disarm()
+            if overrun == "hard" and self.running:
+                config.cancel_token.reset()  # Cancelled by the watchdog, not by the operator
+                success = 1
+                message = f"Budget de temps dépassé : étape arrêtée après {step_duration:.1f} s ({budget.hard:g} s autorisées)."
+            step_result = StepResult.from_step(step_name, success, message)
+            step_result.measurements = config.step_measurements
+            step_result.duration_s = step_duration
+            self.step_time.emit(idx, step_duration)
+            step_summary[step_name] = {"status": success, "duration_s": round(step_duration, 3), "rank": rank, "attempt": attempt, "budget_s": [budget.soft, budget.hard]}
+            if overrun:
+                step_summary[step_name]["overrun"] = overrun
+                config.step_overruns[step_name] = {"overrun": overrun, "elapsed_s": round(step_duration, 3), "soft_s": budget.soft, "hard_s": budget.hard}
+            if self.running:
+                config.budget_tracker.update(config.arg.product_list_id, step_name, step_duration, overrun, budget)
+            all_success = all_success and success == 0
+            if self.stop_cancelled and self.stop_latency is None:
+                failure_message = self.acknowledge_stop(failure_message)
+            elif self.running and idx in self.order_independent:
+                config.step_orderer.update(config.arg.product_list_id, step_name, success == 1, step_duration)
+            for warning in config.spc.drain():
+                self.emit_log_message(f"SPC : {warning}", "yellow")
+            for warning in config.command_timeouts.drain():
+                self.emit_log_message(f"Latence : {warning}", "yellow")
 
             if success == 0:  # Test passed OK
-                self.emit_log_message(message, "green")
+                self.emit_log_message(step_result, "green")
             elif success == 1:  # Test passed NOK
-                if config.printer and config.arg.product_list:
+                if config.printer and config.arg.product_list and self.running:
                     if config.arg.product_list.get("info") != "debug":
-                        try:
-                            msg_obj = json.loads(message) if isinstance(message, str) else message
-                        except json.JSONDecodeError:
-                            msg_obj = message
-                        # If dict, extract step_name and pass the rest as infos
-                        if isinstance(msg_obj, dict) and "step_name" in msg_obj:
-                            label = msg_obj["step_name"]
-                            infos = []
-                            # If 'infos' exists and is a list, only its elements are displayed
-                            if "infos" in msg_obj and isinstance(msg_obj["infos"], list):
-                                for v in msg_obj["infos"]:
-                                    infos.append({"type": "text", "content": str(v), "align": "l", "weight": 500})
-                            else:
-                                for k, v in msg_obj.items():
-                                    if k != "step_name":
-                                        infos.append({"type": "text", "content": f"{k} : {v}", "align": "l", "weight": 500})
+                        # A step message is printed as its name followed by its lines, a text message as the label
+                        if step_result.text is None:
+                            label = step_result.step_name
+                            infos = [{"type": "text", "content": line, "align": "l", "weight": 500} for line in step_result.lines()]
                         else:
-                            label = str(msg_obj)
+                            label = step_result.text
                             infos = None
                         config.printer.custom_print_bdt(
                             config.arg.operator,
@@ -159,38 +335,77 @@ class TestThread(QThread):
                             config.device_under_test_id,
                             label,
                             infos)
-                self.emit_log_message(message, "red")
+                self.emit_log_message(step_result, "red")
             else:  # Test passed with WARNING
-                self.emit_log_message(message, "yellow")
+                self.emit_log_message(step_result, "yellow")
 
-            # Ensure message is always a string for update_step.emit
-            if isinstance(message, dict):
-                message_str = json.dumps(message, ensure_ascii=False, indent=2)
-            else:
-                message_str = str(message)
-            self.update_step.emit(idx, "✅" if success == 0 else "❌", success, message_str)
-
-            if success and not step_name.startswith("fin_du_test"):
-                # Ensure message is always a string for step_failed.emit
-                if isinstance(message, dict):
-                    message_str = json.dumps(message, ensure_ascii=False, indent=2)
-                else:
-                    message_str = str(message)
-                self.step_failed.emit(step_name, message_str)
+            # Counted here rather than in the GUI, which also shows the steps carried over by a retest
+            config.metrics.step_finished(step_name, success)
+            self.update_step.emit(idx, "✅" if success == 0 else "❌", success, step_result)
+
+            if success and not step_name.startswith("fin_du_test") and self.running:
+                self.step_failed.emit(step_name, step_result)
                 error_found = True
-                failure_message = message_str
+                failure_message = step_result.to_json()
 
-        # Update of the overall result in the database
-        if error_found or self.skipped_steps:
-            config.db.update_by_id("device_under_test", config.device_under_test_id, {"result": 0})  # type: ignore[attr-defined]
-            if failure_message:
-                config.db.update_by_id("device_under_test", config.device_under_test_id, {"failure_label": failure_message})  # type: ignore[attr-defined]
-        else:
-            config.db.update_by_id("device_under_test", config.device_under_test_id, {"result": 1})  # type: ignore[attr-defined]
+        result = 0 if (error_found or self.skipped_steps) else 1
 
         device_id = config.device_under_test_id
         output_path = f"rapport_device_{device_id}.pdf"
 
+        try:
+            config.spc.save()
+        except OSError as e:
+            self.emit_log_message(f"Erreur lors de la sauvegarde de l'état SPC : {e}", "yellow")
+        try:
+            config.step_orderer.save()
+        except OSError as e:
+            self.emit_log_message(f"Erreur lors de la sauvegarde des statistiques des étapes : {e}", "yellow")
+        try:
+            config.budget_tracker.save()
+        except OSError as e:
+            self.emit_log_message(f"Erreur lors de la sauvegarde des statistiques de budget : {e}", "yellow")
+        try:
+            config.command_timeouts.save()
+        except OSError as e:
+            self.emit_log_message(f"Erreur lors de la sauvegarde des latences des commandes : {e}", "yellow")
+
+        if config.serial_recorder.enabled:
+            try:
+                trace_path = config.serial_recorder.save(os.path.join(configuration.LOG_DIR, "serial_traces"), device_id, result)
+                if trace_path:
+                    self.emit_log_message(f"Session série enregistrée : {trace_path}", "white")
+            except Exception as e:
+                self.emit_log_message(f"Erreur lors de l'enregistrement de la session série : {e}", "yellow")
+
+        if config.tracer.enabled:
+            try:
+                os.makedirs(configuration.LOG_DIR, exist_ok=True)
+                trace_path = os.path.join(configuration.LOG_DIR, f"trace_device_{device_id}.json")
+                config.tracer.export_chrome_trace(trace_path, {"device_under_test_id": device_id, "name": config.arg.name})
+                self.emit_log_message(f"Trace des temps enregistrée : {trace_path}", "white")
+            except Exception as e:
+                self.emit_log_message(f"Erreur lors de l'export de la trace des temps : {e}", "yellow")
+
+        # Log and overall result of the DUT, written in one transaction
+        if all_success:
+            self.emit_log_message("Test OK", "green")
+        elif error_found:
+            self.emit_log_message("Test NOK", "red")
+        else:
+            self.emit_log_message("Test interrompu ou étape sautée", "yellow")
+        # In retest mode, the record describes every attempt: duration of all of them, latest result of each step
+        duration = time.perf_counter() - run_start
+        if session is not None:
+            step_summary = session.merge(step_summary, attempt)
+            duration += session.duration
+        try:
+            timing = config.tracer.summary() if config.tracer.enabled else None
+            config.finalize_device_under_test(result, failure_message, duration, step_summary, "".join(self.log_lines), timing, self.emit_log_message)
+        except Exception as e:
+            self.emit_log_message(f"Erreur lors de l'enregistrement du résultat en BDD : {e}", "red")
+        self.keep_for_retest(session, result, step_summary, duration)
+
         if self.generate_report:
             try:
                 report = DeviceReport(config.db, int(device_id), debug=config.arg.show_all_logs)  # type: ignore[attr-defined]
@@ -202,19 +417,105 @@ class TestThread(QThread):
                 error_msg = f"Erreur lors de la génération du rapport ou de l'ouverture du PDF : {e}"
                 self.emit_log_message(error_msg, "red")
 
-        self.finished.emit()
+        self.running_idx = None
+        config.step_watchdog.listeners.remove(self.on_watchdog)
+        self.finished.emit(result, device_id)
 
     def stop(self):
-        """Request the thread to stop execution."""
-        self.running = False
+        """Request the thread to stop execution. The running step is interrupted at its next cancellation point
+        (sleep, instrument call, serial read), then fin_du_test is executed by the thread itself. The token is
+        cancelled before running is cleared, so that the thread never acknowledges a stop whose cancel is still to come."""
+        with self.stop_lock:
+            if self.running and not self.cleaning_up:
+                config.cancel_token.cancel()
+                self.stop_cancelled = True
+            self.running = False
+
+    def acknowledge_stop(self, failure_message: str = ""):
+        """Log the delay between the stop request and the end of the interrupted step, and make the instruments usable
+        again for fin_du_test. Return the failure label of the DUT: the one of a failed step is kept."""
+        self.stop_latency = config.cancel_token.elapsed() or 0.0
+        config.cancel_token.reset()
+        config.metrics.stop_latency(self.stop_latency)
+        self.emit_log_message(f"Arrêt pris en compte en {self.stop_latency * 1000:.0f} ms.", "yellow")
+        return failure_message or "Test arrêté par l'opérateur."
+
+
+class ControlBridge(QObject):
+    """Link between the control API (control_api.py) and the GUI: the requests received by the HTTP threads are
+    handed over to the GUI thread as signals, the signals of the test thread are published in the API journal."""
+    start_requested = pyqtSignal(object)  # {config.arg field: value}
+    stop_requested = pyqtSignal()
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+        self.journal = control_api.EventJournal()
+        self.lock = threading.Lock()
+        self.start_pending = False  # Accepted start not yet handled by the GUI thread
+
+    def request_start(self, arguments):
+        """Called from an HTTP thread: accept the start if the bench is free."""
+        with self.lock:
+            if self.start_pending or self.window.test_thread.isRunning():
+                return False, "Un test est déjà en cours."
+            self.start_pending = True
+        self.start_requested.emit(arguments)
+        return True, "Démarrage demandé."
+
+    def request_stop(self):
+        """Called from an HTTP thread."""
+        if not self.window.test_thread.isRunning():
+            return False, "Aucun test en cours."
+        self.stop_requested.emit()
+        return True, "Arrêt demandé."
+
+    def started(self, thread, arguments):
+        """Publish a new cycle and follow the signals of its test thread."""
+        with self.lock:
+            self.start_pending = False
+        cycle = self.journal.status()["cycle"] + 1
+        steps = [{"index": i, "name": name, "status": "", "success": None, "duration_s": None} for i, (name, _, _) in enumerate(thread.steps)]
+        self.journal.update(state="running", cycle=cycle, arguments=arguments, steps=steps, result=None, device_under_test_id=None)
+        self.journal.publish("started", cycle=cycle, arguments=arguments)
+        thread.log_message.connect(self.on_log)
+        thread.update_step.connect(self.on_step)
+        thread.step_overrun.connect(self.on_overrun)
+
+    def on_log(self, message, color):
+        lines = message_lines(message)
+        self.journal.publish("log", color=color, text="\n".join(lines) if lines is not None else str(message))
+
+    def on_step(self, idx, status, success, step_result):
+        self.journal.update(device_under_test_id=config.device_under_test_id)
+        if not isinstance(step_result, StepResult):
+            self.journal.set_step(idx, status=status, success=success)
+            self.journal.publish("step", index=idx, status=status, success=success, message=str(step_result))
+            return
+        self.journal.set_step(idx, status=status, success=success, duration_s=round(step_result.duration_s, 3))
+        self.journal.publish("step", index=idx, name=step_result.step_name, status=status, success=success,
+                             duration_s=round(step_result.duration_s, 3), lines=step_result.lines())
+        for m in step_result.measurements:
+            self.journal.publish("measurement", index=idx, step=step_result.step_name, key=m.key, value=m.value, unit=m.unit,
+                                 minimum=m.minimum, maximum=m.maximum, in_limits=m.in_limits if isinstance(m.value, float) else None)
+
+    def on_overrun(self, idx, event, elapsed):
+        self.journal.publish("overrun", index=idx, overrun=event, elapsed_s=round(elapsed, 3))
+
+    def finished(self, result, device_under_test_id):
+        self.journal.update(state="idle", result=result, device_under_test_id=device_under_test_id)
+        self.journal.publish("finished", result=result, device_under_test_id=device_under_test_id)
 
 
 class MainWindow(QWidget):
     """Main application window for the CAPSYS DualCap Test Bench GUI."""
+    fixture_detected = pyqtSignal()  # Board detected in armed mode, emitted from the fixture watcher thread
+    fixture_error = pyqtSignal(str)  # No usable answer from the fixture in armed mode, emitted from the fixture watcher thread
+
     def __init__(self):
         """Initialize the main window, set up UI, and prepare logging and test thread."""
         super().__init__()
-        log_dir = os.path.join(tempfile.gettempdir(), "log_banc_de_test_capsys")
+        log_dir = configuration.LOG_DIR
         os.makedirs(log_dir, exist_ok=True)
         today = datetime.now().strftime("%Y-%m-%d")
         self.log_file_path = os.path.join(log_dir, f"log_{today}.txt")
@@ -225,7 +526,13 @@ class MainWindow(QWidget):
         self.step_infos = []
         self.step_messages = {}
         self.skip_checkboxes = []
+        self.duration_labels = []
+        self.running_step = None
+        self.running_step_start = 0.0
+        self.cycle_start = 0.0
         self.test_thread = TestThread()
+        self.next_thread = None  # Test thread built in advance while the bench is idle in armed mode
+        self.fixture_watcher = None
 
         self.setup_ui()
 
@@ -257,6 +564,10 @@ class MainWindow(QWidget):
 
         # Load the test steps and their info functions
         self.step_infos = [info for _, _, info in self.test_thread.steps]
+
+        # Contexts of the products of this bench, loaded in the background for the first DUT and the product switch
+        if self.test_thread.load_context is not None and config.db_config is not None:
+            config.preload_products(self.test_thread.load_context)
         
         # Log arguments only in complete mode (will be logged after mode is set)
         if not self.has_arguments:
@@ -267,6 +578,25 @@ class MainWindow(QWidget):
         if not config.printer.connected:
             self.append_log("Erreur de connexion à l'imprimante.", "yellow")
 
+        # Local control API (MES, barcode station), see control_api.py
+        self.control = None
+        if config.arg.control_port:
+            self.control = ControlBridge(self)
+            try:
+                control_api.ControlServer(self.control.journal, self.control.request_start, self.control.request_stop, int(config.arg.control_port)).start()
+                self.control.start_requested.connect(self.start_from_api)
+                self.control.stop_requested.connect(self.stop_test)
+                self.append_log(f"API de pilotage sur http://127.0.0.1:{config.arg.control_port}", "white")
+            except OSError as e:
+                self.control = None
+                self.append_log(f"Impossible de démarrer l'API de pilotage sur le port {config.arg.control_port} : {e}", "red")
+
+        # Armed mode: the cycle starts when a board is detected in the fixture
+        self.fixture_detected.connect(self.start_from_fixture)
+        self.fixture_error.connect(lambda message: self.append_log(message, "red"))
+        if config.arg.armed:
+            self.set_armed(True)
+
     def set_simple_mode_with_arguments(self):
         """Set simple mode when the script is executed with arguments."""
         if self.has_arguments:
@@ -282,9 +612,11 @@ class MainWindow(QWidget):
 
     def closeEvent(self, a0: QCloseEvent | None):
         """Clean up resources and close database connection when the window is closed."""
+        if self.fixture_watcher is not None:
+            self.fixture_watcher.stop()
         # Stop the test thread if it's running
         if self.test_thread and self.test_thread.isRunning():
-            self.test_thread.quit()
+            self.test_thread.stop()
             self.test_thread.wait()
         try:
             if hasattr(config, 'db') and config.db is not None:
@@ -324,6 +656,14 @@ class MainWindow(QWidget):
             label_status.setStyleSheet("font-size: 16px;")
             row.addWidget(label_status)
 
+            # Live duration of the step
+            label_duration = QLabel("")
+            label_duration.setAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            label_duration.setFixedWidth(70)
+            label_duration.setStyleSheet(DURATION_STYLE)
+            row.addWidget(label_duration)
+            self.duration_labels.append(label_duration)
+
             # Add a skip checkbox for each step (except for initialisation and fin_du_test)
             if step.lower() not in ["initialisation", "fin_du_test"]:
                 skip_checkbox = QCheckBox("Sauter")
@@ -376,6 +716,46 @@ class MainWindow(QWidget):
         self.generate_report_checkbox.setChecked(False)  # Par défaut décochée
         self.generate_report_checkbox.setStyleSheet("font-size: 12px;")
         self.button_layout.addWidget(self.generate_report_checkbox)
+        # Checkbox for timing traces
+        self.tracing_checkbox = QCheckBox("Tracer les temps")
+        self.tracing_checkbox.setChecked(config.tracer.enabled)
+        self.tracing_checkbox.setStyleSheet("font-size: 12px;")
+        self.tracing_checkbox.toggled.connect(self.set_tracing)
+        self.button_layout.addWidget(self.tracing_checkbox)
+        # Checkbox for the pipelined mode
+        self.pipelined_checkbox = QCheckBox("Préparer le DUT suivant")
+        self.pipelined_checkbox.setChecked(config.arg.pipelined)
+        self.pipelined_checkbox.setStyleSheet("font-size: 12px;")
+        self.pipelined_checkbox.toggled.connect(self.set_pipelined)
+        self.button_layout.addWidget(self.pipelined_checkbox)
+        # Checkbox for the adaptive step order
+        self.adaptive_order_checkbox = QCheckBox("Ordre adaptatif")
+        self.adaptive_order_checkbox.setChecked(config.arg.adaptive_order)
+        self.adaptive_order_checkbox.setStyleSheet("font-size: 12px;")
+        self.adaptive_order_checkbox.toggled.connect(self.set_adaptive_order)
+        self.button_layout.addWidget(self.adaptive_order_checkbox)
+        # Checkbox for the retest of the failed steps of the last NOK DUT
+        self.retest_checkbox = QCheckBox("Retester les étapes en échec")
+        self.retest_checkbox.setChecked(config.arg.retest_failed)
+        self.retest_checkbox.setStyleSheet("font-size: 12px;")
+        self.retest_checkbox.toggled.connect(self.set_retest_failed)
+        self.button_layout.addWidget(self.retest_checkbox)
+        # Checkbox for the armed mode
+        self.armed_checkbox = QCheckBox("Mode armé")
+        self.armed_checkbox.setChecked(config.arg.armed)
+        self.armed_checkbox.setStyleSheet("font-size: 12px;")
+        self.armed_checkbox.toggled.connect(self.set_armed)
+        self.button_layout.addWidget(self.armed_checkbox)
+        # Product selection, switched without restarting the bench
+        self.product_combo = QComboBox()
+        for product_list_id, config_json_name in configuration.CONFIG_JSON_NAMES.items():
+            self.product_combo.addItem(f"{product_list_id} - {config_json_name}", product_list_id)
+        if str(config.arg.product_list_id) not in configuration.CONFIG_JSON_NAMES:
+            self.product_combo.addItem(f"{config.arg.product_list_id} - {configuration.CONFIG_JSON_NAME}", str(config.arg.product_list_id))
+        self.product_combo.setCurrentIndex(self.product_combo.findData(str(config.arg.product_list_id)))
+        self.product_combo.setStyleSheet("font-size: 12px;")
+        self.product_combo.currentIndexChanged.connect(self.switch_product)
+        self.button_layout.addWidget(self.product_combo)
         # Start button
         self.start_button = QPushButton("Démarrer le test")
         self.start_button.clicked.connect(self.start_test)
@@ -408,10 +788,94 @@ class MainWindow(QWidget):
         main_layout.addLayout(self.button_layout)
         self.setLayout(main_layout)
 
+        # Timer refreshing the duration of the running step
+        self.duration_timer = QTimer(self)
+        self.duration_timer.setInterval(200)
+        self.duration_timer.timeout.connect(self.refresh_running_step_duration)
+
+    def set_tracing(self, enabled):
+        """Enable or disable the recording of timing spans."""
+        config.tracer.enabled = enabled
+
+    def switch_product(self, index):
+        """Switch the tested product selected in the combo box, without restarting the bench."""
+        product_list_id = self.product_combo.itemData(index)
+        if product_list_id is None or product_list_id == str(config.arg.product_list_id):
+            return
+        previous = str(config.arg.product_list_id)
+        if self.test_thread and self.test_thread.isRunning():
+            self.append_log("Impossible de changer de produit pendant un test.", "yellow")
+        elif self.test_thread.load_context is None:
+            self.append_log("Aucune étape ne charge le contexte produit.", "red")
+        else:
+            try:
+                duration = config.switch_product(product_list_id, self.test_thread.load_context)
+                self.append_log(f"Produit {product_list_id} sélectionné en {duration * 1000:.0f} ms.", "green")
+                self.reset_steps()
+                return
+            except Exception as e:
+                self.append_log(f"Changement de produit impossible : {e}", "red")
+        self.product_combo.blockSignals(True)
+        self.product_combo.setCurrentIndex(self.product_combo.findData(previous))
+        self.product_combo.blockSignals(False)
+
+    def set_pipelined(self, enabled):
+        """Enable or disable the preparation of the next DUT during the end of the current one."""
+        config.arg.pipelined = enabled
+        if not enabled:
+            config.preparer.discard()
+
+    def set_adaptive_order(self, enabled):
+        """Enable or disable the adaptive order of the order-independent steps (from the next test)."""
+        config.arg.adaptive_order = enabled
+
+    def set_armed(self, enabled):
+        """Enable or disable the automatic start of the cycle when a board is detected in the fixture."""
+        config.arg.armed = enabled
+        if self.fixture_watcher is not None:
+            self.fixture_watcher.stop()
+            self.fixture_watcher = None
+        if not enabled:
+            self.next_thread = None
+            return
+        detect_fixture = self.test_thread.detect_fixture
+        if detect_fixture is None:
+            self.append_log("Aucune étape ne détecte la carte dans le montage, mode armé impossible.", "red")
+            self.armed_checkbox.setChecked(False)
+            return
+        self.fixture_watcher = fixture_watch.FixtureWatcher(
+            lambda: detect_fixture(config), self.fixture_detected.emit, busy=lambda: self.test_thread.isRunning(),
+            on_error=self.fixture_error.emit)
+        self.fixture_watcher.start()
+        self.stage_next_cycle()
+        self.append_log("Mode armé : le test démarre dès qu'une carte est placée dans le montage.", "white")
+
+    def stage_next_cycle(self):
+        """Armed mode: build the next test thread and, in pipelined mode, prepare the next DUT (context, record) while
+        the bench is idle."""
+        if self.fixture_watcher is None:
+            return
+        self.next_thread = TestThread()
+        retesting = config.arg.retest_failed and config.retest is not None
+        prepare_next = self.next_thread.prepare_next
+        if config.arg.pipelined and prepare_next is not None and config.db_config is not None and not retesting and not config.preparer.prepared(config.preparation_key()):
+            config.preparer.start(prepare_next, config, config.preparation_key())
+
+    def start_from_fixture(self):
+        """Start the cycle of the board detected in armed mode (GUI thread)."""
+        if self.test_thread.isRunning() or self.fixture_watcher is None:
+            return
+        self.append_log("Carte détectée dans le montage, démarrage du test.", "white")
+        self.start_test()
+
+    def set_retest_failed(self, enabled):
+        """Enable or disable the retest of the last NOK DUT by the start button."""
+        config.arg.retest_failed = enabled
+
     def show_step_message(self, idx):
         """Show the stored message for the step at the given index in a dialog box."""
         message = self.step_messages.get(idx, "Aucun message disponible.")  # Retrieves the stored message
-        QMessageBox.information(self, f"Message Étape {idx + 1}", message)
+        QMessageBox.information(self, f"Message Étape {idx + 1}", str(message))
 
     def update_window_size(self):
         """Update window size based on current mode."""
@@ -551,10 +1015,11 @@ class MainWindow(QWidget):
         dialog.exec()
 
     def start_test(self):
-        """Start the test sequence by launching the test thread and resetting the UI."""
+        """Start the test sequence by launching the test thread and resetting the UI. Return False if a test is
+        already running."""
         if self.test_thread and self.test_thread.isRunning():
             self.log_area.append("Un test est déjà en cours...")
-            return
+            return False
 
         self.log_area.clear()
         self.reset_steps()
@@ -566,66 +1031,78 @@ class MainWindow(QWidget):
                 skipped_steps.add(i)
 
         generate_report = self.generate_report_checkbox.isChecked()
-        self.test_thread = TestThread(skipped_steps, generate_report)
+        self.cycle_start = time.perf_counter()
+        if self.next_thread is not None:
+            self.test_thread, self.next_thread = self.next_thread, None
+            self.test_thread.skipped_steps = skipped_steps
+            self.test_thread.generate_report = generate_report
+        else:
+            self.test_thread = TestThread(skipped_steps, generate_report)
         self.test_thread.update_step.connect(self.update_step_status)
         self.test_thread.log_message.connect(self.append_log)
         self.test_thread.finished.connect(self.test_finished)
         self.test_thread.step_failed.connect(self.handle_step_failure)
-        self.test_thread.start()
-
-    def handle_step_failure(self, step_name, message):
+        self.test_thread.step_time.connect(self.update_step_duration)
+        self.test_thread.step_overrun.connect(self.flag_step_overrun)
+        if self.control is not None:
+            self.control.started(self.test_thread, {field: getattr(config.arg, field) for field in control_api.START_FIELDS.values()})
+        if self.fixture_watcher is not None:
+            # Waits for a presence query in flight: the test and the watcher never use the patch port together
+            with self.fixture_watcher.lock:
+                self.test_thread.start()
+        else:
+            self.test_thread.start()
+        return True
+
+    def start_from_api(self, arguments):
+        """Start a DUT cycle requested by the control API with its operator, OF, serial number... (GUI thread)."""
+        product_list_id = arguments.pop("product_list_id", None)
+        if product_list_id is not None and product_list_id != str(config.arg.product_list_id):
+            index = self.product_combo.findData(product_list_id)
+            if index >= 0:
+                self.product_combo.setCurrentIndex(index)  # switch_product
+            if str(config.arg.product_list_id) != product_list_id:
+                with self.control.lock:
+                    self.control.start_pending = False
+                self.control.journal.publish("rejected", message=f"Produit {product_list_id} indisponible sur ce banc.")
+                return
+        for field, value in arguments.items():
+            setattr(config.arg, field, value)
+        self.append_log(f"Démarrage demandé par l'API : OF {config.arg.of}, SN {config.arg.article}.", "white")
+        # Started meanwhile from the button or by the armed mode
+        if not self.start_test():
+            with self.control.lock:
+                self.control.start_pending = False
+            self.control.journal.publish("rejected", message="Un test est déjà en cours.")
+
+    def handle_step_failure(self, step_name, step_result):
         """Display a critical error dialog when a test step fails."""
-        # Affiche uniquement les infos si présentes
-        msg_to_show = message
-        obj = None
-        if isinstance(message, str):
-            try:
-                obj = json.loads(message)
-            except Exception:
-                obj = None
-        elif isinstance(message, dict):
-            obj = message
-        if isinstance(obj, dict) and "infos" in obj and isinstance(obj["infos"], list):
-            msg_to_show = "\n".join([str(v) for v in obj["infos"]])
-        elif isinstance(obj, dict):
-            msg_to_show = ", ".join([f"{k}: {v}" for k, v in obj.items()])
-        QMessageBox.critical(self, f"Erreur", f"L'étape '{step_name[3:]}' a échoué :\n{msg_to_show}")
+        QMessageBox.critical(self, f"Erreur", f"L'étape '{step_name[3:]}' a échoué :\n{step_result}")
 
     def stop_test(self):
-        """Stop the test thread and run the cleanup step if necessary."""
+        """Request the test thread to stop. The running step is interrupted and the thread runs fin_du_test itself."""
         if not (self.test_thread and self.test_thread.isRunning()):
             self.append_log("Aucun test en cours à arrêter.", "yellow")
             return
-        self.test_thread.stop()  # Gentle request to stop
-        # Wait up to 5 seconds for the thread to terminate
-        finished = self.test_thread.wait(5000)
-        if not finished:
-            self.append_log("Arrêt forcé du thread de test après 5s...", "yellow")
-            self.test_thread.terminate()
-            self.test_thread.wait()
-        # Run the cleanup step Fin_du_test.py
-        try:
-            step_path = os.path.join(os.path.dirname(__file__), "steps", "zz", "Fin_du_test.py")
-            spec = importlib.util.spec_from_file_location("Fin_du_test", step_path)
-            if spec is not None and spec.loader is not None:
-                fin_du_test = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(fin_du_test)
-                if hasattr(fin_du_test, "run_step"):
-                    success, message = fin_du_test.run_step(self.append_log, config)
-                    color = "green" if success == 0 else ("yellow" if success == 2 else "red")
-                    self.append_log(f"[Fin_du_test] {message}", color)
-                else:
-                    self.append_log("La fonction run_step n'a pas été trouvée dans Fin_du_test.py.", "red")
-            else:
-                self.append_log("Impossible de charger le module Fin_du_test.py.", "red")
-        except Exception as e:
-            self.append_log(f"Erreur lors de l'exécution de Fin_du_test.py : {e}", "red")
+        self.append_log("Arrêt demandé...", "yellow")
+        self.test_thread.stop()
+        QTimer.singleShot(5000, self.check_test_stopped)
+
+    def check_test_stopped(self):
+        """Warn if the stopped thread is still running (database access or instrument command that cannot be interrupted)."""
+        if self.test_thread and self.test_thread.isRunning() and not self.test_thread.running:
+            self.append_log("Le test n'est pas encore arrêté après 5s, une opération non interruptible est en cours.", "yellow")
 
     def reset_steps(self):
         """Reset the step status indicators in the UI to their initial state."""
         for label_step_name, label_status in self.steps_widgets:
             label_step_name.setStyleSheet("color: white; font-size: 14px;")
             label_status.setText("⏳")
+        for label_duration in self.duration_labels:
+            label_duration.setText("")
+            label_duration.setStyleSheet(DURATION_STYLE)
+        self.running_step = None
+        self.duration_timer.stop()
 
     def update_step_status(self, idx, status, success, message=""):
         """Update the status and color of a step in the UI and store its message."""
@@ -633,17 +1110,39 @@ class MainWindow(QWidget):
         label_status.setText(status)
         if success == 0:
             label_step_name.setStyleSheet("color: green; font-size: 14px;")
-        elif "Étape en cours" in message:
+        elif status == "⏳":
             label_step_name.setStyleSheet("color: yellow; font-size: 14px;")
-        elif "Étape sautée par l'utilisateur" in message:
+            self.running_step = idx
+            self.running_step_start = time.perf_counter()
+            self.duration_timer.start()
+        elif status == "⏭️":
             label_step_name.setStyleSheet("color: orange; font-size: 14px;")
         else:
             label_step_name.setStyleSheet("color: red; font-size: 14px;")
 
-        # Store the step message
+        # Store the step message, formatted when it is shown
         self.step_messages[idx] = message
         # self.append_log(f"Message de l'étape {idx + 1} : {message}", "blue")
 
+    def refresh_running_step_duration(self):
+        """Display the elapsed time of the running step."""
+        if self.running_step is None:
+            self.duration_timer.stop()
+            return
+        self.duration_labels[self.running_step].setText(f"{time.perf_counter() - self.running_step_start:.1f} s")
+
+    def update_step_duration(self, idx, duration):
+        """Display the final duration of a step once it is finished."""
+        if self.running_step == idx:
+            self.running_step = None
+            self.duration_timer.stop()
+        self.duration_labels[idx].setText(f"{duration:.1f} s")
+
+    def flag_step_overrun(self, idx, event, elapsed):
+        """Show the duration of a step over its budget in orange (soft budget) or red (hard budget)."""
+        color = "orange" if event == "soft" else "red"
+        self.duration_labels[idx].setStyleSheet(f"color: {color}; font-size: 12px; font-weight: bold;")
+
     def append_log(self, message, color="white"):
         """Append a log message to the log area and save it to the log file."""
         from PyQt6.QtGui import QTextCursor, QTextCharFormat, QColor, QFont
@@ -670,43 +1169,25 @@ class MainWindow(QWidget):
             "purple": "#ff00ff"
         }
 
-        # Custom display for dict with 'infos' key
-        if isinstance(message, str):
-            try:
-                obj = json.loads(message)
-            except Exception:
-                obj = None
-        elif isinstance(message, dict):
-            obj = message
-        else:
-            obj = None
-
         # Determine color for dict display
         dict_color = color_map["green"] if color == "green" else (color_map["red"] if color == "red" else color_map["blue"])
 
-        if isinstance(obj, dict) and "infos" in obj and isinstance(obj["infos"], list):
+        # Step results and dicts: one line per info (or "key : value")
+        lines = message_lines(message)
+        if lines is not None:
             message_format = QTextCharFormat()
             message_format.setForeground(QColor(dict_color))
             message_format.setFontFamily("Consolas")
             message_format.setFontPointSize(12)
-            for v in obj["infos"]:
-                cursor.insertText(f"{v}\n", message_format)
-            plain_message = f"[{now}] " + "\n".join([str(v) for v in obj["infos"]]) + "\n"
-        elif isinstance(obj, dict):
-            message_format = QTextCharFormat()
-            message_format.setForeground(QColor(dict_color))
-            message_format.setFontFamily("Consolas")
-            message_format.setFontPointSize(12)
-            for k, v in obj.items():
-                cursor.insertText(f"{k} : {v}\n", message_format)
-            plain_message = f"[{now}] " + "\n".join([f"{k} : {v}" for k, v in obj.items()]) + "\n"
+            for line in lines:
+                cursor.insertText(f"{line}\n", message_format)
         else:
             message_format = QTextCharFormat()
             message_color = color_map.get(color, "#ffffff")
             message_format.setForeground(QColor(message_color))
             message_format.setFontPointSize(12)
             cursor.insertText(f"{message}\n", message_format)
-            plain_message = f"[{now}] {message}\n"
+        plain_message = plain_log_text(message, now)
 
         self.log_area.setTextCursor(cursor)
         self.log_area.ensureCursorVisible()
@@ -718,53 +1199,13 @@ class MainWindow(QWidget):
         except Exception as e:
             print(f"Erreur lors de l'écriture du log : {e}")
 
-    def test_finished(self):
-        """Handle the end of the test sequence, update the log, and store results in the database."""
-        from PyQt6.QtGui import QTextCursor, QTextCharFormat, QColor
-        
-        all_success = all(label_status.text() == "✅" for _, label_status in self.steps_widgets)
-        any_error = any(label_status.text() == "❌" for _, label_status in self.steps_widgets)
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        if all_success:
-            color = "green"
-            message = "Test OK"
-        elif any_error:
-            color = "red"
-            message = "Test NOK"
-        else:
-            color = "yellow"
-            message = "Test interrompu ou étape sautée"
-
-        # Add the final message with color formatting
-        cursor = self.log_area.textCursor()
-        cursor.movePosition(QTextCursor.MoveOperation.End)
-        
-        # Format for the timestamp
-        timestamp_format = QTextCharFormat()
-        timestamp_format.setForeground(QColor("#888888"))
-        cursor.insertText(f"[{now}] ", timestamp_format)
-        
-        # Format for the final message
-        message_format = QTextCharFormat()
-        color_map = {
-            "green": "#00ff00",
-            "red": "#ff4444",
-            "yellow": "#ffff00"
-        }
-        message_color = color_map.get(color, "#ffffff")
-        message_format.setForeground(QColor(message_color))
-        cursor.insertText(f"{message}\n\n", message_format)
-        
-        self.log_area.setTextCursor(cursor)
-        self.log_area.ensureCursorVisible()
-        
-        log_text = self.log_area.toPlainText()
-        try:
-            config.db.create("log", {"device_under_test_id": config.device_under_test_id, "value": log_text})  # type: ignore[attr-defined]
-        except Exception as e:
-            self.append_log(f"Erreur lors de l'enregistrement du log en BDD : {e}", "red")
+    def test_finished(self, result, device_under_test_id):
+        """Handle the end of the test sequence. The result and the log are stored in the database by the test thread."""
+        config.metrics.dut_finished(config.arg.article, result == 1, time.perf_counter() - self.cycle_start)
+        if self.control is not None:
+            self.control.finished(result, device_under_test_id)
+        self.stage_next_cycle()
+        self.log_area.append("")
 
 
 def main():
@@ -820,8 +1261,20 @@ def main():
         port=int(config.arg.port),
         database=config.arg.database,
     )
-    config.db = GenericDatabaseManager(config.db_config, debug=config.arg.show_all_logs)
+    # One connection per thread (test thread, interface, report), prepared statements for the frequent writes
+    config.db = db_pool.DatabasePool(config.db_config, debug=config.arg.show_all_logs)
     config.db.connect()
+    config.db.on_reconnect.append(lambda: config.metrics.instrument_connection("db"))
+    config.tracer.instrument(config.db, "db", "db", ("create", "get_by_id", "get_by_column", "update_by_id"))
+
+    # Line metrics, served and written from daemon threads
+    if config.arg.metrics_port:
+        try:
+            metrics.MetricsServer(config.metrics, int(config.arg.metrics_port)).start()
+        except OSError as e:
+            print(f"Impossible de démarrer le serveur de métriques sur le port {config.arg.metrics_port} : {e}")
+    if config.arg.metrics_textfile:
+        metrics.MetricsTextfileWriter(config.metrics, config.arg.metrics_textfile).start()
     
     """Launch the GUI"""
     app = QApplication(sys.argv)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Métriques de ligne
+Compteurs et histogrammes du banc (débit, rendement premier passage, échecs par étape, reprises, temps de cycle,
+reconnexions d'instruments, latence BDD) exposés au format texte Prometheus par HTTP local ou par fichier.
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+CYCLE_TIME_BUCKETS = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+DB_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STOP_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram, O(log buckets) per observation."""
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {self.sum:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {self.count}")
+        return lines
+
+
+class LineMetrics:
+    """Live bench metrics, updated incrementally. Every update is a few dictionary operations under a lock."""
+    HELP = {
+        "bench_duts_total": ("counter", "DUT testés, par résultat"),
+        "bench_first_pass_total": ("counter", "Premiers passages par numéro de série, par résultat"),
+        "bench_step_runs_total": ("counter", "Exécutions d'étapes, par étape et résultat"),
+        "bench_command_retries_total": ("counter", "Reprises de commandes instruments"),
+        "bench_instrument_connections_total": ("counter", "(Re)connexions des instruments"),
+        "bench_duts_per_hour": ("gauge", "DUT terminés sur la dernière heure glissante"),
+        "bench_first_pass_yield": ("gauge", "Rendement premier passage"),
+        "bench_cycle_time_seconds": ("histogram", "Temps de cycle DUT"),
+        "bench_db_query_seconds": ("histogram", "Latence des requêtes BDD"),
+        "bench_stop_latency_seconds": ("histogram", "Délai entre la demande d'arrêt et l'arrêt de l'étape en cours"),
+    }
+
+    def __init__(self, bench_name: str = "", max_serial_numbers: int = 10000):
+        self.lock = threading.Lock()
+        self.base_labels = (("bench", bench_name),) if bench_name else ()
+        self.counters = {}
+        self.histograms = {}
+        self.finished_at = deque()
+        self.seen_serial_numbers = OrderedDict()
+        self.max_serial_numbers = max_serial_numbers
+
+    def _inc(self, name, labels=(), value=1):
+        key = (name, self.base_labels + tuple(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, buckets, value, labels=()):
+        key = (name, self.base_labels + tuple(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def step_finished(self, step_name: str, success: int):
+        result = "pass" if success == 0 else ("warning" if success == 2 else "fail")
+        with self.lock:
+            self._inc("bench_step_runs_total", (("step", step_name), ("result", result)))
+
+    def dut_finished(self, serial_number: str, passed: bool, cycle_time: Optional[float] = None):
+        result = "pass" if passed else "fail"
+        with self.lock:
+            self._inc("bench_duts_total", (("result", result),))
+            if serial_number and serial_number not in self.seen_serial_numbers:
+                self.seen_serial_numbers[serial_number] = True
+                if len(self.seen_serial_numbers) > self.max_serial_numbers:
+                    self.seen_serial_numbers.popitem(last=False)
+                self._inc("bench_first_pass_total", (("result", result),))
+            if cycle_time is not None:
+                self._observe("bench_cycle_time_seconds", CYCLE_TIME_BUCKETS, cycle_time)
+            self.finished_at.append(time.monotonic())
+
+    def retry(self, command: str):
+        with self.lock:
+            self._inc("bench_command_retries_total", (("command", command.strip()),))
+
+    def instrument_connection(self, instrument: str):
+        with self.lock:
+            self._inc("bench_instrument_connections_total", (("instrument", instrument),))
+
+    def db_query(self, method: str, duration: float):
+        with self.lock:
+            self._observe("bench_db_query_seconds", DB_LATENCY_BUCKETS, duration, (("method", method),))
+
+    def stop_latency(self, duration: float):
+        with self.lock:
+            self._observe("bench_stop_latency_seconds", STOP_LATENCY_BUCKETS, duration)
+
+    def on_call(self, kind: str, name: str, duration: float):
+        """Tracer listener: feeds the DB latency histogram."""
+        if kind == "db":
+            self.db_query(name.rsplit(".", 1)[-1], duration)
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text exposition format."""
+        with self.lock:
+            now = time.monotonic()
+            while self.finished_at and now - self.finished_at[0] > 3600:
+                self.finished_at.popleft()
+            first_pass = {labels[-1][1]: value for (name, labels), value in self.counters.items() if name == "bench_first_pass_total"}
+            total_first_pass = sum(first_pass.values())
+            gauges = {
+                ("bench_duts_per_hour", self.base_labels): len(self.finished_at),
+                ("bench_first_pass_yield", self.base_labels): first_pass.get("pass", 0) / total_first_pass if total_first_pass else 0.0,
+            }
+            series = {}
+            for (name, labels), value in list(self.counters.items()) + list(gauges.items()):
+                series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {value:g}")
+            for (name, labels), histogram in self.histograms.items():
+                series.setdefault(name, []).extend(histogram.render(name, labels))
+        lines = []
+        for name in sorted(series):
+            metric_type, help_text = self.HELP.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(series[name])
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves LineMetrics.render() on http://127.0.0.1:<port>/metrics from a daemon thread."""
+    def __init__(self, metrics: LineMetrics, port: int, host: str = "127.0.0.1"):
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsTextfileWriter:
+    """Periodically rewrites a textfile (node_exporter textfile collector format) from a daemon thread."""
+    def __init__(self, metrics: LineMetrics, path: str, interval: float = 15.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="metrics-textfile", daemon=True)
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp_path, self.path)  # Atomic, readers never see a partial file
+        except OSError as e:
+            print(f"Erreur lors de l'écriture des métriques : {e}")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Tableaux numériques compacts
+Format binaire des salves d'échantillons et des balayages (courant, BF...) stockés dans skvp_file :
+en-tête JSON (dtype, forme, unité, métadonnées) suivi des données brutes little-endian compressées (zlib).
+
+    MAGIC | longueur de l'en-tête (uint32 LE) | en-tête JSON UTF-8 | données zlib
+"""
+
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, arrays are then read back as memoryview
+    np = None
+
+MAGIC = b"CNA1"
+FORMAT_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+# array.array / memoryview format character of each dtype
+STRUCT_FORMATS = {
+    "f8": "d", "f4": "f",
+    "i1": "b", "u1": "B", "i2": "h", "u2": "H", "i4": "i", "u4": "I", "i8": "q", "u8": "Q",
+}
+
+
+def is_array(value) -> bool:
+    """True for the values save_value stores as packed arrays (array.array and numpy arrays). numpy scalars also
+    expose __array_interface__ but are 0-d: they are not arrays."""
+    return isinstance(value, array) or (hasattr(value, "__array_interface__") and getattr(value, "ndim", 1) != 0)
+
+
+def _array_dtype(values: array) -> str:
+    kind = "f" if values.typecode in "fd" else ("u" if values.typecode in "BHILQ" else "i")
+    return f"{kind}{values.itemsize}"
+
+
+def pack(values, unit: str = "", **metadata) -> bytes:
+    """Return the packed representation of an array.array or numpy array (any shape) of numbers."""
+    if isinstance(values, array):
+        dtype = _array_dtype(values)
+        shape = [len(values)]
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        raw = values.tobytes()
+    elif np is not None and isinstance(values, np.ndarray):
+        dtype = f"{values.dtype.kind}{values.dtype.itemsize}"
+        if dtype not in STRUCT_FORMATS:
+            raise TypeError(f"Type de tableau non supporté : {values.dtype}")
+        shape = list(values.shape)
+        raw = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<")).tobytes()
+    else:
+        raise TypeError(f"Type de tableau non supporté : {type(values).__name__}")
+    if dtype not in STRUCT_FORMATS:
+        raise TypeError(f"Type de tableau non supporté : {dtype}")
+    header = json.dumps(
+        {"version": FORMAT_VERSION, "dtype": f"<{dtype}", "shape": shape, "unit": unit, "compression": "zlib", "meta": metadata},
+        separators=(",", ":"), ensure_ascii=False, default=str,
+    ).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(header)) + header + zlib.compress(raw, COMPRESSION_LEVEL)
+
+
+def is_packed(blob) -> bool:
+    return bytes(blob[:len(MAGIC)]) == MAGIC
+
+
+def read_header(blob) -> dict:
+    """Return the header of a packed array without decompressing the data."""
+    if not is_packed(blob):
+        raise ValueError("Ce contenu n'est pas un tableau compact.")
+    (length,) = struct.unpack_from("<I", blob, len(MAGIC))
+    start = len(MAGIC) + 4
+    return json.loads(bytes(blob[start:start + length]).decode("utf-8"))
+
+
+def unpack(blob, as_numpy: Optional[bool] = None):
+    """Return (values, header) of a packed array.
+
+    values is a read-only numpy array viewing the decompressed buffer (numpy.frombuffer, no copy) when numpy is
+    installed, a memoryview cast to the dtype and shape otherwise (or when as_numpy is False).
+    """
+    header = read_header(blob)
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Version de tableau compact non supportée : {header.get('version')}")
+    (length,) = struct.unpack_from("<I", blob, len(MAGIC))
+    raw = zlib.decompress(memoryview(blob)[len(MAGIC) + 4 + length:])
+    dtype = header["dtype"]
+    shape = header["shape"]
+    if as_numpy is None:
+        as_numpy = np is not None
+    if as_numpy:
+        if np is None:
+            raise ImportError("numpy n'est pas installé.")
+        return np.frombuffer(raw, dtype=dtype).reshape(shape), header
+    if sys.byteorder == "big" and dtype[1:] not in ("i1", "u1"):
+        swapped = array(STRUCT_FORMATS[dtype[1:]], raw)
+        swapped.byteswap()
+        raw = swapped.tobytes()
+    view = memoryview(raw).cast(STRUCT_FORMATS[dtype[1:]])
+    return (view.cast("B").cast(view.format, shape) if len(shape) > 1 else view), header
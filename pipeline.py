@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Préparation du DUT suivant
+En mode pipeline, le contexte produit et l'enregistrement device_under_test du DUT N+1 sont préparés
+dans un thread dédié (avec sa propre connexion BDD) pendant la fin de test, le log et le rapport du DUT N.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+UNUSED_LABEL = "DUT préparé mais non testé"
+
+
+class DutPreparer:
+    """Runs a preparation function in the background and hands its result to the next initialisation step.
+
+    The result is only handed over when the test arguments (operator, product, OF...) have not changed since
+    the preparation started. A prepared device_under_test record that is never used is labelled UNUSED_LABEL.
+    """
+    def __init__(self, connect: Callable):
+        self.connect = connect  # Returns a connected database manager, used by the preparation thread only
+        self.db = None
+        self.thread: Optional[threading.Thread] = None
+        self.key = None
+        self.result = None
+        self.error: Optional[Exception] = None
+        self.duration = 0.0
+
+    def start(self, prepare: Callable, config, key):
+        """Start prepare(config, db) in a background thread. A previous unused result is discarded first."""
+        self.discard()
+        self.key = key
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(prepare, config), name="dut-preparer", daemon=True)
+        self.thread.start()
+
+    def _run(self, prepare, config):
+        start = time.perf_counter()
+        try:
+            if self.db is None:
+                self.db = self.connect()
+            self.result = prepare(config, self.db)
+        except Exception as e:
+            self.error = e
+            if self.db is not None:  # The connection is reopened on the next preparation
+                try:
+                    self.db.disconnect()
+                except Exception as disconnect_error:
+                    print(f"Erreur lors de la fermeture de la connexion de préparation : {disconnect_error}")
+                self.db = None
+        finally:
+            self.duration = time.perf_counter() - start
+
+    def prepared(self, key) -> bool:
+        """True if a preparation for key is running or waiting to be taken."""
+        return self.key == key and (self.thread is not None or self.result is not None)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the running preparation. Return False if it is still running after timeout."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                return False
+            self.thread = None
+        return True
+
+    def take(self, key, timeout: Optional[float] = 30.0):
+        """Return the prepared result for key (None if there is none, it failed or the arguments changed)."""
+        if not self.wait(timeout):
+            return None
+        result, self.result = self.result, None
+        if result is not None and key != self.key:
+            self._mark_unused(result)
+            return None
+        return result
+
+    def discard(self):
+        """Wait for the running preparation and label its record as unused."""
+        if not self.wait():
+            return
+        result, self.result = self.result, None
+        if result is not None:
+            self._mark_unused(result)
+
+    def _mark_unused(self, result):
+        device_under_test_id = result.get("device_under_test_id") if isinstance(result, dict) else None
+        if device_under_test_id is None or self.db is None:
+            return
+        try:
+            self.db.update_by_id("device_under_test", device_under_test_id, {"failure_label": UNUSED_LABEL})
+        except Exception as e:
+            print(f"Impossible de marquer le DUT préparé {device_under_test_id} : {e}")
+
+    def close(self):
+        """Discard the unused result and close the preparation connection."""
+        self.discard()
+        if self.db is not None:
+            try:
+                self.db.disconnect()
+            except Exception as e:
+                print(f"Erreur lors de la fermeture de la connexion de préparation : {e}")
+            self.db = None
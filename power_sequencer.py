@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Séquencement de l'alimentation
+Lecture rapide de la tension et du courant de sortie de la RSD3305P en tâche de fond, détection de la fin
+d'appel de courant et du régime établi du DUT : événements « DUT prêt » et « DUT éteint », coupure immédiate
+en cas de court-circuit, temps d'établissement mesurés pour chaque DUT au lieu de temporisations fixes.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class PowerFault(RuntimeError):
+    """Raised by wait_ready / wait_off after a short-circuit: the output has been switched off."""
+
+
+class PowerSequencer:
+    """Polls the readback of one supply channel and tracks the DUT power state.
+
+    expect_on() / expect_off() are called right before the command switching the DUT (e.g. "test power on" to
+    the patch), wait_ready() / wait_off() then return the time measured from that command to the steady state.
+    The DUT is ready once its current exceeds on_current and the last settle_samples readings stay within
+    the tolerance, off once the current stays below off_current.
+    """
+    VOLTAGE_QUERY = "VOUT{channel}?"
+    CURRENT_QUERY = "IOUT{channel}?"
+
+    def __init__(self, alim, channel: int = 2, on_current: float = 0.002, off_current: float = 0.001,
+                 short_circuit_current: float = 0.45, settle_samples: int = 5, tolerance: float = 0.05,
+                 poll_period: float = 0.01):
+        self.alim = alim
+        self.channel = channel
+        self.on_current = on_current
+        self.off_current = off_current
+        self.short_circuit_current = short_circuit_current
+        self.settle_samples = settle_samples
+        self.tolerance = tolerance  # Relative spread of the last readings (and at least 0.5 mA)
+        self.poll_period = poll_period
+        self.ready = threading.Event()  # DUT ready
+        self.off = threading.Event()  # DUT off
+        self.fault: Optional[str] = None
+        self.listeners = []  # Callables (event, PowerSequencer) for "ready", "off" and "fault", from the polling thread
+        self.recent = deque(maxlen=settle_samples)
+        self.switched_at = time.perf_counter()  # Time of the last expect_on / expect_off
+        self.settle_time: Optional[float] = None
+        self.peak_current = 0.0
+        self.voltage = 0.0
+        self.current = 0.0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    # Polling
+    def start(self):
+        """Start polling the readback. The supply commands must be safe to call from another thread (serial_io)."""
+        self.stop()
+        self.fault = None
+        self.ready.clear()
+        self.off.clear()
+        self.recent.clear()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="power-sequencer", daemon=True)
+        self.thread.start()
+
+    def restart(self):
+        """Start polling again for the next DUT, switching the output back on if a short-circuit switched it off."""
+        if self.fault:
+            self.alim.set_output(self.channel, True)
+        self.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def readback(self):
+        """Return the (voltage, current) measured on the output."""
+        voltage = float(str(self.alim.send_command(self.VOLTAGE_QUERY.format(channel=self.channel))).strip())
+        current = float(str(self.alim.send_command(self.CURRENT_QUERY.format(channel=self.channel))).strip())
+        return voltage, current
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.voltage, self.current = self.readback()
+            except Exception:  # Stop request, invalid answer: skipped, the next reading decides
+                pass
+            else:
+                self._update(self.current)
+            self.stop_event.wait(self.poll_period)
+
+    def _update(self, current: float):
+        if current >= self.short_circuit_current:
+            self._short_circuit(current)
+            return
+        self.recent.append(current)
+        self.peak_current = max(self.peak_current, current)
+        if len(self.recent) < self.settle_samples:
+            return
+        mean = sum(self.recent) / len(self.recent)
+        steady = max(self.recent) - min(self.recent) <= max(self.tolerance * mean, 0.0005)
+        if not steady:
+            return
+        if mean >= self.on_current and not self.ready.is_set():
+            self._settled("ready", self.ready, self.off)
+        elif max(self.recent) <= self.off_current and not self.off.is_set():
+            self._settled("off", self.off, self.ready)
+
+    def _settled(self, event: str, reached: threading.Event, left: threading.Event):
+        # The settle time is measured from the expected switch command, or from the previous state change
+        self.settle_time = time.perf_counter() - self.switched_at
+        self.switched_at = time.perf_counter()
+        left.clear()
+        reached.set()
+        self._notify(event)
+
+    def _short_circuit(self, current: float):
+        try:
+            self.alim.set_output(self.channel, False)
+        finally:
+            self.fault = f"Court-circuit sur la voie {self.channel} de l'alimentation : {current:.3f} A, sortie coupée."
+            self.ready.clear()
+            self.off.set()
+            self.stop_event.set()
+            self._notify("fault")
+
+    def _notify(self, event: str):
+        for listener in list(self.listeners):
+            try:
+                listener(event, self)
+            except Exception as e:
+                print(f"Erreur dans un observateur de l'alimentation : {e}")
+
+    # Sequencing
+    def expect_on(self):
+        """Call right before the command powering the DUT."""
+        self._expect(self.ready)
+
+    def expect_off(self):
+        """Call right before the command switching the DUT off."""
+        self._expect(self.off)
+
+    def _expect(self, event: threading.Event):
+        self.settle_time = None
+        self.peak_current = 0.0
+        self.recent.clear()
+        self.switched_at = time.perf_counter()
+        event.clear()
+
+    def wait_ready(self, timeout: float, check: Optional[Callable] = None) -> float:
+        """Wait for the DUT to be ready and return the settle time (s). Raise PowerFault or TimeoutError."""
+        return self._wait(self.ready, timeout, "prêt", check)
+
+    def wait_off(self, timeout: float, check: Optional[Callable] = None) -> float:
+        """Wait for the DUT to be off and return the time it took (s). Raise PowerFault or TimeoutError."""
+        return self._wait(self.off, timeout, "éteint", check)
+
+    def _wait(self, event: threading.Event, timeout: float, label: str, check: Optional[Callable]):
+        # check (config.cancel_token.check) keeps the wait interruptible by the Stop button
+        deadline = time.monotonic() + timeout
+        while not event.is_set() and not self.fault:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if check:
+                check()
+            event.wait(min(self.poll_period, remaining))
+        if self.fault:
+            raise PowerFault(self.fault)
+        if not event.is_set():
+            raise TimeoutError(f"DUT non {label} après {timeout:g} s (courant {self.current:.4f} A).")
+        return self.settle_time if self.settle_time is not None else 0.0
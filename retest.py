@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Retest des étapes en échec
+Après un DUT NOK (mauvais contact, carte mal placée), le retest reprend le même device_under_test : s01 ne refait
+ni les lectures en base ni la création du DUT et réutilise les instruments déjà ouverts, les étapes déjà réussies
+et indépendantes des autres (ORDER_INDEPENDENT) ne sont pas rejouées. L'historique des tentatives est conservé
+dans le résumé des étapes du DUT.
+"""
+
+
+class RetestSession:
+    """A NOK DUT that can be retested: its record, the context it was tested with and the summary of its steps."""
+    def __init__(self, device_under_test_id: int, key: tuple, context: dict, step_summary: dict, duration: float, attempt: int = 1):
+        self.device_under_test_id = device_under_test_id
+        self.key = key  # config.retest_key() of the DUT: a retest is only possible with the same arguments
+        self.context = context  # Context returned by load_test_context (config file, config items...)
+        self.step_summary = step_summary  # step name -> {"status", "duration_s", "rank", "attempt", "previous"}
+        self.duration = duration  # Test time of the previous attempts (s)
+        self.attempt = attempt  # Number of the last attempt
+
+    def matches(self, key: tuple) -> bool:
+        return key == self.key
+
+    def passed(self, step_name: str) -> bool:
+        return self.step_summary.get(step_name, {}).get("status") == 0
+
+    def steps_to_rerun(self, step_names, order_independent) -> set:
+        """Return the indices of the steps to run again: the failed or not run steps, and every step that is not
+        ORDER_INDEPENDENT (s01 powers the DUT again, fin_du_test cleans up, other steps may depend on them)."""
+        return {idx for idx, name in enumerate(step_names) if idx not in order_independent or not self.passed(name)}
+
+    def merge(self, step_summary: dict, attempt: int) -> dict:
+        """Return the summary of the DUT after this attempt: the steps run now replace their previous result, kept
+        in their "previous" list, the steps carried over keep theirs."""
+        merged = {name: dict(entry) for name, entry in self.step_summary.items()}
+        for name, entry in step_summary.items():
+            entry = dict(entry, attempt=attempt)
+            previous = merged.get(name)
+            if previous is not None:
+                entry["previous"] = previous.pop("previous", []) + [previous]
+            merged[name] = entry
+        return merged
+
+    def next_attempt(self, step_summary: dict, duration: float) -> "RetestSession":
+        """Session of the DUT if this attempt is NOK too."""
+        return RetestSession(self.device_under_test_id, self.key, self.context, step_summary, self.duration + duration, self.attempt + 1)
+
+    def describe(self) -> str:
+        failed = [name for name, entry in self.step_summary.items() if entry.get("status") != 0]
+        return f"DUT {self.device_under_test_id}, tentative {self.attempt + 1}, étapes à reprendre : {', '.join(failed) or 'aucune'}"
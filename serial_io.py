@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur d'entrées/sorties série
+Un thread par port d'instrument (patch, cible, multimètre, alimentation) exécute les commandes de sa file
+et rend les réponses par des Future : une étape peut interroger plusieurs ports en même temps. Entre deux
+commandes, les lignes émises spontanément par l'instrument sont lues et conservées dans un buffer circulaire.
+"""
+
+import functools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from typing import Callable, Optional
+
+import cancellation  # Custom
+
+_STOP = object()
+
+
+class PortWorker:
+    """Thread owning one instrument: runs the queued calls in order and captures the unsolicited lines."""
+    def __init__(self, name: str, instrument, idle_poll: float = 0.02, capacity: int = 256):
+        self.name = name
+        self.instrument = instrument
+        self.idle_poll = idle_poll
+        self.methods = {}  # Method name -> callable before routing (recorder, tracer and cancellation wrappers included)
+        self.queue = queue.Queue()
+        self.unsolicited = deque(maxlen=capacity)  # (time.time(), line)
+        self.partial = b""  # Start of an unsolicited line whose end has not been received yet
+        self.listeners = []  # Callables (port name, line) notified of each unsolicited line, from the worker thread
+        self.closed = False
+        self.read_error: Optional[str] = None  # Error of the last read, polling is suspended until a command succeeds
+        self.thread = threading.Thread(target=self._loop, name=f"serial-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, method_name: str, *args, **kwargs) -> Future:
+        """Queue a call of an instrument method and return the Future of its result."""
+        future = Future()
+        self.queue.put((future, method_name, args, kwargs))
+        return future
+
+    def stop(self):
+        self.queue.put(_STOP)
+
+    def _loop(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_poll)
+            except queue.Empty:
+                if self.read_error is None:
+                    self._read_unsolicited()
+                continue
+            if item is _STOP:
+                break
+            future, method_name, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            # Lines received since the last command are not the response of this one
+            if self.read_error is None:
+                self._read_unsolicited()
+            method = self.methods.get(method_name) or getattr(self.instrument, method_name)
+            if method_name == "close":
+                self.closed = True  # Later calls run on the caller thread
+            try:
+                future.set_result(method(*args, **kwargs))
+                self.read_error = None  # The port answers again
+            except BaseException as e:
+                future.set_exception(e)
+            if self.closed:
+                break
+        # Calls queued after the close or the stop are not run
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item[0].set_exception(RuntimeError(f"Le port {self.name} est fermé."))
+
+    def _read_unsolicited(self):
+        """Read the bytes already received, without waiting: a line without its end is completed by a later read
+        instead of blocking the next queued command for the serial timeout."""
+        ser = getattr(self.instrument, "ser", None)
+        try:
+            while ser is not None and getattr(ser, "is_open", False) and getattr(ser, "in_waiting", 0):
+                *lines, self.partial = (self.partial + ser.read(ser.in_waiting)).split(b"\n")
+                for raw in lines:
+                    line = raw.decode(errors="replace").strip()
+                    if not line:
+                        continue
+                    self.unsolicited.append((time.time(), line))
+                    for listener in list(self.listeners):
+                        listener(self.name, line)
+        except Exception as e:  # Port closed or unplugged: reported once, the next command reports the error
+            if self.read_error is None:
+                print(f"Erreur de lecture sur le port {self.name} : {e}")
+            self.read_error = str(e)
+
+
+class SerialIoEngine:
+    """One PortWorker per registered instrument.
+
+    attach() routes the given methods of an instrument through its worker: existing code calling
+    config.alim.set_output(...) is unchanged and waits for the result, while submit() returns a Future so that
+    a step can drive several ports at once. Waiting callers are released as soon as a stop is requested.
+    """
+    def __init__(self, cancel_token: Optional[cancellation.CancellationToken] = None, enabled: bool = True):
+        self.cancel_token = cancel_token
+        self.enabled = enabled
+        self.workers = {}  # Instrument name -> PortWorker
+        self.listeners = []  # Callables (port name, line), added to every worker
+
+    def attach(self, instrument, name: str, methods=("send_command",)):
+        """Give the instrument its own worker thread and route its methods (and close) through it."""
+        if not self.enabled or instrument is None or getattr(instrument, "_serial_worker", None):
+            return instrument
+        previous = self.workers.get(name)
+        if previous is not None:
+            previous.stop()
+        worker = self.workers[name] = PortWorker(name, instrument)
+        worker.listeners.extend(self.listeners)
+        for method_name in tuple(methods) + ("close",):
+            method = getattr(instrument, method_name, None)
+            if method is not None and method_name not in worker.methods:
+                worker.methods[method_name] = method
+                setattr(instrument, method_name, self._route(worker, method, method_name))
+        instrument._serial_worker = worker
+        return instrument
+
+    def _route(self, worker: PortWorker, method: Callable, method_name: str):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Nested calls (meas() calling send_command()) are already on the worker thread
+            if worker.closed or threading.current_thread() is worker.thread or not worker.thread.is_alive():
+                return method(*args, **kwargs)
+            return self.result(worker.submit(method_name, *args, **kwargs))
+        return wrapper
+
+    def submit(self, name: str, method_name: str, *args, **kwargs) -> Future:
+        """Queue a call on the instrument registered as name and return its Future."""
+        return self.workers[name].submit(method_name, *args, **kwargs)
+
+    def result(self, future: Future, timeout: Optional[float] = None):
+        """Wait for a Future, raising cancellation.TestCancelled as soon as a stop is requested."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.cancel_token is not None:
+                self.cancel_token.check()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("Pas de réponse de l'instrument dans le délai imparti.")
+            done, _ = wait([future], timeout=0.01 if remaining is None else min(0.01, remaining))
+            if done:
+                return future.result()
+
+    def gather(self, *futures: Future, timeout: Optional[float] = None):
+        """Wait for several Futures (e.g. a supply readback, a multimeter reading and a patch command) and return their results."""
+        return [self.result(future, timeout) for future in futures]
+
+    def unsolicited(self, name: str, clear: bool = True):
+        """Return the unsolicited lines [(time, line)] captured on a port (and clear them)."""
+        worker = self.workers.get(name)
+        if worker is None:
+            return []
+        lines = list(worker.unsolicited)
+        if clear:
+            worker.unsolicited.clear()
+        return lines
+
+    def close(self):
+        """Stop the worker threads (the instruments themselves are closed by their owner)."""
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Enregistrement et rejeu des sessions série
+Capture chaque échange commande/réponse des instruments dans une trace compacte par DUT (JSON lines gzip),
+puis rejoue ces traces à la vitesse enregistrée ou aussi vite que possible.
+
+Exemples :
+    python serial_replay.py traces/ --output rejeu.json
+    python serial_replay.py traces/dut_1234.jsonl.gz --realtime
+"""
+
+import argparse
+import functools
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Optional
+import simulation  # Custom
+
+TRACE_VERSION = 1
+
+
+class ReplayMismatchError(RuntimeError):
+    """Raised when the replayed code sends a command that differs from the recorded one."""
+
+
+class SerialRecorder:
+    """Records the command/response pairs of the registered instruments for the current DUT."""
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.exchanges = []
+        self.origin = time.perf_counter()
+
+    def start(self):
+        """Start a new DUT session."""
+        with self.lock:
+            self.exchanges = []
+            self.origin = time.perf_counter()
+
+    def attach(self, obj, name: str, methods=("send_command",)):
+        """Wrap the given methods of an instrument instance so that each exchange is recorded."""
+        if obj is None or getattr(obj, "_recorded_methods", None):
+            return obj
+        obj._recording_depth = 0
+        for method_name in methods:
+            method = getattr(obj, method_name, None)
+            if method is not None:
+                setattr(obj, method_name, self._wrap(obj, method, name, method_name))
+        obj._recorded_methods = tuple(methods)
+        return obj
+
+    def _wrap(self, obj, method, name, method_name):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Nested calls (e.g. meas() calling send_command()) are recorded once, at the outer level
+            if not self.enabled or obj._recording_depth:
+                return method(*args, **kwargs)
+            obj._recording_depth += 1
+            start = time.perf_counter()
+            response, error = None, None
+            try:
+                response = method(*args, **kwargs)
+                return response
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                obj._recording_depth -= 1
+                exchange = {
+                    "t": round(start - self.origin, 6),
+                    "i": name,
+                    "m": method_name,
+                    "c": args[0] if args and isinstance(args[0], str) else "",
+                    "r": response if isinstance(response, (str, int, float, bool)) or response is None else str(response),
+                    "d": round(time.perf_counter() - start, 6),
+                }
+                if error is not None:
+                    exchange["e"] = error
+                with self.lock:
+                    self.exchanges.append(exchange)
+        return wrapper
+
+    def save(self, directory: str, device_under_test_id, result: Optional[int] = None) -> Optional[str]:
+        """Write the current session to directory/dut_<id>.jsonl.gz and return its path."""
+        with self.lock:
+            exchanges = list(self.exchanges)
+        if not exchanges:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"dut_{device_under_test_id}.jsonl.gz")
+        header = {"version": TRACE_VERSION, "device_under_test_id": device_under_test_id, "date": datetime.now().isoformat(timespec="seconds"), "result": result}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False, separators=(",", ":")) + "\n")
+            for exchange in exchanges:
+                f.write(json.dumps(exchange, ensure_ascii=False, separators=(",", ":")) + "\n")
+        return path
+
+
+def load_trace(path: str):
+    """Return (header, exchanges) of a trace file."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(f"Version de trace non supportée : {header.get('version')}")
+        exchanges = [json.loads(line) for line in f if line.strip()]
+    return header, exchanges
+
+
+class ReplayInstrument(simulation.SimulatedInstrument):
+    """Simulated instrument answering with the responses recorded for it, in order."""
+    def __init__(self, bench, name, exchanges, realtime: bool = False):
+        simulation.SimulatedInstrument.__init__(self, bench, name)
+        self.exchanges = deque(exchanges)
+        self.realtime = realtime
+        self.mismatches = []  # Divergences from the recording, kept even when a step catches the ReplayMismatchError
+
+    def _mismatch(self, message):
+        self.mismatches.append(message)
+        return ReplayMismatchError(message)
+
+    def _next(self, method_name, command):
+        if not self.exchanges:
+            raise self._mismatch(f"{self.name} : plus d'échange enregistré pour {method_name}({command!r})")
+        exchange = self.exchanges.popleft()
+        if exchange["m"] != method_name or exchange["c"] != command:
+            raise self._mismatch(f"{self.name} : {method_name}({command!r}) envoyé, {exchange['m']}({exchange['c']!r}) enregistré")
+        if self.realtime:
+            time.sleep(exchange["d"])
+        if "e" in exchange:
+            raise RuntimeError(exchange["e"])
+        return exchange["r"]
+
+    def _call(self, method_name, command=""):
+        start = time.perf_counter()
+        response = self._next(method_name, command)
+        self.commands += 1
+        self.bytes_out += len(command.encode())
+        self.bytes_in += len(str(response).encode()) + 2 if response is not None else 0
+        self.latencies.append(time.perf_counter() - start)
+        return response
+
+    def send_command(self, command, expected_response=None, timeout=None):
+        return self._call("send_command", command)
+
+    def meas(self):
+        return self._call("meas")
+
+    def identification(self):
+        return self._call("identification")
+
+    def set_output(self, channel, state):
+        return self._call("set_output")
+
+    def set_voltage(self, channel, value):
+        return self._call("set_voltage")
+
+    def set_current(self, channel, value):
+        return self._call("set_current")
+
+    def set_tracking_mode(self, mode):
+        return self._call("set_tracking_mode")
+
+
+class ReplayBench(simulation.SimulatedBench):
+    """Same interface as SimulatedBench, with instruments fed from one recorded DUT session."""
+    def __init__(self, exchanges, realtime: bool = False):
+        simulation.SimulatedBench.__init__(self)
+        by_instrument = defaultdict(list)
+        for exchange in exchanges:
+            by_instrument[exchange["i"]].append(exchange)
+        self.patch = ReplayInstrument(self, "patch", by_instrument["patch"], realtime)
+        self.target = ReplayInstrument(self, "target", by_instrument["target"], realtime)
+        self.multimeter = ReplayInstrument(self, "multimeter", by_instrument["multimeter"], realtime)
+        self.alim = ReplayInstrument(self, "alim", by_instrument["alim"], realtime)
+
+    @property
+    def mismatches(self):
+        return [message for instrument in self.instruments for message in instrument.mismatches]
+
+
+def main_replay():
+    parser = argparse.ArgumentParser(description="Rejeu de sessions série enregistrées à travers la séquence de test")
+    parser.add_argument("traces", nargs="+", help="Fichiers .jsonl.gz ou dossiers de traces")
+    parser.add_argument("--realtime", action="store_true", help="Rejouer à la vitesse enregistrée")
+    parser.add_argument("--output", default="", help="Fichier JSON de résultats du benchmark de rejeu")
+    args = parser.parse_args()
+
+    paths = []
+    for item in args.traces:
+        paths.extend(sorted(glob.glob(os.path.join(item, "*.jsonl.gz"))) if os.path.isdir(item) else [item])
+    if not paths:
+        print("Aucune trace trouvée.")
+        sys.exit(1)
+
+    import benchmark  # Custom
+    sessions = [load_trace(path) for path in paths]
+    mismatches = 0
+    benchmark_args = benchmark.default_args(cycles=len(sessions), no_sleep=not args.realtime)
+    benches = [ReplayBench(exchanges, args.realtime) for _, exchanges in sessions]
+    result = benchmark.run_benchmark(benchmark_args, benches=benches)
+    for path, (header, _), bench, verdict in zip(paths, sessions, benches, result["verdicts"]):
+        # A divergent command fails its step, which may not change a verdict already NOK: both are reported
+        diverged = bench.mismatches
+        if diverged:
+            print(f"❌ {os.path.basename(path)} : {diverged[0]}" + (f" (+{len(diverged) - 1} autre(s))" if len(diverged) > 1 else ""))
+        if header.get("result") is not None and header["result"] != verdict:
+            diverged = True
+            print(f"❌ {os.path.basename(path)} : verdict enregistré {header['result']}, verdict rejoué {verdict}")
+        if diverged:
+            mismatches += 1
+    print(f"{len(sessions)} sessions rejouées, temps de cycle p50={result['cycle_time_s']['p50']:.4f}s p95={result['cycle_time_s']['p95']:.4f}s, {mismatches} écart(s)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main_replay()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated bench
+In-memory database and serial instruments used to run the step pipeline headless (benchmark, replay).
+"""
+
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+
+class SimulatedDatabase:
+    """In-memory stand-in for GenericDatabaseManager that counts round trips and can add a fixed latency."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables = defaultdict(dict)
+        self.next_ids = defaultdict(lambda: 1)
+        self.round_trips = defaultdict(int)  # (method, table) -> count
+        self.connected = False
+        self.lock = threading.Lock()  # The pipelined mode creates rows from a second thread
+
+    def _round_trip(self, method, table):
+        self.round_trips[(method, table)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def seed(self, table, row):
+        """Insert a row with a fixed id without counting it as a round trip."""
+        row = dict(row)
+        self.tables[table][int(row["id"])] = row
+        self.next_ids[table] = max(self.next_ids[table], int(row["id"]) + 1)
+
+    def create(self, table, data):
+        self._round_trip("create", table)
+        with self.lock:
+            row_id = self.next_ids[table]
+            self.next_ids[table] += 1
+            self.tables[table][row_id] = {"id": row_id, **data}
+        return row_id
+
+    def get_by_id(self, table, row_id):
+        self._round_trip("get_by_id", table)
+        row = self.tables[table].get(int(row_id))
+        return dict(row) if row else None
+
+    def get_by_column(self, table, column, value):
+        self._round_trip("get_by_column", table)
+        return [dict(row) for row in self.tables[table].values() if str(row.get(column)) == str(value)]
+
+    def update_by_id(self, table, row_id, data):
+        self._round_trip("update_by_id", table)
+        row = self.tables[table].get(int(row_id))
+        if row is None:
+            return False
+        row.update(data)
+        return True
+
+    def reset_counters(self):
+        self.round_trips.clear()
+
+
+def seed_database(db: SimulatedDatabase, config_json_path: str, config_json_name: str, product_list_id: str, operator_name: str):
+    """Fill the simulated database with the rows s01 looks up for a product."""
+    with open(config_json_path, "rb") as f:
+        config_file = f.read()
+    db.seed("operator", {"id": 1, "name": operator_name.split()[1], "first_name": operator_name.split()[0]})
+    db.seed("product_list", {"id": int(product_list_id), "bench_composition_id": 1, "parameters_group_id": 1, "info": "simulation"})
+    db.seed("bench_composition", {"id": 1, "external_device_id": 1})
+    db.seed("external_device", {"id": 1, "name": "Simulation"})
+    db.seed("script", {"id": int(product_list_id), "name": "simulation"})
+    db.seed("parameters_group", {"id": 1, "parameters_group_id": 1, "parameters_id": 1})
+    db.seed("parameters", {"id": 1, "name": config_json_name, "file": config_file})
+
+
+class SimulatedPort:
+    """Mimics the pyserial object exposed as `ser` by SerialInstrumentManager."""
+    def __init__(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def cancel_read(self):
+        pass
+
+
+class SimulatedInstrument:
+    """Base class for simulated serial instruments: counts bytes and command latency."""
+    idn = ""
+
+    def __init__(self, bench: "SimulatedBench", name: str, latency: float = 0.0):
+        self.bench = bench
+        self.name = name
+        self.port = f"SIM_{name.upper()}"
+        self.latency = latency
+        self.ser = SimulatedPort()
+        self.commands = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latencies = []
+
+    def respond(self, command: str) -> str:
+        return ""
+
+    def send_command(self, command, expected_response=None, timeout=None):
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        response = self.respond(command)
+        self.commands += 1
+        self.bytes_out += len(command.encode())
+        self.bytes_in += len(response.encode()) + 2
+        self.latencies.append(time.perf_counter() - start)
+        return response
+
+    def identification(self):
+        return self.send_command("*IDN?\n")
+
+    def open_with_port(self, port):
+        self.ser.is_open = True
+        return True
+
+    def close(self):
+        self.ser.close()
+
+    def reset_counters(self):
+        self.commands = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latencies = []
+
+
+class SimulatedPatch(SimulatedInstrument):
+    idn = "Outil de test antenne patch easy flow (simulation)"
+
+    def respond(self, command):
+        cmd = command.strip()
+        if cmd == "IDN*":
+            return self.idn
+        if cmd.startswith("test power"):
+            self.bench.powered = cmd.endswith("on")
+            self.bench.powered_at = time.perf_counter()
+            return "--> ok"
+        if cmd.startswith("test seuil"):
+            return "--> ok : " + " - ".join(self.bench.values("seuils", [17.0, 18.0, 19.0]))
+        if cmd == "test bf":
+            nominal = {225: [115.0, 60.0], 450: [231.0, 62.0], 810: [415.0, 56.0]}.get(self.bench.txmod, [0.0, 0.0])
+            return "--> ok : " + " - ".join(self.bench.values("bf", nominal))
+        return "--> erreur : commande inconnue"
+
+
+class SimulatedTarget(SimulatedInstrument):
+    idn = "Emetteur easy flow (simulation)"
+
+    def respond(self, command):
+        cmd = command.strip()
+        if cmd == "IDN*":
+            return self.idn
+        if cmd.startswith("set emetteur"):
+            self.bench.emitter = cmd.endswith("on")
+            return "--> ok"
+        if cmd.startswith("set txmod"):
+            self.bench.txmod = int(cmd.split()[-1])
+            return "--> ok"
+        return ""
+
+
+class SimulatedMultimeter(SimulatedInstrument):
+    idn = "MP730424 (simulation)"
+
+    def respond(self, command):
+        if command.startswith("*IDN?"):
+            return self.idn
+        if command.startswith("MEAS"):
+            return self.bench.values("consumption", [0.0072 if self.bench.powered else 0.0])[0]
+        return ""
+
+    def meas(self):
+        return self.send_command("MEAS?\n")
+
+
+class SimulatedAlim(SimulatedInstrument):
+    idn = "RSD3305P (simulation)"
+
+    def respond(self, command):
+        if command.startswith("*IDN?"):
+            return self.idn
+        if command.startswith("VOUT"):
+            return "12.00"
+        if command.startswith("IOUT"):
+            # DUT current with an inrush decaying in about 50 ms after "test power on"
+            if not self.bench.powered:
+                return "0.0000"
+            return f"{0.0072 + 0.08 * math.exp(-(time.perf_counter() - self.bench.powered_at) / 0.01):.4f}"
+        return ""
+
+    def set_output(self, channel, state):
+        self.send_command(f"OUT{channel}:{int(state)}")
+
+    def set_voltage(self, channel, value):
+        self.send_command(f"VSET{channel}:{value}")
+
+    def set_current(self, channel, value):
+        self.send_command(f"ISET{channel}:{value}")
+
+    def set_tracking_mode(self, mode):
+        self.send_command(f"TRACK{mode}")
+
+
+class SimulatedBench:
+    """Shared state of the simulated fixture (DUT power, emitter, txmod) and its instruments."""
+    def __init__(self, serial_latency: float = 0.0, fail_rate: float = 0.0, noise: float = 0.0, seed: Optional[int] = None):
+        self.powered = False
+        self.powered_at = 0.0
+        self.emitter = False
+        self.txmod = 0
+        self.fail_rate = fail_rate
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.patch = SimulatedPatch(self, "patch", serial_latency)
+        self.target = SimulatedTarget(self, "target", serial_latency)
+        self.multimeter = SimulatedMultimeter(self, "multimeter", serial_latency)
+        self.alim = SimulatedAlim(self, "alim", serial_latency)
+
+    @property
+    def instruments(self):
+        return [self.patch, self.target, self.multimeter, self.alim]
+
+    def values(self, kind, nominal):
+        """Return formatted measurements around nominal, pushed far out of range with probability fail_rate."""
+        out = []
+        for value in nominal:
+            if self.noise:
+                value += self.random.gauss(0.0, self.noise * abs(value))
+            if self.fail_rate and self.random.random() < self.fail_rate:
+                value *= 10
+            out.append(f"{value:g}")
+        return out
+
+    def install(self, config):
+        """Attach the simulated instruments to config so that s01 skips the real instrument initialisation."""
+        for instrument in self.instruments:
+            instrument.ser.is_open = True
+        config.serial_patch_easy_flow = self.patch  # type: ignore[assignment]
+        config.serial_target_capsys = self.target  # type: ignore[assignment]
+        config.multimeter_current = self.multimeter  # type: ignore[assignment]
+        config.alim = self.alim  # type: ignore[assignment]
+
+
+class SimulatedPrinter:
+    """Stand-in for PrinterDC that only counts the tickets it would print."""
+    def __init__(self):
+        self.connected = True
+        self.printed = 0
+
+    def custom_print_bdt(self, *args, **kwargs):
+        self.printed += 1
+
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Maîtrise statistique des procédés (SPC)
+Statistiques glissantes par clé de mesure (moyenne/variance de Welford, EWMA, règles Western Electric),
+en mémoire constante par clé, pour signaler une dérive avant que les mesures ne sortent des limites.
+"""
+
+import json
+import math
+import os
+from collections import deque
+from typing import Optional
+
+
+class KeyStatistics:
+    """Running statistics of one measurement key. Memory is constant: the rules only need the last 8 points."""
+    __slots__ = ("count", "mean", "m2", "ewma", "recent")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, ewma=None, recent=()):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.ewma = ewma
+        self.recent = deque(recent, maxlen=8)  # z-scores of the last points
+
+    @property
+    def sigma(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def add(self, value):
+        """Welford update of mean and variance."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "ewma": self.ewma, "recent": list(self.recent)}
+
+
+def western_electric(recent):
+    """Return the Western Electric rules broken by the last point of recent (z-scores, oldest first)."""
+    z = list(recent)
+    rules = []
+    if abs(z[-1]) > 3:
+        rules.append("WE1 : un point au-delà de 3σ")
+    for sign in (1, -1):
+        if len(z) >= 3 and sum(1 for v in z[-3:] if v * sign > 2) >= 2 and z[-1] * sign > 2:
+            rules.append("WE2 : 2 points sur 3 au-delà de 2σ du même côté")
+        if len(z) >= 5 and sum(1 for v in z[-5:] if v * sign > 1) >= 4 and z[-1] * sign > 1:
+            rules.append("WE3 : 4 points sur 5 au-delà de 1σ du même côté")
+        if len(z) >= 8 and all(v * sign > 0 for v in z[-8:]):
+            rules.append("WE4 : 8 points consécutifs du même côté de la moyenne")
+    return rules
+
+
+class SpcEngine:
+    """Per-key SPC state, updated with every saved measurement.
+
+    Rules are evaluated against the baseline built from the previous in-specification measurements
+    (at least min_samples of them). The EWMA is also compared with the specification: a warning is raised
+    when it enters the outer guard_band fraction of the [min, max] interval.
+    """
+    def __init__(self, path: Optional[str] = None, min_samples: int = 30, ewma_lambda: float = 0.2, guard_band: float = 0.1):
+        self.path = path
+        self.min_samples = min_samples
+        self.ewma_lambda = ewma_lambda
+        self.guard_band = guard_band
+        self.keys = {}
+        self.pending = []
+        self.load()
+
+    def update(self, key: str, value: float, lsl: Optional[float] = None, usl: Optional[float] = None):
+        """Add a measurement and return the list of warnings it raises."""
+        stats = self.keys.get(key)
+        if stats is None:
+            stats = self.keys[key] = KeyStatistics()
+        warnings = []
+
+        stats.ewma = value if stats.ewma is None else self.ewma_lambda * value + (1 - self.ewma_lambda) * stats.ewma
+        if lsl is not None and usl is not None and usl > lsl:
+            band = (usl - lsl) * self.guard_band
+            if stats.ewma > usl - band:
+                warnings.append(f"{key} : dérive vers la limite haute (EWMA={stats.ewma:.6g}, max={usl:g})")
+            elif stats.ewma < lsl + band:
+                warnings.append(f"{key} : dérive vers la limite basse (EWMA={stats.ewma:.6g}, min={lsl:g})")
+
+        if stats.count >= self.min_samples and stats.sigma > 0:
+            stats.recent.append((value - stats.mean) / stats.sigma)
+            rules = western_electric(stats.recent)
+            if rules:
+                warnings.append(f"{key} : {' ; '.join(rules)} ({value:g}, moyenne={stats.mean:.6g}, σ={stats.sigma:.3g})")
+
+        # Out of specification values (bad contact, failed board) must not widen the baseline
+        in_spec = (lsl is None or value >= lsl) and (usl is None or value <= usl)
+        if in_spec:
+            stats.add(value)
+        self.pending.extend(warnings)
+        return warnings
+
+    def drain(self):
+        """Return and clear the warnings raised since the last call."""
+        warnings, self.pending = self.pending, []
+        return warnings
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.keys = {key: KeyStatistics(**state) for key, state in json.load(f).items()}
+        except (OSError, ValueError, TypeError) as e:
+            print(f"État SPC illisible, il est réinitialisé : {e}")
+            self.keys = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({key: stats.to_dict() for key, stats in self.keys.items()}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Budget de temps des étapes
+Chaque étape a un budget (TIME_BUDGET = (souple, dur) en secondes, à côté de get_info(), ou BUDGETS_TEMPS dans
+config.json) : un chien de garde signale en direct le dépassement du budget souple et, au-delà du budget dur,
+demande l'annulation coopérative de l'étape. La durée réelle de chaque étape est comparée à son budget pour
+planifier le temps de cycle.
+
+Exemple :
+    python step_budget.py
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import cancellation  # Custom
+
+
+@dataclass(frozen=True, slots=True)
+class StepBudget:
+    """Time budget of a step (s): soft is reported, hard cancels the step."""
+    soft: float
+    hard: float
+
+    @classmethod
+    def from_value(cls, name: str, value) -> "StepBudget":
+        """Validate a (soft, hard) pair or a {"soft", "hard"} object. Raises ValueError."""
+        if isinstance(value, dict):
+            value = (value.get("soft"), value.get("hard"))
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise ValueError(f"{name} : budget attendu sous la forme [souple, dur] ou {{\"soft\", \"hard\"}}.")
+        for field, v in zip(("soft", "hard"), value):
+            if isinstance(v, bool) or not isinstance(v, (int, float)) or v <= 0:
+                raise ValueError(f"{name}.{field} doit être un nombre de secondes positif, {v!r} trouvé.")
+        if value[0] > value[1]:
+            raise ValueError(f"{name} : budget souple ({value[0]:g} s) supérieur au budget dur ({value[1]:g} s).")
+        return cls(float(value[0]), float(value[1]))
+
+
+DEFAULT_BUDGET = StepBudget(60.0, 300.0)  # Steps that declare nothing
+
+
+class StepWatchdog:
+    """Background thread checking the elapsed time of the armed step.
+
+    Listeners (event, step name, elapsed, budget) are called from the watchdog thread with "soft" when the soft
+    budget is exceeded and "hard" when the hard one is, after cancel_token.cancel() has been called. A step armed
+    with enforce=False (fin_du_test) is only reported.
+    """
+    def __init__(self, cancel_token: cancellation.CancellationToken, period: float = 0.1):
+        self.cancel_token = cancel_token
+        self.period = period
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.step_name: Optional[str] = None
+        self.budget = DEFAULT_BUDGET
+        self.enforce = True
+        self.started_at = 0.0
+        self.overrun: Optional[str] = None  # None, "soft" or "hard" for the armed step
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def arm(self, step_name: str, budget: StepBudget, enforce: bool = True):
+        with self.lock:
+            self.step_name = step_name
+            self.budget = budget
+            self.enforce = enforce
+            self.started_at = time.perf_counter()
+            self.overrun = None
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="step-watchdog", daemon=True)
+            self.thread.start()
+
+    def disarm(self) -> Optional[str]:
+        """Stop watching the step and return its overrun (None, "soft" or "hard"). After this call the watchdog
+        no longer cancels anything."""
+        with self.lock:
+            self.step_name = None
+            return self.overrun
+
+    def stop(self):
+        self.disarm()
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.period):
+            with self.lock:
+                if self.step_name is None:
+                    continue
+                elapsed = time.perf_counter() - self.started_at
+                events = []
+                if self.overrun is None and elapsed > self.budget.soft:
+                    self.overrun = "soft"
+                    events.append("soft")
+                if self.enforce and self.overrun == "soft" and elapsed > self.budget.hard:
+                    self.overrun = "hard"
+                    events.append("hard")
+                    # Under the lock: a disarmed step is never cancelled
+                    self.cancel_token.cancel()
+                step_name, budget = self.step_name, self.budget
+            for event in events:
+                self._notify(event, step_name, elapsed, budget)
+
+    def _notify(self, event: str, step_name: str, elapsed: float, budget: StepBudget):
+        for listener in list(self.listeners):
+            try:
+                listener(event, step_name, elapsed, budget)
+            except Exception as e:
+                print(f"Erreur dans un observateur du chien de garde : {e}")
+
+
+class BudgetStatistics:
+    """Actual duration of one step for one product, compared with its budget."""
+    __slots__ = ("count", "mean", "m2", "maximum", "soft_overruns", "hard_overruns", "budget")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, maximum=0.0, soft_overruns=0, hard_overruns=0, budget=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.maximum = maximum
+        self.soft_overruns = soft_overruns
+        self.hard_overruns = hard_overruns
+        self.budget = budget  # [soft, hard] of the last run
+
+    @property
+    def sigma(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def add(self, duration: float, overrun: Optional[str], budget: StepBudget):
+        self.count += 1
+        delta = duration - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (duration - self.mean)
+        self.maximum = max(self.maximum, duration)
+        self.soft_overruns += overrun is not None
+        self.hard_overruns += overrun == "hard"
+        self.budget = [budget.soft, budget.hard]
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "maximum": self.maximum,
+                "soft_overruns": self.soft_overruns, "hard_overruns": self.hard_overruns, "budget": self.budget}
+
+
+class BudgetTracker:
+    """Per-product budget statistics of the steps, persisted in a local JSON file."""
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.products = {}  # product -> step name -> BudgetStatistics
+        self.load()
+
+    def update(self, product, step_name: str, duration: float, overrun: Optional[str], budget: StepBudget):
+        steps = self.products.setdefault(str(product), {})
+        stats = steps.get(step_name)
+        if stats is None:
+            stats = steps[step_name] = BudgetStatistics()
+        stats.add(duration, overrun, budget)
+
+    def report(self):
+        """Return the budget vs actual table, one line per product and step. The suggested soft budget is
+        mean + 3σ of the actual durations."""
+        lines = []
+        for product, steps in sorted(self.products.items()):
+            lines.append(f"Produit {product}")
+            for step_name, s in steps.items():
+                budget = f"{s.budget[0]:g}/{s.budget[1]:g} s" if s.budget else "-"
+                lines.append(
+                    f"  {step_name} : budget {budget}, réel moyen {s.mean:.2f} s (σ {s.sigma:.2f}, max {s.maximum:.2f}) "
+                    f"sur {s.count}, dépassements {s.soft_overruns} souples / {s.hard_overruns} durs, "
+                    f"budget souple conseillé {s.mean + 3 * s.sigma:.1f} s")
+        return lines
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.products = {
+                    product: {name: BudgetStatistics(**state) for name, state in steps.items()}
+                    for product, steps in json.load(f).items()
+                }
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Statistiques de budget illisibles, elles sont réinitialisées : {e}")
+            self.products = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({p: {n: s.to_dict() for n, s in steps.items()} for p, steps in self.products.items()}, f)
+        os.replace(tmp_path, self.path)
+
+
+if __name__ == "__main__":
+    import configuration  # Custom
+    tracker = BudgetTracker(os.path.join(configuration.LOG_DIR, f"budget_stats_{configuration.NAME_GUI}.json"))
+    print("\n".join(tracker.report()) or "Aucune statistique de budget.")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Ordre adaptatif des étapes
+Statistiques par produit et par étape (taux d'échec, durée moyenne) pour exécuter en premier les étapes
+indépendantes les plus rapides et les plus susceptibles d'échouer : le test s'arrêtant à la première erreur,
+cet ordre minimise le temps moyen jusqu'au verdict.
+"""
+
+import json
+import os
+from typing import Optional
+
+
+class StepStatistics:
+    """Failure count and mean duration of one step for one product."""
+    __slots__ = ("count", "failures", "mean_duration")
+
+    def __init__(self, count=0, failures=0, mean_duration=0.0):
+        self.count = count
+        self.failures = failures
+        self.mean_duration = mean_duration
+
+    @property
+    def failure_rate(self):
+        """Laplace-smoothed failure probability: 0.5 without history, never exactly 0 or 1."""
+        return (self.failures + 1) / (self.count + 2)
+
+    def add(self, failed: bool, duration: float):
+        self.count += 1
+        self.failures += int(failed)
+        self.mean_duration += (duration - self.mean_duration) / self.count
+
+    def to_dict(self):
+        return {"count": self.count, "failures": self.failures, "mean_duration": self.mean_duration}
+
+
+class StepOrderer:
+    """Per-product step statistics, persisted in a local JSON file, and the adaptive order derived from them.
+
+    A failure stops the test, so running the order-independent steps by increasing mean_duration / failure_rate
+    minimises the expected time to the verdict. Steps without history keep their position relative to each other
+    and are costed with the mean duration of the known steps.
+    """
+    def __init__(self, path: Optional[str] = None, min_samples: int = 20):
+        self.path = path
+        self.min_samples = min_samples  # Runs of a step before its own statistics are used
+        self.products = {}  # product -> step name -> StepStatistics
+        self.load()
+
+    def statistics(self, product, step_name: str) -> StepStatistics:
+        steps = self.products.setdefault(str(product), {})
+        stats = steps.get(step_name)
+        if stats is None:
+            stats = steps[step_name] = StepStatistics()
+        return stats
+
+    def update(self, product, step_name: str, failed: bool, duration: float):
+        self.statistics(product, step_name).add(failed, duration)
+
+    def order(self, product, step_names):
+        """Return the given step names in the order minimising the expected time to the first failure."""
+        stats = {name: self.products.get(str(product), {}).get(name) for name in step_names}
+        known = [s for s in stats.values() if s is not None and s.count >= self.min_samples]
+        if not known:
+            return list(step_names)
+        default_duration = sum(s.mean_duration for s in known) / len(known)
+
+        def cost(position_name):
+            position, name = position_name
+            s = stats[name]
+            if s is None or s.count < self.min_samples:
+                return default_duration / 0.5, position
+            return s.mean_duration / s.failure_rate, position
+        return [name for _, name in sorted(enumerate(step_names), key=cost)]
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.products = {
+                    product: {name: StepStatistics(**state) for name, state in steps.items()}
+                    for product, steps in json.load(f).items()
+                }
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Statistiques des étapes illisibles, elles sont réinitialisées : {e}")
+            self.products = {}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({product: {name: stats.to_dict() for name, stats in steps.items()} for product, steps in self.products.items()}, f)
+        os.replace(tmp_path, self.path)
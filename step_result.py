@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Résultat d'étape
+Objet passé tel quel par les signaux Qt du thread de test à l'interface, à l'imprimante et à la BDD :
+le retour d'une étape (statut, messages) et ses mesures ne sont mis en forme qu'à l'affichage.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass(slots=True)
+class Measurement:
+    """A value saved by config.save_value during the step."""
+    key: str
+    value: object
+    unit: str = ""
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    record_id: Optional[int] = None  # id of the skvp_float / skvp_char row
+
+    @property
+    def in_limits(self) -> bool:
+        return (self.minimum is None or self.value >= self.minimum) and (self.maximum is None or self.value <= self.maximum)
+
+
+@dataclass(slots=True)
+class StepResult:
+    """Outcome of a step: status (0 OK, 1 NOK, 2 warning), messages, measurements and duration.
+
+    Steps keep returning (status, return_msg): a {"step_name", "infos", ...} dict is split into step_name, infos
+    and details, any other message is kept as text.
+    """
+    status: int
+    step_name: str
+    infos: list = field(default_factory=list)
+    details: dict = field(default_factory=dict)  # Other keys of the returned dict
+    text: Optional[str] = None  # Message of a step returning a string (or of an exception)
+    measurements: list = field(default_factory=list)  # Measurement
+    duration_s: float = 0.0
+
+    @classmethod
+    def from_step(cls, step_name: str, status: int, message) -> "StepResult":
+        if isinstance(message, StepResult):
+            return message
+        if isinstance(message, dict):
+            details = dict(message)
+            name = details.pop("step_name", step_name)
+            infos = details.get("infos")
+            if isinstance(infos, list):
+                del details["infos"]
+            else:
+                infos = []
+            return cls(status, str(name), [str(v) for v in infos], details)
+        return cls(status, step_name, text=str(message))
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 0
+
+    def lines(self):
+        """Lines displayed for the result: the infos if any, otherwise "key : value" of the details, or the text."""
+        if self.text is not None:
+            return self.text.split("\n")
+        if self.infos:
+            return list(self.infos)
+        return [f"{k} : {v}" for k, v in self.details.items()]
+
+    def __str__(self):
+        return "\n".join(self.lines())
+
+    def to_message(self):
+        """Return the message as returned by the step (dict or text)."""
+        if self.text is not None:
+            return self.text
+        return {"step_name": self.step_name, "infos": list(self.infos), **self.details}
+
+    def to_json(self) -> str:
+        """Message as stored in device_under_test.failure_label."""
+        message = self.to_message()
+        return message if isinstance(message, str) else json.dumps(message, ensure_ascii=False, indent=2)
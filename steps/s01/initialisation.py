@@ -12,38 +12,55 @@ from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseMa
 from modules.capsys_serial_instrument_manager.mp730424.multimeter_mp730424 import Mp730424Manager  # Custom
 from modules.capsys_serial_instrument_manager.rsd3305p import alimentation_rsd3305p  # Custom
 from configuration import VERSION, get_project_path
+from power_sequencer import PowerFault  # Custom
+from cancellation import TestCancelled  # Custom
+
+# Supply channel of the fixture, the DUT power sequencing thresholds are in config.json (SEQUENCEMENT_ALIMENTATION)
+POWER_CHANNEL = 2
+POWER_ON_TIMEOUT = 15  # Upper bound of "test power on" and of the wait for the DUT ready, in seconds
+# (soft, hard) time budget in seconds, see step_budget.py: instrument opening and DUT power-up included
+TIME_BUDGET = (30, 90)
 
 def get_info():
     return "Cette étape crée device_under_test, initialise le DAQ, l'alimentation et le MCP23017."    
 
-def init_database_and_checks(log, config: configuration.AppConfig):
-    # Ensure db is initialized
-    if not hasattr(config, "db") or config.db is None:
-        return 1, "config.db n'est pas initialisé."
-    # Checks that all attributes of config.arg are not empty
-    for field, value in vars(config.arg).items():
-        if value is None:
-            return 1, f"Pas de valeur sur {field}"
-
-    # Check operator format
-    if not isinstance(config.arg.operator, str) or len(config.arg.operator.split()) < 2:
-        return (1, "Le champ 'operator' doit contenir au moins un prénom et un nom.")
-
+def detect_fixture(config: configuration.AppConfig):
+    """Return True if a board is in the fixture, False if it is empty, None if the patch is not opened yet (the first
+    DUT is started with the button). Called between two DUT by the armed mode, with the query of config.json
+    (DETECTION_PRESENCE). Raises ValueError if the query is not configured or the reply is neither of the expected ones."""
+    settings = config.configItems.presence_settings
+    if not settings:
+        raise ValueError(f"{configuration.ConfigItems.presence_key} absent de config.json, détection de la carte impossible.")
+    patch = config.serial_patch_easy_flow
+    if patch is None or not getattr(getattr(patch, "ser", None), "is_open", False):
+        return None
+    response = str(patch.send_command(settings["command"], expected_response=settings["present"], timeout=0.5) or "").strip()
+    if response == settings["present"].strip():
+        return True
+    if response == settings["absent"].strip():
+        return False
+    raise ValueError(f"Réponse inattendue du patch à la commande de présence : {response!r}")
+
+def load_test_context(config: configuration.AppConfig, db, product_list_id=None):
+    """Read the operator and the product context (current product by default) from the database.
+    Return (0, context) or (1, error message). Only reads db and config.arg, so that it can run in the DUT
+    preparation and product preload threads."""
+    if product_list_id is None:
+        product_list_id = config.arg.product_list_id
     # Retrieve operator from database
-    operators = config.db.get_by_column("operator", "name", config.arg.operator.split()[1])
+    operators = db.get_by_column("operator", "name", config.arg.operator.split()[1])
     if not operators:
         return 1, f"Aucun opérateur {config.arg.operator.split()[1]} trouvé dans la base de données."
     operator = Operator(**operators[0])
-    operator_id = operator.id
 
     # Retrieve product_list from database
-    config.arg.product_list = config.db.get_by_id("product_list", config.arg.product_list_id)
-    if not config.arg.product_list:
+    product_list = db.get_by_id("product_list", product_list_id)
+    if not product_list:
         return 1, "Aucun produit trouvé dans la base de données."
 
     # Retrieve bench_composition from database
-    bench_composition_id = config.arg.product_list.get("bench_composition_id")
-    bench_composition_raw = config.db.get_by_column("bench_composition", "id", bench_composition_id)
+    bench_composition_id = product_list.get("bench_composition_id")
+    bench_composition_raw = db.get_by_column("bench_composition", "id", bench_composition_id)
     bench_composition = bench_composition_raw if bench_composition_raw else []
     if not bench_composition:
         return (1, "Problème lors de la récupération de la composition du banc dans la base de données.")
@@ -51,14 +68,14 @@ def init_database_and_checks(log, config: configuration.AppConfig):
     # Retrieve all externals devices from database
     external_devices = []
     for external_device in bench_composition:
-        external_device_data = config.db.get_by_id("external_device", external_device["external_device_id"])
+        external_device_data = db.get_by_id("external_device", external_device["external_device_id"])
         if external_device_data:
             external_devices.append(external_device_data)
     if not external_devices:
         return (1, "Problème lors de la récupération des périphériques externes dans la base de données.")
 
     # Retrieve script from database
-    script_data = config.db.get_by_id("script", config.arg.product_list_id)
+    script_data = db.get_by_id("script", product_list_id)
     if not script_data:
         return (1, "Problème lors de la récupération du script dans la base de données.")
     # Remove the "file" key if it exists because it's too large to store in the database
@@ -67,8 +84,8 @@ def init_database_and_checks(log, config: configuration.AppConfig):
     script = script_data
 
     # Retrieve parameters_group from database
-    parameters_group_id = config.arg.product_list.get("parameters_group_id")
-    parameters_group_raw = config.db.get_by_column("parameters_group", "parameters_group_id", parameters_group_id)
+    parameters_group_id = product_list.get("parameters_group_id")
+    parameters_group_raw = db.get_by_column("parameters_group", "parameters_group_id", parameters_group_id)
     parameters_group = parameters_group_raw if parameters_group_raw else []
     if not parameters_group:
         return (1, "Problème lors de la récupération des groupes de paramètres dans la base de données.")
@@ -76,49 +93,54 @@ def init_database_and_checks(log, config: configuration.AppConfig):
     # Retrieve all parameters from database
     parameters = []
     for group in parameters_group:
-        parameters_data = config.db.get_by_id("parameters", group["parameters_id"])
+        parameters_data = db.get_by_id("parameters", group["parameters_id"])
         if parameters_data:
             parameters.append(parameters_data)
     if not parameters:
         return (1, "Problème lors de la récupération des paramètres dans la base de données.")
 
-    # Retrieve and save config.json from database
+    # Retrieve config.json from database
     # config.json is used to store values used during the test
     data_str = None
     txt = ""
+    config_json_name = configuration.CONFIG_JSON_NAMES.get(str(product_list_id), configuration.CONFIG_JSON_NAME)
     for parameter in parameters:
-        config_json_name = configuration.CONFIG_JSON_NAME
         if parameter.get("name") == config_json_name:
             data_str = parameter.get("file")
             txt = f"Le fichier de config utilisé correspond à la ligne id={parameter.get('id')} de la table parameters"
-            log(txt, "blue")
     if data_str == None:
         return (1, "Le fichier config n'est pas présent dans la ddb.")
-    
-    # Write and read config.json file with proper exception handling
-    config_path = get_project_path("config.json")
-    configJson = {}
     try:
-        # Write the config file
-        with open(config_path, "wb") as f:
-            f.write(data_str)
-        
-        # Read the config file immediately after writing
-        with open(config_path, 'r', encoding='utf-8') as json_file:
-            configJson = json.load(json_file)
-    except Exception as e:
-        # Clean up the file if it was created but reading failed
-        try:
-            if os.path.exists(config_path):
-                os.remove(config_path)
-        except Exception as cleanup_error:
-            log(f"Problème lors du nettoyage du fichier config : {cleanup_error}", "yellow")
-        return 1, f"Problème lors de la création/lecture de config.json : {e}"
-
-    # Initialize configItems attributes from the config JSON mapping pins and keys from config.json in ddb
-    config.configItems.init_config_items(configJson)
+        config_json = json.loads(data_str)
+    except ValueError as e:
+        return 1, f"Problème lors de la lecture de config.json : {e}"
+    # Limits are validated and compiled once here, the steps use them as they are
+    try:
+        config_items = configuration.ConfigItems.from_json(config_json)
+    except ValueError as e:
+        return 1, f"config.json invalide : {e}"
+
+    return 0, {
+        "operator_id": operator.id,
+        "product_list": product_list,
+        "config_file": data_str,
+        "config_items": config_items,
+        "config_txt": txt,
+        # Product context used for the test. It is identical for a whole OF, so it is stored once in the snapshot
+        # table and the DUT only keeps its hash (read back with config.get_data_used_for_test)
+        "data": {
+            "operator": operator.to_dict() if hasattr(operator, 'to_dict') else vars(operator),
+            "product_list": product_list,           # already a dictionary
+            "bench_composition": bench_composition,  # already a list of dictionaries
+            "external_devices": external_devices,   # already a list of dictionaries
+            "script": script,                       # already a dictionary
+            "parameters_group": parameters_group,   # already a list of dictionaries
+            "parameters": parameters,               # already a list of dictionaries
+        },
+    }
 
-    # Create device_under_test
+def create_device_under_test(config: configuration.AppConfig, db, operator_id):
+    """Insert the device_under_test record and return its id."""
     device_under_test_data = {
         "operator_id": operator_id,
         "product_id": config.arg.product_list_id,
@@ -131,29 +153,106 @@ def init_database_and_checks(log, config: configuration.AppConfig):
         "failure_label": "",
         "name": config.arg.name
     }
-    config.device_under_test_id = config.db.create("device_under_test", device_under_test_data)
+    return db.create("device_under_test", device_under_test_data)
 
-    log(f"Device Under Test créé avec l'ID {config.device_under_test_id}.", "purple")
+def prepare_next(config: configuration.AppConfig, db):
+    """Pipelined mode: load the context and pre-create the record of the next DUT (run by config.preparer while
+    the current DUT finishes). Return None if the context cannot be loaded, s01 then reports the error itself."""
+    status, context = load_test_context(config, db)
+    if status != 0:
+        return None
+    context["device_under_test_id"] = create_device_under_test(config, db, context["operator_id"])
+    return context
 
+def write_config_file(log, context):
+    """Write config.json (deleted by fin_du_test) from the context of the DUT."""
+    config_path = get_project_path("config.json")
+    try:
+        with open(config_path, "wb") as f:
+            f.write(context["config_file"])
+    except Exception as e:
+        # Clean up the file if it was created but writing failed
+        try:
+            if os.path.exists(config_path):
+                os.remove(config_path)
+        except Exception as cleanup_error:
+            log(f"Problème lors du nettoyage du fichier config : {cleanup_error}", "yellow")
+        return 1, f"Problème lors de la création de config.json : {e}"
+    return 0, None
+
+def resume_device_under_test(log, config: configuration.AppConfig, session):
+    """Retest: reuse the device_under_test record and the context of the previous attempt (see retest.py)."""
+    context = session.context
+    config.arg.product_list = context["product_list"]
+    status, message = write_config_file(log, context)
+    if status != 0:
+        return status, message
+    config.configItems = context["config_items"]
+    config.test_context = context
+    config.device_under_test_id = session.device_under_test_id
+    log(f"Retest du Device Under Test {config.device_under_test_id} (tentative {session.attempt + 1}).", "purple")
     step_name_id = config.db.create("step_name",
         {"device_under_test_id": config.device_under_test_id, "step_name": os.path.splitext(os.path.basename(__file__))[0]}
     )
+    config.save_value(step_name_id, "TENTATIVE", str(session.attempt + 1))
+    return 0, step_name_id
 
-    # Create the data dictionary to be inserted into skvp_json
-    data = {
-        "device_under_test_id": config.device_under_test_id,
-        "operator": operator.to_dict() if hasattr(operator, 'to_dict') else vars(operator),
-        "product_list": config.arg.product_list,  # already a dictionary
-        "bench_composition": bench_composition,  # already a list of dictionaries
-        "external_devices": external_devices,   # already a list of dictionaries
-        "script": script,                       # already a dictionary
-        "parameters_group": parameters_group,   # already a list of dictionaries
-        "parameters": parameters,               # already a list of dictionaries
-    }
+def init_database_and_checks(log, config: configuration.AppConfig):
+    # Ensure db is initialized
+    if not hasattr(config, "db") or config.db is None:
+        return 1, "config.db n'est pas initialisé."
+    if config.resuming is not None:
+        return resume_device_under_test(log, config, config.resuming)
+    # Checks that all attributes of config.arg are not empty
+    for field, value in vars(config.arg).items():
+        if value is None:
+            return 1, f"Pas de valeur sur {field}"
+
+    # Check operator format
+    if not isinstance(config.arg.operator, str) or len(config.arg.operator.split()) < 2:
+        return (1, "Le champ 'operator' doit contenir au moins un prénom et un nom.")
+
+    # Context prepared during the end of the previous DUT (pipelined mode) or preloaded (start, product switch),
+    # loaded now otherwise
+    context = config.preparer.take(config.preparation_key())
+    if context is not None:
+        log(f"Contexte préparé pendant le DUT précédent ({config.preparer.duration:.2f}s).", "blue")
+    else:
+        context = config.take_product_context(config.arg.product_list_id)
+    if context is None:
+        if config.preparer.error is not None:
+            log(f"La préparation du DUT a échoué, chargement du contexte : {config.preparer.error}", "yellow")
+            config.preparer.error = None
+        status, context = load_test_context(config, config.db)
+        if status != 0:
+            return status, context
+    config.arg.product_list = context["product_list"]
+    log(context["config_txt"], "blue")
+
+    status, message = write_config_file(log, context)
+    if status != 0:
+        return status, message
+
+    # configItems built from the config JSON mapping pins and keys from config.json in ddb
+    config.configItems = context["config_items"]
+
+    # Create device_under_test, or start the pre-created one now with the serial number of this board
+    if "device_under_test_id" in context:
+        config.device_under_test_id = context["device_under_test_id"]
+        config.db.update_by_id("device_under_test", config.device_under_test_id, {"date": datetime.now(), "sn": config.arg.article})
+    else:
+        config.device_under_test_id = create_device_under_test(config, config.db, context["operator_id"])
+    config.test_context = context  # Kept for a retest of this DUT
+
+    log(f"Device Under Test créé avec l'ID {config.device_under_test_id}.", "purple")
+
+    step_name_id = config.db.create("step_name",
+        {"device_under_test_id": config.device_under_test_id, "step_name": os.path.splitext(os.path.basename(__file__))[0]}
+    )
 
     config.save_value(step_name_id, "VERSION", VERSION)
-    config.save_value(step_name_id, "data_used_for_test", json.dumps(data, indent=4, ensure_ascii=False, default=str))
-    config.save_value(step_name_id, "id_fichier_config", txt)
+    config.save_value(step_name_id, "data_used_for_test", config.save_snapshot(context["data"]))
+    config.save_value(step_name_id, "id_fichier_config", context["config_txt"])
 
     return 0, step_name_id
 
@@ -175,10 +274,12 @@ def init_multimeter_current(log, config: configuration.AppConfig):
             multimeter.send_command("RATE F\n")
         else:
             return 1, "Impossible de se connecter au multimètre MP730424."
+    except TestCancelled:
+        raise
     except Exception as e:
         return 1, f"Problème lors de l'initialisation du multimètre : {e}"
     # At this point, multimeter_current is good so we put it in the global config
-    config.multimeter_current = multimeter
+    config.multimeter_current = config.register_instrument(multimeter, "multimeter", ("send_command", "meas"))
     return 0, "Multimètre initialisé avec succès."
 
 def init_alimentation(log, config: configuration.AppConfig):
@@ -196,15 +297,22 @@ def init_alimentation(log, config: configuration.AppConfig):
             alim.set_output(1, False)
             alim.set_output(2, False)
             alim.set_tracking_mode(0)
-            alim.set_voltage(2, 12.00)
-            alim.set_current(2, 0.5)
-            alim.set_output(2, True)
+            alim.set_voltage(POWER_CHANNEL, 12.00)
+            alim.set_current(POWER_CHANNEL, 0.5)
+            alim.set_output(POWER_CHANNEL, True)
         else:
             return 1, "Impossible de se connecter à l'alimentation RSD3305P."
+    except TestCancelled:
+        raise
     except Exception as e:
         return 1, f"Problème lors de l'initialisation de l'alimentation : {e}"
     # At this point, alim is good so we put it in the global config
-    config.alim = alim
+    config.alim = config.register_instrument(alim, "alim", ("send_command", "set_output", "set_voltage", "set_current"))
+    if config.arg.power_sequencing:
+        if not config.configItems.power_settings:
+            log(f"{configuration.ConfigItems.power_key} absent de config.json, suivi de l'alimentation du DUT désactivé.", "yellow")
+        elif config.start_power_sequencer(channel=POWER_CHANNEL, **config.configItems.power_settings):
+            log("Suivi de l'alimentation du DUT démarré.", "blue")
     return 0, "Alimentation initialisée avec succès."
 
 def init_patch_easy_flow(log, config: configuration.AppConfig):
@@ -215,13 +323,17 @@ def init_patch_easy_flow(log, config: configuration.AppConfig):
         return 1, "L'alimentation n'est pas initialisée ou connectée."
     try:
         config.serial_patch_easy_flow = configuration.SerialPatchEasyFlow()
+        config.command_timeouts.attach(config.serial_patch_easy_flow, "patch")  # Identification included
         if configuration.HASH_GIT == "DEBUG":
             log("En mode DEBUG, il faut bien penser à changer le port.", "cyan")
             port = "COM28" # PC TGE
         else:
             port = config.configItems.serial_patch_easy_flow.port
         config.serial_patch_easy_flow.open_with_port(port)
+        config.register_instrument(config.serial_patch_easy_flow, "patch")
         log(f"Patch easy flow ouvert sur : {config.serial_patch_easy_flow.port}", "blue")
+    except TestCancelled:
+        raise
     except Exception as e:
         return 1, f"Problème lors de l'initialisation du patch easy flow : {e}"
     return 0, "Patch easy flow initialisée avec succès."
@@ -230,6 +342,7 @@ def init_target_capsys(log, config: configuration.AppConfig):
     config.serial_target_capsys = None
     log("Initialisation de la target Capsys...", "cyan")
     config.serial_target_capsys = configuration.SerialTargetCapsys()
+    config.command_timeouts.attach(config.serial_target_capsys, "target")  # Identification included
     if configuration.HASH_GIT == "DEBUG":
         log("En mode DEBUG, il faut bien penser à changer le port.", "cyan")
         port = "COM23" # PC TGE
@@ -237,7 +350,12 @@ def init_target_capsys(log, config: configuration.AppConfig):
         port = config.configItems.serial_target_capsys.port
     config.serial_target_capsys.open_with_port(port)
     log(f"Target Capsys ouvert sur : {config.serial_target_capsys.port}", "blue")
-    config.serial_target_capsys.send_command("set emetteur off\r", expected_response="ok", timeout=2)
+    # New connection: the state of the target is unknown until this first command
+    config.target_state.invalidate(config.serial_target_capsys)
+    config.target_state.apply(config.serial_target_capsys, expected_response="ok", timeout=2, emetteur=False)
+    # Registered once opened: exchanges done while opening are neither traced nor recorded, so that a replay
+    # with already opened instruments sees the same sequence
+    config.register_instrument(config.serial_target_capsys, "target")
     return 0, "Target Capsys initialisée avec succès."
 
 def run_step(log, config: configuration.AppConfig):
@@ -256,6 +374,7 @@ def run_step(log, config: configuration.AppConfig):
         multimeter_is_open = False
     if not multimeter_is_open:
         status, message = -1, "Erreur inconnue lors de l'initialisation du multimètre courant."
+        config.metrics.instrument_connection("multimeter")
         status, message = init_multimeter_current(log, config)
         log(message, "blue")
         if status != 0:
@@ -274,6 +393,7 @@ def run_step(log, config: configuration.AppConfig):
         alim_is_open = False
     if not alim_is_open:
         status, message = -1, "Erreur inconnue lors de l'initialisation de l'alimentation."
+        config.metrics.instrument_connection("alim")
         status, message = init_alimentation(log, config)
         log(message, "blue")
         if status != 0:
@@ -292,6 +412,7 @@ def run_step(log, config: configuration.AppConfig):
         target_capsys_is_open = False
     if not target_capsys_is_open:
         status, message = -1, "Erreur inconnue lors de l'initialisation de la target Capsys."
+        config.metrics.instrument_connection("target")
         status, message = init_target_capsys(log, config)
         log(message, "blue")
         if status != 0:
@@ -307,6 +428,7 @@ def run_step(log, config: configuration.AppConfig):
     except (AttributeError, TypeError):
         patch_is_open = False
     if not patch_is_open:
+        config.metrics.instrument_connection("patch")
         status, message = init_patch_easy_flow(log, config)
         log(message, "blue")
         if status != 0:
@@ -330,7 +452,29 @@ def run_step(log, config: configuration.AppConfig):
     if config.serial_patch_easy_flow is None:
         return_msg["infos"].append(f"{step_name} : le patch n'est pas initialisé.")
         return 1, return_msg
-    log(f"Envoie de la commande \"test power on\" : {config.serial_patch_easy_flow.send_command('test power on\r', expected_response='ok', timeout=15)}", "blue")
+    # Restarted, output switched back on, after a short-circuit on the previous DUT
+    power = config.power
+    if power is not None and not power.running:
+        if power.fault:
+            log(f"Remise sous tension de la voie {POWER_CHANNEL} après : {power.fault}", "yellow")
+        power.restart()
+    if power is not None:
+        power.expect_on()
+    response = config.serial_patch_easy_flow.send_command("test power on\r", expected_response="ok", timeout=POWER_ON_TIMEOUT)
+    log(f"Envoie de la commande \"test power on\" : {response}", "blue")
+    if power is not None:
+        try:
+            settle_time = power.wait_ready(POWER_ON_TIMEOUT, config.cancel_token.check)
+        except (PowerFault, TimeoutError) as e:
+            return_msg["infos"].append(str(e))
+            return 1, return_msg
+        log(f"DUT prêt en {settle_time * 1000:.0f} ms (appel de courant {power.peak_current * 1000:.1f} mA, régime établi {power.current * 1000:.1f} mA).", "blue")
+        config.save_value(step_name_id, "TEMPS_ETABLISSEMENT_DUT", settle_time, "s")
+        config.save_value(step_name_id, "COURANT_APPEL_DUT", power.peak_current, "A")
+    # Current profile of the powered patch, until fin_du_test
+    config.current_profile.mark_sub("test power on")
+    if config.start_current_profile():
+        log("Échantillonnage du courant démarré.", "blue")
 
 
     return_msg["infos"].append(f"OK")
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import time, sys, os
+import sys, os
 if __name__ == "__main__":
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
     if BASE_DIR not in sys.path:
@@ -8,6 +8,10 @@ if __name__ == "__main__":
 import configuration  # Custom
 from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
 
+# Does not depend on the other measurement steps, can be reordered in adaptive mode
+ORDER_INDEPENDENT = True
+TIME_BUDGET = (10, 30)  # (soft, hard) in seconds, see step_budget.py
+
 def get_info():
     return "Cette étape teste les seuils de fonctionnement du radar."
 
@@ -36,17 +40,25 @@ def run_step(log, config: configuration.AppConfig):
     units_map = ["dB", "dB", "dB"]
     timeout = 2
 
+    # The emitter is off during this step (nothing is sent if it already is): its samples make the emitter-off
+    # window of the current profile on which s04 judges the consumption
+    if config.serial_target_capsys is not None:
+        for command, response in config.target_state.apply(config.serial_target_capsys, expected_response="ok", timeout=2, emetteur=False):
+            log(f"Envoie de la commande \"{command}\" : {response}", "blue")
+    config.current_profile.mark_sub("emetteur off")
+
     # Retry logic for the command
     for attempt in range(1, config.max_retries + 1):
         log(f"Exécution de l'étape test des seuils (tentative {attempt}/{config.max_retries})", "yellow")
-        time.sleep(2)
+        config.sleep(2)
         status, msg = config.run_meas_on_patch(
             log, step_name_id, min, max, cmd, expected_prefix, save_prefix, units_map, timeout, replace_map
         )
         if status != 0:
             if attempt < config.max_retries:
                 log(f"Réessaie de \"{cmd}\"... (tentative {attempt + 1}/{config.max_retries})", "yellow")
-                time.sleep(1)
+                config.metrics.retry(cmd)
+                config.sleep(1)
                 continue
             else:
                 if isinstance(msg, list):
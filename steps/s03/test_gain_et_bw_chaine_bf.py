@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import time
 import sys
 import os
 if __name__ == "__main__":
@@ -10,9 +9,17 @@ if __name__ == "__main__":
 import configuration  # Custom
 from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
 
+# Does not depend on the other measurement steps, can be reordered in adaptive mode
+ORDER_INDEPENDENT = True
+TIME_BUDGET = (20, 60)  # (soft, hard) in seconds, see step_budget.py
+
 def get_info():
     return "Cette étape teste TODO."
 
+def log_target_commands(log, sent):
+    for command, response in sent:
+        log(f"Envoie de la commande \"{command}\" : {response}", "blue")
+
 def run_step(log, config: configuration.AppConfig):
     step_name = os.path.splitext(os.path.basename(__file__))[0]
     return_msg = {"step_name": step_name, "infos": []}
@@ -31,21 +38,13 @@ def run_step(log, config: configuration.AppConfig):
         return_msg["infos"].append(f"config.serial_target_capsys n'est pas initialisé.")
         return 1, return_msg
 
-    cmd_map_target_capsys = ["set emetteur on\r", "set txmod 225\r", "set txmod 450\r", "set txmod 810\r"]
+    txmod_map = [225, 450, 810]
     expected_prefix_target_capsys = "--> ok"
 
 
     # Paramètres spécifiques seuils
-    min_map = config.configItems.bf.min_map
-    min_map_sub1 = min_map[0:2]
-    min_map_sub2 = min_map[2:4]
-    min_map_sub3 = min_map[4:6]
-    min_map_groups = [min_map_sub1, min_map_sub2, min_map_sub3]
-    max_map = config.configItems.bf.max_map
-    max_map_sub1 = max_map[0:2]
-    max_map_sub2 = max_map[2:4]
-    max_map_sub3 = max_map[4:6]
-    max_map_groups = [max_map_sub1, max_map_sub2, max_map_sub3]
+    # (min, max) limits of each frequency, grouped when config.json is loaded
+    limit_groups = config.configItems.bf.groups
     save_prefix_map_sub1 = ["TEST_BF_FREQ_1_Id", "TEST_BF_FREQ_1_AMP_dB"]
     save_prefix_map_sub2 = ["TEST_BF_FREQ_2_Id", "TEST_BF_FREQ_2_AMP_dB"]
     save_prefix_map_sub3 = ["TEST_BF_FREQ_3_Id", "TEST_BF_FREQ_3_AMP_dB"]
@@ -61,16 +60,22 @@ def run_step(log, config: configuration.AppConfig):
         all_ok = 1
         log(f"Exécution de l'étape {step_name} (tentative {attempt}/{config.max_retries})", "yellow")
 
-        log(f"Envoie de la commande \"{cmd_map_target_capsys[0]}\" : {config.serial_target_capsys.send_command(cmd_map_target_capsys[0], expected_prefix_target_capsys, timeout=5)}", "blue")
+        # Only the commands changing the state of the target are sent (all of them again after a failed attempt)
+        log_target_commands(log, config.target_state.apply(config.serial_target_capsys, expected_prefix_target_capsys, timeout=5, emetteur=True))
+        config.current_profile.mark_sub("emetteur on")
         for i in range(3):
-            log(f"Envoie de la commande \"{cmd_map_target_capsys[i+1]}\" : {config.serial_target_capsys.send_command(cmd_map_target_capsys[i+1], expected_prefix_target_capsys, timeout=5)}", "blue")
+            log_target_commands(log, config.target_state.apply(config.serial_target_capsys, expected_prefix_target_capsys, timeout=5, txmod=txmod_map[i]))
+            config.current_profile.mark_sub(f"txmod {txmod_map[i]}")
             status, msg = config.run_meas_on_patch(
-                log, step_name_id, min_map_groups[i], max_map_groups[i], cmd, expected_prefix, save_prefix_map_groups[i], timeout=timeout, replace_map=replace_map
+                log, step_name_id, limit_groups[i][0], limit_groups[i][1], cmd, expected_prefix, save_prefix_map_groups[i], timeout=timeout, replace_map=replace_map
             )
             if status != 0:
                 if attempt < config.max_retries:
                     log(f"Réessaie de \"{cmd}\"... (tentative {attempt + 1}/{config.max_retries})", "yellow")
-                    time.sleep(1)
+                    config.metrics.retry(cmd)
+                    # The target may have reset: the emitter and txmod commands are sent again by the next attempt
+                    config.target_state.invalidate(config.serial_target_capsys)
+                    config.sleep(1)
                     break
                 else:
                     return_msg["infos"].append(f"{i} : {msg}")
@@ -79,7 +84,8 @@ def run_step(log, config: configuration.AppConfig):
                 all_ok = 0
         if all_ok == 0:
             return_msg["infos"].append(f"OK")
-            log(f"Envoie de la commande \"set emetteur off\" : {config.serial_target_capsys.send_command('set emetteur off\r', expected_response='ok', timeout=2)}", "blue")
+            log_target_commands(log, config.target_state.apply(config.serial_target_capsys, expected_response="ok", timeout=2, emetteur=False))
+            config.current_profile.mark_sub("emetteur off")
             return 0, return_msg
 
     
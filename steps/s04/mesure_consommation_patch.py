@@ -8,6 +8,14 @@ if __name__ == "__main__":
 import configuration  # Custom
 from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
 
+# Does not depend on the other measurement steps (the emitter is switched off here), can be reordered in adaptive mode
+ORDER_INDEPENDENT = True
+TIME_BUDGET = (5, 20)  # (soft, hard) in seconds, see step_budget.py
+# Sub-phase of the current profile on which the consumption limit is evaluated (s02 and the end of s03), and minimum
+# number of samples. Without enough samples (no background profile, s04 run first), the current is measured here.
+WINDOW_PHASE = "emetteur off"
+MIN_WINDOW_SAMPLES = 5
+
 def get_info():
     return "Cette étape mesure la consommation du patch."
 
@@ -35,10 +43,20 @@ def run_step(log, config: configuration.AppConfig):
     current_max = config.configItems.consumption.maximum
     name = config.configItems.consumption.key
     unit = "A"
-    current = float(config.multimeter_current.meas())
-    log(f"Courant mesuré : {current}{unit}, min={current_min}{unit}, max={current_max}{unit}", "blue")
+    # The limits are calibrated for a reading with the emitter off, as left by s03: nothing is sent if it already is
+    if config.serial_target_capsys is not None:
+        for command, response in config.target_state.apply(config.serial_target_capsys, expected_response="ok", timeout=2, emetteur=False):
+            log(f"Envoie de la commande \"{command}\" : {response}", "blue")
+    config.current_profile.mark_sub(WINDOW_PHASE)
+    window = config.current_profile.window(WINDOW_PHASE)
+    if len(window) >= MIN_WINDOW_SAMPLES:
+        current = sum(window) / len(window)
+        log(f"Courant moyen émetteur coupé ({len(window)} échantillons) : {current}{unit}, min={current_min}{unit}, max={current_max}{unit}", "blue")
+    else:
+        current = float(config.multimeter_current.meas())
+        log(f"Courant mesuré : {current}{unit}, min={current_min}{unit}, max={current_max}{unit}", "blue")
     id = config.save_value(step_name_id, name, current, unit, min_value=current_min, max_value=current_max)
-    if current > float(current_max) or current < float(current_min):
+    if current > current_max or current < current_min:
         return_msg["infos"].append(f"Courant mesuré {current}{unit} hors des limites ({current_min}{unit} - {current_max}{unit}).")
         return 1, return_msg
     config.db.update_by_id("skvp_float", id, {"valid": 1})
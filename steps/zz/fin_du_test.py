@@ -9,6 +9,8 @@ import configuration  # Custom
 from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
 from configuration import get_project_path
 
+TIME_BUDGET = (10, 30)  # (soft, hard) in seconds, only reported: the cleanup is never cancelled
+
 def get_info():
     return "Cette étape effectue le nettoyage et la fermeture des ressources en fin de test."
 
@@ -20,9 +22,17 @@ def run_step(log, config: configuration.AppConfig):
         return_msg["infos"].append("Erreur : config.db n'est pas initialisé.")
         return 1, return_msg
     # We always save the name of the step in the db
-    config.db.create("step_name", {"device_under_test_id": config.device_under_test_id, "step_name": step_name})
+    step_name_id = config.db.create("step_name", {"device_under_test_id": config.device_under_test_id, "step_name": step_name})
     success = 0
 
+    # The timing spans of the test, this step included, are attached to this row by finalize_device_under_test
+    config.final_step_name_id = step_name_id
+
+    # Steps of the DUT that exceeded their time budget (see step_budget.py)
+    if config.step_overruns:
+        config.save_value(step_name_id, "DEPASSEMENTS_BUDGET", dict(config.step_overruns))
+        log(f"Budget de temps dépassé : {', '.join(config.step_overruns)}.", "yellow")
+
     # delete config.json file
     config_file_path = get_project_path("config.json")
     if os.path.exists(config_file_path):
@@ -32,14 +42,35 @@ def run_step(log, config: configuration.AppConfig):
         log("Problème lors de la suppression du fichier config.json.", "yellow")
         success = 2
 
+    # Per-phase consumption and current samples of the cycle
+    try:
+        config.save_current_profile(step_name_id)
+    except Exception as e:
+        log(f"Erreur lors de l'enregistrement du profil de courant : {e}", "yellow")
+        success = 2
+
     if config.serial_target_capsys and config.serial_target_capsys.ser and config.serial_target_capsys.ser.is_open:
-        log(f"Envoie de la commande \"set emetteur off\" : {config.serial_target_capsys.send_command('set emetteur off\r', expected_response='ok', timeout=2)}", "blue")
+        # Not sent if s03 has already switched the emitter off
+        for command, response in config.target_state.apply(config.serial_target_capsys, expected_response="ok", timeout=2, emetteur=False):
+            log(f"Envoie de la commande \"{command}\" : {response}", "blue")
         config.serial_target_capsys.close()
         config.serial_target_capsys = None
+        config.target_state.invalidate()
         log("Port série de la cible fermé.", "blue")
 
     if config.serial_patch_easy_flow and config.serial_patch_easy_flow.ser and config.serial_patch_easy_flow.ser.is_open:
+        power = config.power if config.power is not None and config.power.running else None
+        if power is not None:
+            power.expect_off()
         log(f"Envoie de la commande \"test power off\" : {config.serial_patch_easy_flow.send_command('test power off\r', expected_response='ok', timeout=2)}", "blue")
+        if power is not None:
+            try:
+                off_time = power.wait_off(2)
+                log(f"DUT éteint en {off_time * 1000:.0f} ms.", "blue")
+                config.save_value(step_name_id, "TEMPS_EXTINCTION_DUT", off_time, "s")
+            except (RuntimeError, TimeoutError) as e:
+                log(str(e), "yellow")
+                success = 2
     else:
         log("Le port série du patch n'avait pas été initialisé.", "yellow")
         success = 2
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+État de la cible
+Modèle de l'état de la cible Capsys (émetteur, txmod) : seules les commandes qui changent cet état sont envoyées.
+Le modèle est oublié à chaque (re)connexion et après toute réponse inattendue.
+"""
+
+from typing import Optional
+
+# Commands of each state variable, and the order in which a transition is applied (txmod needs the emitter on)
+COMMANDS = {
+    "emetteur": lambda value: f"set emetteur {'on' if value else 'off'}\r",
+    "txmod": lambda value: f"set txmod {value}\r",
+}
+ORDER = ("emetteur", "txmod")
+
+
+class TargetState:
+    """Known state of the target. A variable missing from state is unknown: its command is always sent."""
+    def __init__(self):
+        self.target = None
+        self.state = {}
+        self.sent = 0
+        self.elided = 0
+
+    def invalidate(self, target=None):
+        """Forget the state (reconnection, error). target is the instrument the next commands go to."""
+        self.target = target
+        self.state = {}
+
+    def apply(self, target, expected_response: str = "ok", timeout: float = 5, **wanted):
+        """Bring the target to the wanted state (e.g. emetteur=True, txmod=225) with the commands that change it.
+
+        Return the [(command, response)] actually sent, [] if the target was already in that state.
+        An unexpected response or an error makes the variable unknown again.
+        """
+        if target is not self.target:
+            self.invalidate(target)
+        sent = []
+        for name in sorted(wanted, key=ORDER.index):
+            value = wanted[name]
+            if name in self.state and self.state[name] == value:
+                self.elided += 1
+                continue
+            command = COMMANDS[name](value)
+            self.state.pop(name, None)  # Unknown until the target acknowledges (an exception leaves it unknown)
+            response = target.send_command(command, expected_response, timeout=timeout)
+            self.sent += 1
+            sent.append((command.strip(), response))
+            if response and expected_response in str(response):
+                self.state[name] = value
+        return sent
+
+    def get(self, name: str) -> Optional[object]:
+        """Known value of a state variable, None if unknown."""
+        return self.state.get(name)
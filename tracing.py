@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Traces de temps
+Spans (step, instrument, db, sleep) enregistrés dans un buffer circulaire, résumés sur le DUT
+et exportables au format Chrome trace (chrome://tracing, Perfetto).
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class Span:
+    """One timed operation. Times are time.perf_counter() values."""
+    __slots__ = ("kind", "name", "start", "end", "tid", "attrs")
+
+    def __init__(self, kind, name, start, end, tid, attrs):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end = end
+        self.tid = tid
+        self.attrs = attrs
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class _ActiveSpan:
+    """Context manager returned by Tracer.span when tracing is enabled."""
+    __slots__ = ("tracer", "kind", "name", "attrs", "start")
+
+    def __init__(self, tracer, kind, name, attrs):
+        self.tracer = tracer
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = str(exc)
+        self.tracer.record(self.kind, self.name, self.start, time.perf_counter(), self.attrs)
+        return False
+
+
+class _NullSpan:
+    """Shared no-op context manager returned when tracing is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Lightweight span recorder. When disabled, span() returns a shared no-op object."""
+    def __init__(self, capacity: int = 4096, enabled: bool = False):
+        self.enabled = enabled
+        self.spans = deque(maxlen=capacity)
+        self.listeners = []  # Callables (kind, name, duration) notified of every instrumented call, even when disabled
+        self.origin = time.perf_counter()
+
+    def span(self, kind: str, name: str, **attrs):
+        """Return a context manager timing the enclosed block as a span of the given kind."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _ActiveSpan(self, kind, name, attrs)
+
+    def record(self, kind, name, start, end, attrs=None):
+        # deque.append is atomic, spans can be recorded from any thread
+        self.spans.append(Span(kind, name, start, end, threading.get_ident(), attrs or {}))
+
+    def clear(self):
+        self.spans.clear()
+        self.origin = time.perf_counter()
+
+    def instrument(self, obj, kind: str, name: str, methods=("send_command",)):
+        """Wrap the given methods of an instance (instrument, database manager) so that each call is recorded as a span
+        and reported to the listeners."""
+        if obj is None or getattr(obj, "_traced_methods", None):
+            return obj
+        for method_name in methods:
+            method = getattr(obj, method_name, None)
+            if method is None:
+                continue
+            setattr(obj, method_name, self._wrap(method, kind, f"{name}.{method_name}"))
+        obj._traced_methods = tuple(methods)
+        return obj
+
+    def _wrap(self, method, kind, span_name):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if not self.enabled and not self.listeners:
+                return method(*args, **kwargs)
+            attrs = {"arg": repr(args[0])[:80]} if args else {}
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                attrs["error"] = str(e)
+                raise
+            finally:
+                end = time.perf_counter()
+                if self.enabled:
+                    self.record(kind, span_name, start, end, attrs)
+                for listener in self.listeners:
+                    listener(kind, span_name, end - start)
+        return wrapper
+
+    def summary(self):
+        """Return a JSON-serialisable summary: duration of each step and per-kind/per-name totals."""
+        steps = {}
+        totals = {}
+        calls = {}
+        for span in list(self.spans):
+            if span.kind == "step":
+                steps[span.name] = round(steps.get(span.name, 0.0) + span.duration, 6)
+                continue
+            totals[span.kind] = totals.get(span.kind, 0.0) + span.duration
+            stats = calls.setdefault(span.name, {"kind": span.kind, "count": 0, "total_s": 0.0, "max_s": 0.0})
+            stats["count"] += 1
+            stats["total_s"] += span.duration
+            stats["max_s"] = max(stats["max_s"], span.duration)
+        for stats in calls.values():
+            stats["total_s"] = round(stats["total_s"], 6)
+            stats["max_s"] = round(stats["max_s"], 6)
+        return {
+            "steps_s": steps,
+            "totals_s": {kind: round(total, 6) for kind, total in totals.items()},
+            "calls": calls,
+        }
+
+    def to_chrome_trace(self, metadata: Optional[dict] = None):
+        """Return the spans as a Chrome trace event dictionary (complete 'X' events, microseconds)."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6, 1),
+                "dur": round(span.duration * 1e6, 1),
+                "pid": pid,
+                "tid": span.tid,
+                "args": span.attrs,
+            }
+            for span in list(self.spans)
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": metadata or {}}
+
+    def export_chrome_trace(self, path: str, metadata: Optional[dict] = None):
+        """Write the spans to path in Chrome trace format and return the path."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(metadata), f, ensure_ascii=False, default=str)
+        return path